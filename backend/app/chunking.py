@@ -0,0 +1,261 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union
+
+from .settings import Settings
+
+_NON_SPACE = re.compile(r'\S')
+_HEADING = re.compile(r'(#{1,6})[ \t]+(.*?)[ \t#]*$')
+_FENCE = re.compile(r'(```|~~~)')
+_SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+')
+
+
+@dataclass
+class TextChunk:
+    text: str
+    start: int
+    end: int
+    headings: List[str] = field(default_factory=list)
+
+
+def _normalized(segments: Iterable[str]) -> Iterator[str]:
+    # Normalizes CRLF line endings even when the pair is split across two segments.
+    pending_cr = False
+    for segment in segments:
+        if not segment:
+            continue
+        if pending_cr:
+            segment = '\r' + segment
+        pending_cr = segment.endswith('\r')
+        if pending_cr:
+            segment = segment[:-1]
+        yield segment.replace('\r\n', '\n')
+    if pending_cr:
+        yield '\r'
+
+
+def _stripped(text: str, start: int, end: int) -> Tuple[int, int]:
+    piece = text[start:end]
+    left = len(piece) - len(piece.lstrip())
+    right = len(piece) - len(piece.rstrip())
+    return start + left, end - right
+
+
+class WindowChunker:
+    def __init__(self, chunk_size: int, chunk_overlap: int) -> None:
+        self.chunk_size = chunk_size
+        self.overlap = min(chunk_overlap, chunk_size - 1 if chunk_size > 1 else 0)
+
+    def chunks(self, segments: Iterable[str]) -> Iterator[TextChunk]:
+        chunk_size = self.chunk_size
+        step = max(1, chunk_size - self.overlap)
+        buffer = ''
+        base = 0
+        start = 0
+        for segment in _normalized(segments):
+            if not buffer:
+                stripped = segment.lstrip()
+                base += len(segment) - len(stripped)
+                segment = stripped
+            base += start
+            buffer = buffer[start:] + segment
+            start = 0
+            # Only emit a window once non-whitespace text exists beyond it; otherwise it may be the last one.
+            while len(buffer) - start > chunk_size and _NON_SPACE.search(buffer, start + chunk_size):
+                chunk = self._chunk(buffer, base, start, start + chunk_size)
+                if chunk is not None:
+                    yield chunk
+                start += step
+        end = len(buffer.rstrip())
+        while start < end:
+            chunk = self._chunk(buffer, base, start, min(start + chunk_size, end))
+            if chunk is not None:
+                yield chunk
+            if start + chunk_size >= end:
+                break
+            start += step
+
+    @staticmethod
+    def _chunk(buffer: str, base: int, start: int, end: int) -> Optional[TextChunk]:
+        start, end = _stripped(buffer, start, end)
+        if start >= end:
+            return None
+        return TextChunk(text=buffer[start:end], start=base + start, end=base + end)
+
+
+@dataclass
+class _Unit:
+    start: int
+    end: int
+    paragraph: bool = False
+    heading: bool = False
+
+
+class StructuredChunker:
+    def __init__(self, chunk_size: int, chunk_overlap: int) -> None:
+        self.chunk_size = max(1, chunk_size)
+        self.overlap = min(chunk_overlap, self.chunk_size - 1)
+        # Lines longer than this are cut, even before their newline arrives, so memory stays bounded.
+        self.max_line = 4 * self.chunk_size
+
+    def chunks(self, segments: Iterable[str]) -> Iterator[TextChunk]:
+        buffer = ''
+        base = 0
+        line_start = 0
+        units: List[_Unit] = []
+        headings: List[Tuple[int, str]] = []
+        state = {'paragraph': True, 'code': False, 'continued': False}
+
+        def emit(selected: List[_Unit]) -> Iterator[TextChunk]:
+            if not selected:
+                return
+            start, end = selected[0].start, max(unit.end for unit in selected)
+            yield TextChunk(
+                text=buffer[start - base:end - base],
+                start=start,
+                end=end,
+                headings=[title for _, title in headings],
+            )
+
+        def add(unit: _Unit) -> Iterator[TextChunk]:
+            nonlocal units
+            if units and unit.end - units[0].start > self.chunk_size:
+                cut = len(units)
+                if not unit.paragraph:
+                    # Prefer ending at a paragraph boundary when one falls in the back half of the chunk.
+                    for index in range(len(units) - 1, 0, -1):
+                        if units[index].paragraph and units[index].start - units[0].start >= self.chunk_size // 2:
+                            cut = index
+                            break
+                head, rest = units[:cut], units[cut:]
+                yield from emit(head)
+                if not rest:
+                    rest = self._overlap_units(head)
+                    if rest and unit.end - rest[0].start > self.chunk_size:
+                        rest = []
+                elif unit.end - rest[0].start > self.chunk_size:
+                    yield from emit(rest)
+                    rest = []
+                units = rest
+            units.append(unit)
+
+        def line_units(start: int, end: int, continued: bool) -> Iterator[_Unit]:
+            text = buffer[start - base:end - base]
+            stripped = text.strip()
+            if not continued and not state['code'] and _FENCE.match(stripped):
+                state['code'] = True
+                state['paragraph'] = True
+            elif state['code'] and _FENCE.match(stripped):
+                state['code'] = False
+                yield from self._windows(buffer, base, start, end, paragraph=False)
+                state['paragraph'] = True
+                return
+            if not stripped:
+                if not state['code']:
+                    state['paragraph'] = True
+                return
+            paragraph, state['paragraph'] = state['paragraph'] and not continued, False
+            if state['code'] or stripped.startswith('|'):
+                yield from self._windows(buffer, base, start, end, paragraph)
+                return
+            offset = start
+            for match in _SENTENCE_END.finditer(text):
+                yield from self._windows(buffer, base, offset, start + match.end(), paragraph)
+                offset = start + match.end()
+                paragraph = False
+            if offset < end:
+                yield from self._windows(buffer, base, offset, end, paragraph)
+
+        def process_line(start: int, end: int, continued: bool) -> Iterator[TextChunk]:
+            nonlocal units
+            text = buffer[start - base:end - base]
+            heading = None if continued or state['code'] else _HEADING.match(text.strip())
+            if heading is not None:
+                if any(not unit.heading for unit in units):
+                    yield from emit(units)
+                    units = []
+                for unit in self._windows(buffer, base, start, end, paragraph=True, heading=True):
+                    # A run of headings with no body between them (a table of contents) is flushed by size too.
+                    if units and unit.end - units[0].start > self.chunk_size:
+                        yield from emit(units)
+                        units = []
+                    units.append(unit)
+                level = len(heading.group(1))
+                while headings and headings[-1][0] >= level:
+                    headings.pop()
+                headings.append((level, heading.group(2)))
+                state['paragraph'] = True
+                return
+            for unit in line_units(start, end, continued):
+                yield from add(unit)
+
+        for segment in _normalized(segments):
+            buffer += segment
+            while True:
+                newline = buffer.find('\n', line_start - base)
+                line_end = newline if newline >= 0 else len(buffer)
+                if line_end - (line_start - base) > self.max_line:
+                    # Cut relative to the line start whether or not the newline has arrived, so output never
+                    # depends on where segment boundaries fall.
+                    cut = buffer.rfind(' ', line_start - base, line_start - base + self.max_line)
+                    if cut <= line_start - base:
+                        cut = line_start - base + self.max_line
+                    yield from process_line(line_start, cut + base, state['continued'])
+                    state['continued'] = True
+                    line_start = cut + base
+                    continue
+                if newline < 0:
+                    break
+                yield from process_line(line_start, newline + base, state['continued'])
+                state['continued'] = False
+                line_start = newline + base + 1
+            # Drop text that no pending unit can reference any more; halving keeps the trim amortized linear.
+            keep = min([line_start] + [unit.start for unit in units])
+            if keep - base > len(buffer) // 2:
+                buffer = buffer[keep - base:]
+                base = keep
+        if line_start - base < len(buffer):
+            yield from process_line(line_start, len(buffer) + base, state['continued'])
+        yield from emit(units)
+
+    def _overlap_units(self, emitted: List[_Unit]) -> List[_Unit]:
+        if not self.overlap:
+            return []
+        carry: List[_Unit] = []
+        end = emitted[-1].end
+        for unit in reversed(emitted):
+            if unit.heading or end - unit.start > self.overlap:
+                break
+            carry.insert(0, unit)
+        if len(carry) == len(emitted):
+            return []
+        return carry
+
+    def _windows(
+        self, buffer: str, base: int, start: int, end: int, paragraph: bool, heading: bool = False
+    ) -> Iterator[_Unit]:
+        first, last = _stripped(buffer, start - base, end - base)
+        if first >= last:
+            return
+        size = self.chunk_size
+        step = max(1, size - self.overlap)
+        position = first
+        while True:
+            stop = min(position + size, last)
+            yield _Unit(position + base, stop + base, paragraph=paragraph and position == first, heading=heading)
+            if stop >= last:
+                return
+            position += step
+
+
+Chunker = Union[StructuredChunker, WindowChunker]
+
+CHUNKERS: Dict[str, Type[Chunker]] = {
+    'structured': StructuredChunker,
+    'window': WindowChunker,
+}
+
+
+def make_chunker(settings: Settings) -> Chunker:
+    factory = CHUNKERS[settings.chunk_strategy]
+    return factory(settings.chunk_size, settings.chunk_overlap)
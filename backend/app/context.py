@@ -0,0 +1,149 @@
+import re
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+# Rough stand-in for a BPE tokenizer: short word pieces and individual punctuation marks.
+_TOKEN = re.compile(r'\w{1,4}|[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    return sum(1 for _ in _TOKEN.finditer(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ''
+    for count, match in enumerate(_TOKEN.finditer(text), start=1):
+        if count == max_tokens:
+            return text[: match.end()]
+    return text
+
+
+def _overlap(left: str, right: str, limit: int) -> int:
+    for size in range(min(len(left), len(right), limit), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+@dataclass(eq=False)
+class ContextSpan:
+    source: str
+    group: Tuple[Any, ...]
+    score: float
+    chunks: Dict[int, Any] = field(default_factory=dict)
+
+    @property
+    def first(self) -> int:
+        return min(self.chunks)
+
+    @property
+    def last(self) -> int:
+        return max(self.chunks)
+
+    def text(self, max_overlap: int) -> str:
+        merged = ''
+        for index in sorted(self.chunks):
+            piece = self.chunks[index].text.strip()
+            merged += piece[_overlap(merged, piece, max_overlap):] if merged else piece
+        return merged
+
+
+def _header(position: int, source: str) -> str:
+    return f'[Source {position}] {source}\n'
+
+
+class ContextPacker:
+    def __init__(self, max_tokens: int, max_chars: int, max_overlap: int) -> None:
+        self.max_tokens = max_tokens
+        self.max_chars = max_chars
+        self.max_overlap = max_overlap
+
+    def _cost(self, spans: List[ContextSpan]) -> Tuple[int, int]:
+        tokens = chars = 0
+        for position, span in enumerate(spans, start=1):
+            block = _header(position, span.source) + span.text(self.max_overlap)
+            tokens += estimate_tokens(block)
+            chars += len(block)
+        return tokens, chars
+
+    def _fits(self, spans: List[ContextSpan]) -> bool:
+        tokens, chars = self._cost(spans)
+        return tokens <= self.max_tokens and chars <= self.max_chars
+
+    def _adjacent(self, spans: List[ContextSpan], group: Tuple[Any, ...], index: Optional[int]) -> List[ContextSpan]:
+        if index is None:
+            return []
+        return [
+            span
+            for span in spans
+            if span.group == group and span.first - 1 <= index <= span.last + 1 and index not in span.chunks
+        ]
+
+    def pack(self, retrieved: List[Any]) -> Tuple[List[ContextSpan], List[Any]]:
+        spans: List[ContextSpan] = []
+        included: List[Any] = []
+        seen_texts = set()
+        for chunk in sorted(retrieved, key=lambda item: item.score, reverse=True):
+            text = chunk.text.strip()
+            normalized = _WHITESPACE.sub(' ', text)
+            if not text or normalized in seen_texts:
+                continue
+            source = chunk.metadata.get('source', 'unknown')
+            group = (chunk.metadata.get('tenant_id'), source)
+            index = chunk.metadata.get('chunk_index')
+            if index is None:
+                # Without a position the chunk cannot be merged with its neighbours.
+                group += (id(chunk),)
+            if any(span.group == group and text in span.text(self.max_overlap) for span in spans):
+                # Fully covered by text already in the context, e.g. the overlap of two neighbours.
+                seen_texts.add(normalized)
+                continue
+            candidate = self._place(spans, chunk, source, group, index)
+            if self._fits(candidate):
+                spans = candidate
+                included.append(chunk)
+                seen_texts.add(normalized)
+            elif not spans:
+                remaining = self.max_tokens - estimate_tokens(_header(1, source))
+                snippet = truncate_to_tokens(text, remaining)[: max(0, self.max_chars - len(_header(1, source)))]
+                if snippet:
+                    trimmed = replace(chunk, text=snippet)
+                    span = ContextSpan(source=source, group=group + (id(trimmed),), score=chunk.score)
+                    span.chunks[0] = trimmed
+                    spans = [span]
+                    included.append(trimmed)
+                    seen_texts.add(normalized)
+        return spans, included
+
+    def _place(
+        self,
+        spans: List[ContextSpan],
+        chunk: Any,
+        source: str,
+        group: Tuple[Any, ...],
+        index: Optional[int],
+    ) -> List[ContextSpan]:
+        neighbours = self._adjacent(spans, group, index)
+        if not neighbours:
+            key = index if index is not None else 0
+            return spans + [ContextSpan(source=source, group=group, score=chunk.score, chunks={key: chunk})]
+        # A chunk can bridge two spans (index - 1 and index + 1), which then collapse into one.
+        merged = ContextSpan(source=source, group=group, score=max(span.score for span in neighbours))
+        for span in neighbours:
+            merged.chunks.update(span.chunks)
+        merged.chunks[index] = chunk
+        result: List[ContextSpan] = []
+        for span in spans:
+            if span is neighbours[0]:
+                result.append(merged)
+            elif span not in neighbours:
+                result.append(span)
+        return result
+
+    def render(self, spans: List[ContextSpan]) -> str:
+        return '\n'.join(
+            _header(position, span.source) + span.text(self.max_overlap) + '\n'
+            for position, span in enumerate(spans, start=1)
+        )
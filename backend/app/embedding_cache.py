@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import metrics
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join(text.split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f'{model}\x00{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+
+def _encode(vector: Sequence[float]) -> bytes:
+    return array('f', vector).tobytes()
+
+
+def _decode(blob: bytes) -> List[float]:
+    values = array('f')
+    values.frombytes(blob)
+    return values.tolist()
+
+
+def _entry_bytes(key: str, blob: bytes) -> int:
+    return sys.getsizeof(key) + sys.getsizeof(blob)
+
+
+class EmbeddingCache:
+    def __init__(self, path: Optional[Path], max_memory_bytes: int, max_disk_bytes: int) -> None:
+        self._path = path
+        self._max_memory_bytes = max_memory_bytes
+        self._max_disk_bytes = max_disk_bytes
+        # Vectors are held packed as float32 bytes, about an eighth of the size of a list of floats.
+        self._memory: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_lock = threading.Lock()
+        self._initialised = False
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialised:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(str(self._path), timeout=30)
+        if not self._initialised:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS embeddings ('
+                'key TEXT PRIMARY KEY, vector BLOB NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed_at)')
+            connection.commit()
+            self._initialised = True
+        return connection
+
+    def _remember(self, key: str, blob: bytes) -> None:
+        if self._max_memory_bytes <= 0:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= _entry_bytes(key, previous)
+        self._memory[key] = blob
+        self._memory_bytes += _entry_bytes(key, blob)
+        while self._memory_bytes > self._max_memory_bytes:
+            evicted_key, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= _entry_bytes(evicted_key, evicted)
+
+    async def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        keys = [cache_key(model, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(keys)
+        pending: Dict[str, List[int]] = {}
+        memory_hits, disk_hits = self.memory_hits, self.disk_hits
+        for index, key in enumerate(keys):
+            blob = self._memory.get(key)
+            if blob is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                results[index] = _decode(blob)
+            else:
+                pending.setdefault(key, []).append(index)
+        if pending and self._path is not None:
+            found = await asyncio.to_thread(self._disk_get, list(pending))
+            for key, blob in found.items():
+                self._remember(key, blob)
+                vector = _decode(blob)
+                for index in pending.pop(key):
+                    self.disk_hits += 1
+                    results[index] = vector
+        missed = sum(len(indexes) for indexes in pending.values())
+        self.misses += missed
+        lookups = metrics.CACHE_LOOKUPS
+        lookups.labels('embedding', 'memory_hit').inc(self.memory_hits - memory_hits)
+        lookups.labels('embedding', 'disk_hit').inc(self.disk_hits - disk_hits)
+        lookups.labels('embedding', 'miss').inc(missed)
+        return results
+
+    async def put_many(self, model: str, items: Iterable[Tuple[str, List[float]]]) -> None:
+        entries = [(cache_key(model, text), _encode(vector)) for text, vector in items]
+        if not entries:
+            return
+        for key, blob in entries:
+            self._remember(key, blob)
+        if self._path is not None:
+            await asyncio.to_thread(self._disk_put, entries)
+
+    async def get(self, model: str, text: str) -> Optional[List[float]]:
+        return (await self.get_many(model, [text]))[0]
+
+    async def put(self, model: str, text: str, vector: List[float]) -> None:
+        await self.put_many(model, [(text, vector)])
+
+    def _disk_get(self, keys: List[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        with self._disk_lock:
+            connection = self._connect()
+            try:
+                for start in range(0, len(keys), 500):
+                    batch = keys[start:start + 500]
+                    placeholders = ','.join('?' for _ in batch)
+                    rows = connection.execute(
+                        f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})',
+                        batch,
+                    ).fetchall()
+                    found.update(rows)
+                if found:
+                    now = time.time()
+                    connection.executemany(
+                        'UPDATE embeddings SET accessed_at = ? WHERE key = ?',
+                        [(now, key) for key in found],
+                    )
+                    connection.commit()
+            finally:
+                connection.close()
+        return found
+
+    def _disk_put(self, entries: List[Tuple[str, bytes]]) -> None:
+        now = time.time()
+        with self._disk_lock:
+            connection = self._connect()
+            try:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO embeddings (key, vector, accessed_at) VALUES (?, ?, ?)',
+                    [(key, blob, now) for key, blob in entries],
+                )
+                connection.commit()
+                self._evict(connection)
+            finally:
+                connection.close()
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        if self._max_disk_bytes <= 0:
+            return
+        used = self._disk_bytes(connection)
+        if used <= self._max_disk_bytes:
+            return
+        rows, = connection.execute('SELECT COUNT(*) FROM embeddings').fetchone()
+        if not rows:
+            return
+        target = int(self._max_disk_bytes * 0.9)
+        excess = int(rows * (used - target) / used) + 1
+        connection.execute(
+            'DELETE FROM embeddings WHERE key IN '
+            '(SELECT key FROM embeddings ORDER BY accessed_at ASC LIMIT ?)',
+            (excess,),
+        )
+        connection.commit()
+        self.evictions += excess
+
+    @staticmethod
+    def _disk_bytes(connection: sqlite3.Connection) -> int:
+        page_size, = connection.execute('PRAGMA page_size').fetchone()
+        page_count, = connection.execute('PRAGMA page_count').fetchone()
+        free_pages, = connection.execute('PRAGMA freelist_count').fetchone()
+        return (page_count - free_pages) * page_size
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'memory_entries': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class QueryEmbeddingCache:
+    def __init__(self, ttl_seconds: float, max_bytes: int) -> None:
+        self._ttl = ttl_seconds
+        self._max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[float, bytes]]' = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def _key(model: str, query: str) -> str:
+        return cache_key(model, query.casefold())
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = self._key(model, query)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, blob = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.CACHE_LOOKUPS.labels('query', 'hit').inc()
+                return _decode(blob)
+            self._drop(key)
+            self.expired += 1
+            metrics.CACHE_LOOKUPS.labels('query', 'expired').inc()
+        self.misses += 1
+        metrics.CACHE_LOOKUPS.labels('query', 'miss').inc()
+        return None
+
+    def put(self, model: str, query: str, vector: List[float]) -> None:
+        if self._max_bytes <= 0:
+            return
+        key = self._key(model, query)
+        blob = _encode(vector)
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + self._ttl, blob)
+        self._bytes += _entry_bytes(key, blob)
+        while self._bytes > self._max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str) -> None:
+        _, blob = self._entries.pop(key)
+        self._bytes -= _entry_bytes(key, blob)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+        }
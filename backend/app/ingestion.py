@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from . import metrics
+from .parse_pool import ParserPool, Source
+from .parsers import ParseError, UnsupportedFileTypeError, check_supported, iter_text
+from .rag_core import DocumentChunk, RAGPipeline
+from .settings import Settings
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+@dataclass
+class IngestProgress:
+    files_total: int = 0
+    files_parsed: int = 0
+    chunks_embedded: int = 0
+    chunks_upserted: int = 0
+    chunks_unchanged: int = 0
+    chunks_deleted: int = 0
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+_CHUNK_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'jamai-rag/chunk')
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def chunk_id_for(tenant_id: Optional[str], source: str, index: int, digest: str) -> str:
+    return str(uuid.uuid5(_CHUNK_NAMESPACE, f'{tenant_id or ""}\x00{source}\x00{index}\x00{digest}'))
+
+
+def _iter_path(filename: str, path: Path) -> Iterator[str]:
+    with open(path, 'rb') as stream:
+        yield from iter_text(filename, stream)
+
+
+async def _open_segments(filename: str, source: Source, parser: Optional[ParserPool]) -> Iterable[str]:
+    if parser is not None:
+        return await parser.extract(filename, source)
+    check_supported(filename)
+    if isinstance(source, Path):
+        return _iter_path(filename, source)
+    return iter_text(filename, source)
+
+
+async def ingest_files(
+    pipeline: RAGPipeline,
+    settings: Settings,
+    files: Iterable[Tuple[str, Source]],
+    tenant_id: Optional[str],
+    tags: List[str],
+    progress: IngestProgress,
+    checkpoint: Optional[Callable[[], Awaitable[None]]] = None,
+    parser: Optional[ParserPool] = None,
+) -> IngestProgress:
+    batch: List[DocumentChunk] = []
+    batch_bytes = 0
+    max_batch_bytes = settings.ingest_max_inflight_mb * 1024 * 1024
+
+    def on_embedded(count: int) -> None:
+        progress.chunks_embedded += count
+
+    async def flush() -> None:
+        nonlocal batch, batch_bytes
+        pending, batch, batch_bytes = batch, [], 0
+        progress.chunks_upserted += await pipeline.upsert_chunks(pending, on_embedded=on_embedded)
+        if checkpoint is not None:
+            await checkpoint()
+
+    # With a parser pool, upcoming files are parsed in parallel while the current one is indexed.
+    window = parser.workers if parser is not None else 1
+    sources = iter(files)
+    parsing: Deque[Tuple[str, asyncio.Future]] = deque()
+
+    def schedule() -> None:
+        while len(parsing) < window:
+            item = next(sources, None)
+            if item is None:
+                return
+            filename, source = item
+            parsing.append((filename, asyncio.ensure_future(_open_segments(filename, source, parser))))
+
+    try:
+        schedule()
+        while parsing:
+            filename, task = parsing.popleft()
+            started = time.perf_counter()
+            try:
+                segments = await task
+            except (UnsupportedFileTypeError, ParseError) as exc:
+                progress.errors[filename] = str(exc)
+                continue
+            finally:
+                schedule()
+            existing = await pipeline.existing_chunks(filename, tenant_id)
+            seen: Set[str] = set()
+            retag: List[str] = []
+            file_chunks = 0
+            segments = metrics.timed_iter(segments, 'extract', elapsed=time.perf_counter() - started)
+            for index, chunk in enumerate(pipeline.chunk_stream(segments)):
+                file_chunks += 1
+                digest = content_hash(chunk.text)
+                chunk_id = chunk_id_for(tenant_id, filename, index, digest)
+                seen.add(chunk_id)
+                current_tags = existing.get(chunk_id)
+                if current_tags is not None:
+                    progress.chunks_unchanged += 1
+                    if sorted(current_tags) != sorted(tags):
+                        retag.append(chunk_id)
+                    continue
+                metadata = {
+                    'source': filename,
+                    'chunk_index': index,
+                    'chunk_id': chunk_id,
+                    'content_hash': digest,
+                    'char_start': chunk.start,
+                    'char_end': chunk.end,
+                }
+                if chunk.headings:
+                    metadata['headings'] = chunk.headings
+                if tenant_id:
+                    metadata['tenant_id'] = tenant_id
+                if tags:
+                    metadata['tags'] = tags
+                batch.append(DocumentChunk(chunk_id=chunk_id, text=chunk.text, metadata=metadata))
+                batch_bytes += len(chunk.text.encode('utf-8'))
+                if len(batch) >= settings.ingest_batch_size or batch_bytes >= max_batch_bytes:
+                    await flush()
+            if not file_chunks:
+                progress.errors[filename] = 'File contained no readable text'
+                # The file was emptied since the last ingest; its old chunks must not keep answering queries.
+                if existing:
+                    progress.chunks_deleted += await pipeline.delete_chunks(list(existing), tenant_id)
+                continue
+            await pipeline.set_chunk_tags(retag, tags, tenant_id)
+            stale = [chunk_id for chunk_id in existing if chunk_id not in seen]
+            if stale:
+                # Index the replacement chunks before removing the old ones so search never sees a gap.
+                if batch:
+                    await flush()
+                progress.chunks_deleted += await pipeline.delete_chunks(stale, tenant_id)
+            progress.files_parsed += 1
+
+        if batch:
+            await flush()
+    finally:
+        for _, task in parsing:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception() is None:
+                close = getattr(task.result(), 'close', None)
+                if close is not None:
+                    close()
+    return progress
@@ -0,0 +1,311 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import shutil
+import uuid
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+
+from . import metrics
+from .ingestion import IngestCancelled, IngestProgress, ingest_files
+from .parse_pool import ParserPool
+from .rag_core import RAGPipeline
+from .scheduler import wait_for_capacity
+from .settings import Settings
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = {'queued', 'running'}
+
+
+class JobQueueFullError(RuntimeError):
+    pass
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+class JobStore:
+    def __init__(self, root: Path) -> None:
+        self._root = root
+
+    def job_dir(self, job_id: str) -> Path:
+        return self._root / job_id
+
+    def files_dir(self, job_id: str) -> Path:
+        return self.job_dir(job_id) / 'files'
+
+    def _record_path(self, job_id: str) -> Path:
+        return self.job_dir(job_id) / 'job.json'
+
+    def _cancel_path(self, job_id: str) -> Path:
+        return self.job_dir(job_id) / 'cancel'
+
+    def _write(self, record: Dict[str, object]) -> None:
+        path = self._record_path(str(record['job_id']))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(record, indent=2))
+        os.replace(tmp_path, path)
+
+    def _read(self, job_id: str) -> Optional[Dict[str, object]]:
+        path = self._record_path(job_id)
+        if not path.exists():
+            return None
+        record = json.loads(path.read_text())
+        record['cancel_requested'] = self._cancel_path(job_id).exists()
+        return record
+
+    async def save(self, record: Dict[str, object]) -> None:
+        record['updated_at'] = _now()
+        await asyncio.to_thread(self._write, {k: v for k, v in record.items() if k != 'cancel_requested'})
+
+    async def load(self, job_id: str) -> Optional[Dict[str, object]]:
+        if not self._safe_id(job_id):
+            return None
+        return await asyncio.to_thread(self._read, job_id)
+
+    async def list(self) -> List[Dict[str, object]]:
+        def read_all() -> List[Dict[str, object]]:
+            if not self._root.exists():
+                return []
+            records = [self._read(path.name) for path in self._root.iterdir() if path.is_dir()]
+            return sorted((r for r in records if r), key=lambda r: str(r['created_at']), reverse=True)
+
+        return await asyncio.to_thread(read_all)
+
+    async def request_cancel(self, job_id: str) -> None:
+        await asyncio.to_thread(self._cancel_path(job_id).touch)
+
+    def cancel_requested(self, job_id: str) -> bool:
+        return self._cancel_path(job_id).exists()
+
+    def claim(self, job_id: str) -> Optional[int]:
+        # flock is released by the kernel if the owning worker dies, so restarted workers can reclaim jobs.
+        fd = os.open(self.job_dir(job_id) / 'lock', os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @staticmethod
+    def release(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    async def prune(self, max_age_hours: float) -> int:
+        cutoff = (datetime.utcnow() - timedelta(hours=max_age_hours)).isoformat() + 'Z'
+
+        def remove_expired() -> int:
+            if not self._root.exists():
+                return 0
+            removed = 0
+            for path in self._root.iterdir():
+                record = self._read(path.name) if path.is_dir() else None
+                if record is None or record['status'] in ACTIVE_STATUSES or str(record['updated_at']) >= cutoff:
+                    continue
+                # A worker still holding the lock is about to rewrite the record; leave it for the next pass.
+                fd = self.claim(path.name)
+                if fd is None:
+                    continue
+                try:
+                    shutil.rmtree(path, True)
+                finally:
+                    self.release(fd)
+                removed += 1
+            return removed
+
+        return await asyncio.to_thread(remove_expired)
+
+    @staticmethod
+    def _safe_id(job_id: str) -> bool:
+        try:
+            return str(uuid.UUID(job_id)) == job_id
+        except ValueError:
+            return False
+
+
+class IngestJobManager:
+    def __init__(
+        self,
+        store: JobStore,
+        settings: Settings,
+        pipeline: Callable[[], RAGPipeline],
+        parser: Optional[ParserPool] = None,
+    ) -> None:
+        self.store = store
+        self.settings = settings
+        self._pipeline = pipeline
+        self._parser = parser
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._pruner: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.settings.ingest_queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f'ingest-worker-{index}')
+            for index in range(max(1, self.settings.ingest_workers))
+        ]
+        for record in reversed(await self.store.list()):
+            if record['status'] in ACTIVE_STATUSES:
+                try:
+                    self._queue.put_nowait(record['job_id'])
+                except asyncio.QueueFull:
+                    break
+                logger.info('Re-queued ingest job %s after restart', record['job_id'])
+        if self.settings.ingest_job_retention_hours > 0:
+            self._pruner = asyncio.create_task(self._prune_periodically(), name='ingest-job-pruner')
+
+    async def stop(self) -> None:
+        tasks = self._workers + ([self._pruner] if self._pruner else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._pruner = None
+
+    async def submit(self, uploads: List[UploadFile], tenant_id: Optional[str], tags: List[str]) -> Dict[str, object]:
+        if self._queue is None or self._queue.full():
+            raise JobQueueFullError('Ingestion queue is full')
+        job_id = str(uuid.uuid4())
+        files_dir = self.store.files_dir(job_id)
+        names = [upload.filename or 'document' for upload in uploads]
+
+        def spool() -> None:
+            files_dir.mkdir(parents=True, exist_ok=True)
+            for index, upload in enumerate(uploads):
+                with open(files_dir / f'{index:05d}', 'wb') as target:
+                    shutil.copyfileobj(upload.file, target, 1024 * 1024)
+
+        await asyncio.to_thread(spool)
+        now = _now()
+        record: Dict[str, object] = {
+            'job_id': job_id,
+            'status': 'queued',
+            'tenant_id': tenant_id,
+            'tags': tags,
+            'files': names,
+            **asdict(IngestProgress(files_total=len(names))),
+            'error': None,
+            'created_at': now,
+            'updated_at': now,
+        }
+        await self.store.save(record)
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull as exc:
+            await asyncio.to_thread(shutil.rmtree, self.store.job_dir(job_id), True)
+            raise JobQueueFullError('Ingestion queue is full') from exc
+        record['cancel_requested'] = False
+        return record
+
+    async def get(self, job_id: str) -> Optional[Dict[str, object]]:
+        return await self.store.load(job_id)
+
+    async def list(self) -> List[Dict[str, object]]:
+        return await self.store.list()
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, object]]:
+        record = await self.store.load(job_id)
+        if record is None:
+            return None
+        if record['status'] not in ACTIVE_STATUSES:
+            return record
+        await self.store.request_cancel(job_id)
+        if record['status'] == 'queued':
+            fd = self.store.claim(job_id)
+            if fd is not None:
+                try:
+                    await self._finish(record, 'cancelled')
+                finally:
+                    self.store.release(fd)
+        return await self.store.load(job_id)
+
+    async def _prune_periodically(self) -> None:
+        retention = self.settings.ingest_job_retention_hours
+        while True:
+            try:
+                removed = await self.store.prune(retention)
+                if removed:
+                    logger.info('Pruned %d finished ingest jobs older than %sh', removed, retention)
+            except Exception as exc:  # pragma: no cover
+                logger.warning('Pruning ingest jobs failed: %s', exc)
+            await asyncio.sleep(min(3600.0, retention * 3600 / 4))
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as exc:  # pragma: no cover
+                logger.exception('Ingest job %s crashed: %s', job_id, exc)
+            finally:
+                self._queue.task_done()
+
+    def _job_files(self, record: Dict[str, object]) -> List[Tuple[str, Path]]:
+        files_dir = self.store.files_dir(str(record['job_id']))
+        return [(str(name), files_dir / f'{index:05d}') for index, name in enumerate(record['files'])]
+
+    async def _run(self, job_id: str) -> None:
+        fd = self.store.claim(job_id)
+        if fd is None:
+            return
+        try:
+            record = await self.store.load(job_id)
+            if record is None or record['status'] not in ACTIVE_STATUSES:
+                return
+            if record['cancel_requested']:
+                await self._finish(record, 'cancelled')
+                return
+            record['status'] = 'running'
+            progress = IngestProgress(files_total=len(record['files']))
+            record.update(asdict(progress))
+            await self.store.save(record)
+
+            async def checkpoint() -> None:
+                record.update(asdict(progress))
+                await self.store.save(record)
+                if self.store.cancel_requested(job_id):
+                    raise IngestCancelled()
+
+            try:
+                with metrics.request_scope(record['tenant_id']), wait_for_capacity():
+                    await ingest_files(
+                        self._pipeline(),
+                        self.settings,
+                        self._job_files(record),
+                        record['tenant_id'],
+                        record['tags'],
+                        progress,
+                        checkpoint,
+                        self._parser,
+                    )
+            except IngestCancelled:
+                record.update(asdict(progress))
+                await self._finish(record, 'cancelled')
+                return
+            except Exception as exc:
+                logger.exception('Ingest job %s failed: %s', job_id, exc)
+                record.update(asdict(progress))
+                record['error'] = str(exc) or exc.__class__.__name__
+                await self._finish(record, 'failed')
+                return
+            record.update(asdict(progress))
+            await self._finish(record, 'completed')
+        finally:
+            self.store.release(fd)
+
+    async def _finish(self, record: Dict[str, object], status: str) -> None:
+        record['status'] = status
+        await self.store.save(record)
+        await asyncio.to_thread(shutil.rmtree, self.store.files_dir(str(record['job_id'])), True)
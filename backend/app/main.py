@@ -1,18 +1,34 @@
+import asyncio
+import json
 import logging
-import uuid
+import time
 from datetime import datetime
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 
-from fastapi import APIRouter, Depends, FastAPI, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, FastAPI, File, Form, Header, HTTPException, Query, Request, Response, UploadFile
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-
-from .parsers import UnsupportedFileTypeError, extract_text
-from .rag_core import DocumentChunk, RAGPipeline
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from . import metrics
+from .ingestion import IngestProgress, ingest_files
+from .jobs import IngestJobManager, JobQueueFullError, JobStore
+from .parse_pool import ParserPool
+from .profiling import ARTIFACTS, PROFILE_HEADER, ProfileStore, ProfilingMiddleware, RequestProfiler
+from .rag_core import RAGPipeline
+from .scheduler import INTERACTIVE, OllamaBusyError
 from .schemas import (
     ChatRequest,
     ChatResponse,
     DebugSearchResponse,
+    IngestJobListResponse,
+    IngestJobRead,
     IngestResponse,
+    ProfileListResponse,
+    ProfileRead,
+    SessionCreate,
+    SessionRead,
     SourceChunk,
     TenantCreate,
     TenantListResponse,
@@ -20,8 +36,10 @@ from .schemas import (
     TenantSegmentsResponse,
     TenantUpdate,
 )
+from .sessions import ChatSessionManager, SessionStore
 from .settings import Settings, get_settings
 from .tenant_store import TenantStore
+from .warmup import ModelWarmer
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -38,7 +56,17 @@ app.add_middleware(
 )
 
 _pipeline = RAGPipeline(settings)
-_tenant_store = TenantStore(settings.data_dir / 'tenants.json')
+_tenant_store = TenantStore(
+    settings.data_dir / ('tenants.sqlite3' if settings.tenant_store_backend == 'sqlite' else 'tenants.json'),
+    refresh_seconds=settings.tenant_refresh_seconds,
+)
+_parser_pool = ParserPool(settings) if settings.parse_workers > 0 else None
+_job_manager = IngestJobManager(JobStore(settings.data_dir / 'jobs'), settings, lambda: _pipeline, _parser_pool)
+_warmer = ModelWarmer(settings, _pipeline)
+_session_manager = ChatSessionManager(SessionStore(settings.data_dir / 'sessions'), settings, lambda: _pipeline)
+_profiler = RequestProfiler(settings, ProfileStore(settings.data_dir / 'profiles', settings.profiling_max_reports))
+_PROFILED_PATHS = {'/chat', '/ingest', '/debug/search'}
+_NO_ANSWER = 'I do not have enough information to answer that yet.'
 
 
 def get_pipeline(_: Settings = Depends(get_settings)) -> RAGPipeline:
@@ -49,14 +77,38 @@ def get_tenant_store(_: Settings = Depends(get_settings)) -> TenantStore:
     return _tenant_store
 
 
+def get_job_manager(_: Settings = Depends(get_settings)) -> IngestJobManager:
+    return _job_manager
+
+
+def get_session_manager(_: Settings = Depends(get_settings)) -> ChatSessionManager:
+    return _session_manager
+
+
+def get_profiler(token: Optional[str] = Header(None, alias=PROFILE_HEADER)) -> RequestProfiler:
+    if not _profiler.authorized(token):
+        raise HTTPException(status_code=403, detail='A valid profiling token is required')
+    return _profiler
+
+
 tenant_router = APIRouter(prefix='/tenants', tags=['tenants'])
+job_router = APIRouter(prefix='/ingest/jobs', tags=['ingest'])
+session_router = APIRouter(prefix='/sessions', tags=['sessions'])
+profile_router = APIRouter(prefix='/profiles', tags=['profiling'])
+
+
+app.add_middleware(ProfilingMiddleware, profiler=_profiler, paths=_PROFILED_PATHS)
 
 
 @tenant_router.get('', response_model=TenantListResponse)
-async def list_tenants(store: TenantStore = Depends(get_tenant_store)) -> TenantListResponse:
-    records = await store.list()
+async def list_tenants(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    store: TenantStore = Depends(get_tenant_store),
+) -> TenantListResponse:
+    records, total = await store.page(offset, limit)
     tenants = [TenantRead(**record) for record in records]
-    return TenantListResponse(tenants=tenants)
+    return TenantListResponse(tenants=tenants, total=total, offset=offset, limit=limit)
 
 
 @tenant_router.post('', response_model=TenantRead, status_code=201)
@@ -121,10 +173,39 @@ async def count_segments(
 app.include_router(tenant_router)
 
 
+@app.exception_handler(OllamaBusyError)
+async def _ollama_busy(_: Request, exc: OllamaBusyError) -> JSONResponse:
+    return JSONResponse(status_code=429, content={'detail': str(exc)}, headers={'Retry-After': str(exc.retry_after)})
+
+
 @app.on_event('startup')
 async def _startup() -> None:
     await _tenant_store.initialise()
+    metrics.set_tenant_registry(_tenant_store.known)
+    await _pipeline.start()
+    await _warmer.start()
     await _pipeline.ensure_collection()
+    if _parser_pool is not None:
+        await _parser_pool.start()
+    await _job_manager.start()
+    await _session_manager.start()
+
+
+@app.on_event('shutdown')
+async def _shutdown() -> None:
+    await _warmer.stop()
+    await _job_manager.stop()
+    await _session_manager.stop()
+    if _parser_pool is not None:
+        await _parser_pool.close()
+    await _pipeline.close()
+    metrics.set_tenant_registry(None)
+    await _tenant_store.close()
+
+
+@app.get('/metrics', include_in_schema=False)
+async def prometheus_metrics() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get('/health')
@@ -132,14 +213,39 @@ async def health_check() -> dict:
     return {'status': 'ok'}
 
 
-@app.post('/ingest', response_model=IngestResponse)
+@app.get('/ready')
+async def readiness_check() -> JSONResponse:
+    status = await _warmer.readiness()
+    return JSONResponse(status, status_code=200 if status['ready'] else 503)
+
+
+@app.get('/debug/ollama')
+async def debug_ollama(pipeline: RAGPipeline = Depends(get_pipeline)) -> dict:
+    return {**pipeline.ollama.pool_stats(), 'scheduler': pipeline.scheduler.stats()}
+
+
+@app.get('/debug/cache')
+async def debug_cache(pipeline: RAGPipeline = Depends(get_pipeline)) -> dict:
+    cache = pipeline.embedding_cache
+    query_cache = pipeline.query_cache
+    return {
+        'embeddings': cache.stats() if cache is not None else None,
+        'queries': query_cache.stats() if query_cache is not None else None,
+        'coalescing': pipeline.coalescer.stats() if pipeline.coalescer is not None else None,
+    }
+
+
+@app.post('/ingest', response_model=IngestResponse, responses={202: {'model': IngestJobRead}})
 async def ingest_documents(
+    response: Response,
     files: List[UploadFile] = File(...),
     tenant_id: Optional[str] = Form(None),
     tags: Optional[str] = Form(None),
+    background: Optional[bool] = Form(None),
     pipeline: RAGPipeline = Depends(get_pipeline),
     store: TenantStore = Depends(get_tenant_store),
-) -> IngestResponse:
+    jobs: IngestJobManager = Depends(get_job_manager),
+):
     if not files:
         raise HTTPException(status_code=400, detail='No files uploaded')
 
@@ -149,65 +255,241 @@ async def ingest_documents(
     tag_list = [tag.strip() for tag in tags.split(',')] if tags else []
     tag_list = [tag for tag in tag_list if tag]
 
-    processed = 0
-    skipped = {}
-    chunks: List[DocumentChunk] = []
-
-    for upload in files:
-        data = await upload.read()
+    if background if background is not None else settings.ingest_background:
         try:
-            text = extract_text(upload.filename or 'document', data)
-        except UnsupportedFileTypeError as exc:
-            skipped[upload.filename or 'unknown'] = str(exc)
-            continue
-        if not text.strip():
-            skipped[upload.filename or 'unknown'] = 'File contained no readable text'
-            continue
-        processed += 1
-        for index, chunk_text in enumerate(pipeline.split_text(text)):
-            chunk_id = str(uuid.uuid4())
-            metadata = {
-                'source': upload.filename or 'document',
-                'chunk_index': index,
-                'chunk_id': chunk_id,
-            }
-            if tenant_id:
-                metadata['tenant_id'] = tenant_id
-            if tag_list:
-                metadata['tags'] = tag_list
-            chunks.append(DocumentChunk(chunk_id=chunk_id, text=chunk_text, metadata=metadata))
-
-    if not chunks:
-        return IngestResponse(files_processed=processed, chunks_indexed=0, skipped=skipped)
+            job = await jobs.submit(files, tenant_id, tag_list)
+        except JobQueueFullError as exc:
+            raise HTTPException(status_code=503, detail=str(exc)) from exc
+        return JSONResponse(status_code=202, content=jsonable_encoder(IngestJobRead(**job)))
 
+    def open_uploads():
+        for upload in files:
+            yield upload.filename or 'document', upload.file
+
+    started = time.perf_counter()
     try:
-        count = await pipeline.upsert_chunks(chunks)
+        with metrics.request_scope(tenant_id) as scope:
+            progress = await ingest_files(
+                pipeline,
+                settings,
+                open_uploads(),
+                tenant_id,
+                tag_list,
+                IngestProgress(),
+                parser=_parser_pool,
+            )
+    except OllamaBusyError:
+        raise
     except Exception as exc:  # pragma: no cover
         logger.exception('Failed to index documents: %s', exc)
         raise HTTPException(status_code=500, detail='Failed to index documents')
+    scope.timings['total'] = time.perf_counter() - started
+    response.headers['Server-Timing'] = metrics.server_timing(scope.timings)
+
+    return IngestResponse(
+        files_processed=progress.files_parsed,
+        chunks_indexed=progress.chunks_upserted,
+        chunks_unchanged=progress.chunks_unchanged,
+        chunks_deleted=progress.chunks_deleted,
+        skipped=progress.errors,
+    )
+
+
+@job_router.get('', response_model=IngestJobListResponse)
+async def list_ingest_jobs(jobs: IngestJobManager = Depends(get_job_manager)) -> IngestJobListResponse:
+    records = await jobs.list()
+    return IngestJobListResponse(jobs=[IngestJobRead(**record) for record in records])
 
-    return IngestResponse(files_processed=processed, chunks_indexed=count, skipped=skipped)
+
+@job_router.get('/{job_id}', response_model=IngestJobRead)
+async def get_ingest_job(job_id: str, jobs: IngestJobManager = Depends(get_job_manager)) -> IngestJobRead:
+    record = await jobs.get(job_id)
+    if not record:
+        raise HTTPException(status_code=404, detail='Job not found')
+    return IngestJobRead(**record)
+
+
+@job_router.post('/{job_id}/cancel', response_model=IngestJobRead)
+async def cancel_ingest_job(job_id: str, jobs: IngestJobManager = Depends(get_job_manager)) -> IngestJobRead:
+    record = await jobs.cancel(job_id)
+    if not record:
+        raise HTTPException(status_code=404, detail='Job not found')
+    return IngestJobRead(**record)
+
+
+app.include_router(job_router)
+
+
+def _sse(event: str, data: object) -> str:
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+async def _stream_chat_events(
+    request: ChatRequest,
+    pipeline: RAGPipeline,
+    top_k: int,
+    conversation: Optional[List[dict]],
+    sessions: ChatSessionManager,
+) -> AsyncIterator[str]:
+    with metrics.request_scope(request.tenant_id) as scope:
+        started = time.perf_counter()
+        first_token_at: Optional[float] = None
+        final: dict = {}
+        answer: List[str] = []
+        try:
+            retrieved = await pipeline.retrieve(
+                query=request.query,
+                top_k=top_k,
+                tenant_id=request.tenant_id,
+                tags=request.tags,
+                mmr_lambda=request.mmr_lambda,
+            )
+            retrieved_at = time.perf_counter()
+            messages, sources = pipeline.build_prompt(request.query, retrieved, conversation)
+            yield _sse('sources', [SourceChunk(**source).dict() for source in sources])
+            async for chunk in pipeline.stream_chat(messages):
+                content = chunk.get('message', {}).get('content', '')
+                if content:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    answer.append(content)
+                    yield _sse('token', {'content': content})
+                if chunk.get('done'):
+                    final = chunk
+        except OllamaBusyError as exc:
+            yield _sse('error', {'detail': str(exc), 'retry_after': exc.retry_after})
+            return
+        except Exception as exc:
+            logger.exception('Streaming chat failed: %s', exc)
+            yield _sse('error', {'detail': 'Failed to generate answer'})
+            return
+        if request.session_id:
+            await sessions.append_turn(request.session_id, request.query, ''.join(answer).strip() or _NO_ANSWER)
+        finished = time.perf_counter()
+        timings = {
+            'retrieve_ms': round((retrieved_at - started) * 1000, 2),
+            'first_token_ms': round((first_token_at - started) * 1000, 2) if first_token_at else None,
+            'total_ms': round((finished - started) * 1000, 2),
+            **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in scope.timings.items()},
+        }
+        yield _sse(
+            'done',
+            {
+                'timings': timings,
+                'prompt_tokens': final.get('prompt_eval_count'),
+                'completion_tokens': final.get('eval_count'),
+                'session_id': request.session_id,
+            },
+        )
+
+
+async def _conversation_for(request: ChatRequest, sessions: ChatSessionManager) -> Optional[List[dict]]:
+    if not request.session_id:
+        return [msg.dict() for msg in request.conversation] if request.conversation else None
+    record = await sessions.get(request.session_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail='Session not found')
+    if record['tenant_id'] != request.tenant_id:
+        raise HTTPException(status_code=400, detail='Session belongs to a different tenant')
+    return sessions.history(record)
 
 
 @app.post('/chat', response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
+    response: Response,
     pipeline: RAGPipeline = Depends(get_pipeline),
     store: TenantStore = Depends(get_tenant_store),
-) -> ChatResponse:
+    sessions: ChatSessionManager = Depends(get_session_manager),
+):
     if request.tenant_id and not await store.get(request.tenant_id):
         raise HTTPException(status_code=400, detail='Tenant is not registered')
     top_k = request.top_k or settings.default_top_k
-    retrieved = await pipeline.retrieve(
-        query=request.query,
-        top_k=top_k,
-        tenant_id=request.tenant_id,
-        tags=request.tags,
-    )
-    conversation = [msg.dict() for msg in request.conversation] if request.conversation else None
-    answer, sources = await pipeline.generate_answer(request.query, retrieved, conversation)
+    conversation = await _conversation_for(request, sessions)
+    if request.stream:
+        # The 429 has to be decided before the stream starts; later rejections arrive as error events.
+        pipeline.scheduler.admit(INTERACTIVE, request.tenant_id)
+        # Headers go out before generation starts, so streamed stage timings are reported in the done event.
+        return StreamingResponse(
+            _stream_chat_events(request, pipeline, top_k, conversation, sessions),
+            media_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+    started = time.perf_counter()
+    with metrics.request_scope(request.tenant_id) as scope:
+        retrieved = await pipeline.retrieve(
+            query=request.query,
+            top_k=top_k,
+            tenant_id=request.tenant_id,
+            tags=request.tags,
+            mmr_lambda=request.mmr_lambda,
+        )
+        answer, sources = await pipeline.generate_answer(request.query, retrieved, conversation)
+    scope.timings['total'] = time.perf_counter() - started
+    response.headers['Server-Timing'] = metrics.server_timing(scope.timings)
+    answer = answer or _NO_ANSWER
+    if request.session_id:
+        await sessions.append_turn(request.session_id, request.query, answer)
     source_models = [SourceChunk(**source) for source in sources]
-    return ChatResponse(answer=answer or 'I do not have enough information to answer that yet.', sources=source_models)
+    return ChatResponse(answer=answer, sources=source_models, session_id=request.session_id)
+
+
+@session_router.post('', response_model=SessionRead, status_code=201)
+async def create_session(
+    payload: SessionCreate,
+    store: TenantStore = Depends(get_tenant_store),
+    sessions: ChatSessionManager = Depends(get_session_manager),
+) -> SessionRead:
+    if payload.tenant_id and not await store.get(payload.tenant_id):
+        raise HTTPException(status_code=400, detail='Tenant is not registered')
+    return SessionRead(**await sessions.create(payload.tenant_id))
+
+
+@session_router.get('/{session_id}', response_model=SessionRead)
+async def get_session(session_id: str, sessions: ChatSessionManager = Depends(get_session_manager)) -> SessionRead:
+    record = await sessions.get(session_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail='Session not found')
+    return SessionRead(**record)
+
+
+@session_router.delete('/{session_id}', status_code=204)
+async def delete_session(session_id: str, sessions: ChatSessionManager = Depends(get_session_manager)) -> None:
+    if not await sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail='Session not found')
+
+
+app.include_router(session_router)
+
+
+@profile_router.get('', response_model=ProfileListResponse)
+async def list_profiles(profiler: RequestProfiler = Depends(get_profiler)) -> ProfileListResponse:
+    records = await asyncio.to_thread(profiler.store.list)
+    return ProfileListResponse(profiles=[ProfileRead(**record) for record in records])
+
+
+@profile_router.get('/{profile_id}', response_model=ProfileRead)
+async def get_profile(profile_id: str, profiler: RequestProfiler = Depends(get_profiler)) -> ProfileRead:
+    record = await asyncio.to_thread(profiler.store.load, profile_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail='Profile not found')
+    return ProfileRead(**record)
+
+
+@profile_router.get('/{profile_id}/{artifact}')
+async def download_profile(
+    profile_id: str,
+    artifact: str,
+    profiler: RequestProfiler = Depends(get_profiler),
+) -> FileResponse:
+    path = profiler.store.artifact_path(profile_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail='Profile artifact not found')
+    filename, media_type = ARTIFACTS[artifact]
+    return FileResponse(path, media_type=media_type, filename=f'{profile_id}-{filename}')
+
+
+app.include_router(profile_router)
 
 
 @app.get('/debug/search', response_model=DebugSearchResponse)
@@ -216,11 +498,15 @@ async def debug_search(
     top_k: int = 4,
     tenant_id: Optional[str] = None,
     tags: Optional[str] = None,
+    mmr_lambda: Optional[float] = Query(None, ge=0, le=1),
     pipeline: RAGPipeline = Depends(get_pipeline),
+    store: TenantStore = Depends(get_tenant_store),
 ) -> DebugSearchResponse:
+    if tenant_id and not await store.get(tenant_id):
+        raise HTTPException(status_code=400, detail='Tenant is not registered')
     tag_list = [tag.strip() for tag in tags.split(',')] if tags else []
     tag_list = [tag for tag in tag_list if tag]
-    retrieved = await pipeline.retrieve(query, top_k, tenant_id, tag_list)
+    retrieved = await pipeline.retrieve(query, top_k, tenant_id, tag_list, mmr_lambda)
     results = [
         {
             'source': item.metadata.get('source'),
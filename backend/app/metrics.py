@@ -0,0 +1,128 @@
+import contextlib
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, Optional, TypeVar
+
+from prometheus_client import Counter, Gauge, Histogram
+
+T = TypeVar('T')
+
+_NO_TENANT = 'none'
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_SECONDS = Histogram(
+    'rag_stage_duration_seconds',
+    'Time spent in each pipeline stage.',
+    ['stage', 'tenant', 'model'],
+    buckets=_BUCKETS,
+)
+CHUNKS = Counter('rag_chunks_total', 'Chunks processed.', ['operation', 'tenant', 'model'])
+TOKENS = Counter('rag_tokens_total', 'Tokens reported by Ollama.', ['kind', 'tenant', 'model'])
+OLLAMA_RETRIES = Counter('rag_ollama_retries_total', 'Ollama calls that were retried.', ['operation', 'tenant', 'model'])
+EMPTY_EMBEDDINGS = Counter('rag_empty_embeddings_total', 'Embedding responses without vectors.', ['tenant', 'model'])
+COLLECTION_RECREATIONS = Counter(
+    'rag_collection_recreations_total',
+    'Qdrant collections found missing and scheduled for recreation.',
+    ['operation', 'tenant', 'collection'],
+)
+OLLAMA_ACTIVE = Gauge('rag_ollama_active_calls', 'Ollama calls holding a scheduler slot.')
+OLLAMA_QUEUE_DEPTH = Gauge('rag_ollama_queue_depth', 'Ollama calls waiting for a scheduler slot.', ['priority'])
+OLLAMA_REJECTIONS = Counter(
+    'rag_ollama_rejections_total', 'Ollama calls rejected because the queue was full.', ['priority', 'tenant']
+)
+CACHE_LOOKUPS = Counter('rag_cache_lookups_total', 'Embedding cache lookups by outcome.', ['cache', 'result'])
+COALESCED = Counter('rag_coalesced_total', 'Calls served by an identical call already in flight.', ['operation'])
+
+
+@dataclass
+class RequestScope:
+    tenant: str
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+_scope: ContextVar[Optional[RequestScope]] = ContextVar('rag_request_scope', default=None)
+
+
+_known_tenant: Optional[Callable[[str], bool]] = None
+
+
+def set_tenant_registry(is_known: Optional[Callable[[str], bool]]) -> None:
+    # Only registered tenant ids become label values, so clients cannot mint unbounded time series.
+    global _known_tenant
+    _known_tenant = is_known
+
+
+def _label_for(tenant_id: Optional[str]) -> str:
+    if not tenant_id or (_known_tenant is not None and not _known_tenant(tenant_id)):
+        return _NO_TENANT
+    return tenant_id
+
+
+def tenant_label(tenant_id: Optional[str] = None) -> str:
+    if tenant_id:
+        return _label_for(tenant_id)
+    scope = _scope.get()
+    return scope.tenant if scope is not None else _NO_TENANT
+
+
+@contextlib.contextmanager
+def request_scope(tenant_id: Optional[str]) -> Iterator[RequestScope]:
+    # Stages run inside the scope inherit its tenant label and report into its Server-Timing entries.
+    scope = RequestScope(tenant=_label_for(tenant_id))
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def observe(name: str, seconds: float, model: str = '', tenant_id: Optional[str] = None) -> None:
+    STAGE_SECONDS.labels(name, tenant_label(tenant_id), model).observe(seconds)
+    scope = _scope.get()
+    if scope is not None:
+        scope.timings[name] = scope.timings.get(name, 0.0) + seconds
+
+
+@contextlib.contextmanager
+def stage(name: str, model: str = '', tenant_id: Optional[str] = None) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, model, tenant_id)
+
+
+def timed_iter(
+    items: Iterable[T],
+    name: str,
+    model: str = '',
+    tenant_id: Optional[str] = None,
+    elapsed: float = 0.0,
+) -> Iterator[T]:
+    # Lazy parsers do their work while being iterated, so only time spent producing items is counted.
+    iterator = iter(items)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        observe(name, elapsed, model, tenant_id)
+
+
+def count_tokens(data: Dict[str, object], model: str, tenant_id: Optional[str] = None) -> None:
+    tenant = tenant_label(tenant_id)
+    for key, kind in (('prompt_eval_count', 'prompt'), ('eval_count', 'completion')):
+        value = data.get(key)
+        if isinstance(value, int) and value > 0:
+            TOKENS.labels(kind, tenant, model).inc(value)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items())
@@ -0,0 +1,36 @@
+from typing import List, Sequence
+
+import numpy as np
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def maximal_marginal_relevance(
+    query_vector: Sequence[float],
+    candidate_vectors: Sequence[Sequence[float]],
+    k: int,
+    lambda_mult: float,
+) -> List[int]:
+    if k <= 0 or not len(candidate_vectors):
+        return []
+    candidates = _normalize(np.asarray(candidate_vectors, dtype=np.float32))
+    query = _normalize(np.asarray(query_vector, dtype=np.float32))
+    relevance = candidates @ query
+    # Highest similarity of every candidate to anything picked so far, updated one row at a time.
+    redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    selected: List[int] = []
+    for _ in range(min(k, len(candidates))):
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, candidates @ candidates[best], out=redundancy)
+    return selected
@@ -0,0 +1,97 @@
+import contextlib
+import importlib.util
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from .settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaClient:
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self._client: Optional[httpx.AsyncClient] = None
+        self._in_flight = 0
+        self._requests_total = 0
+        self.http2 = settings.ollama_http2 and importlib.util.find_spec('h2') is not None
+        self.embed_timeout = self._timeout(settings.ollama_embed_timeout)
+        self.chat_timeout = self._timeout(settings.ollama_chat_timeout)
+
+    def _timeout(self, read_timeout: Optional[float]) -> httpx.Timeout:
+        read = read_timeout or float(self.settings.ollama_timeout)
+        return httpx.Timeout(read, connect=self.settings.ollama_connect_timeout)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            limits = httpx.Limits(
+                max_connections=self.settings.ollama_max_connections,
+                max_keepalive_connections=self.settings.ollama_max_keepalive,
+                keepalive_expiry=self.settings.ollama_keepalive_expiry,
+            )
+            self._client = httpx.AsyncClient(
+                base_url=self.settings.ollama_host,
+                limits=limits,
+                timeout=self._timeout(None),
+                http2=self.http2,
+            )
+        return self._client
+
+    async def start(self) -> None:
+        client = self.client
+        logger.info('Ollama client ready (%s, http2=%s)', client.base_url, self.http2)
+
+    async def close(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def get(self, path: str, timeout: httpx.Timeout) -> httpx.Response:
+        self._in_flight += 1
+        self._requests_total += 1
+        try:
+            return await self.client.get(path, timeout=timeout)
+        finally:
+            self._in_flight -= 1
+
+    async def post(self, path: str, payload: Dict[str, Any], timeout: httpx.Timeout) -> httpx.Response:
+        self._in_flight += 1
+        self._requests_total += 1
+        try:
+            return await self.client.post(path, json=payload, timeout=timeout)
+        finally:
+            self._in_flight -= 1
+
+    @contextlib.asynccontextmanager
+    async def stream(
+        self,
+        path: str,
+        payload: Dict[str, Any],
+        timeout: httpx.Timeout,
+    ) -> AsyncIterator[httpx.Response]:
+        self._in_flight += 1
+        self._requests_total += 1
+        try:
+            async with self.client.stream('POST', path, json=payload, timeout=timeout) as response:
+                yield response
+        finally:
+            self._in_flight -= 1
+
+    def pool_stats(self) -> Dict[str, Any]:
+        connections = []
+        if self._client is not None:
+            pool = getattr(getattr(self._client, '_transport', None), '_pool', None)
+            connections = list(getattr(pool, 'connections', []) or [])
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {
+            'http2': self.http2,
+            'max_connections': self.settings.ollama_max_connections,
+            'max_keepalive_connections': self.settings.ollama_max_keepalive,
+            'connections': len(connections),
+            'idle_connections': idle,
+            'in_flight_requests': self._in_flight,
+            'requests_total': self._requests_total,
+        }
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import multiprocessing
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Optional, Union
+
+from . import parsers
+from .parsers import ParseError, ParseTimeoutError
+from .settings import Settings
+
+logger = logging.getLogger(__name__)
+
+Source = Union[BinaryIO, Path]
+
+_READ_BLOCK_SIZE = 64 * 1024
+
+
+class _ExtractedText:
+    def __init__(self, path: Path, workdir: Path) -> None:
+        self._path = path
+        self._workdir = workdir
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            with open(self._path, 'r', encoding='utf-8', newline='') as stream:
+                while True:
+                    block = stream.read(_READ_BLOCK_SIZE)
+                    if not block:
+                        break
+                    yield block
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        shutil.rmtree(self._workdir, ignore_errors=True)
+
+
+class ParserPool:
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.workers = max(1, settings.parse_workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tmp_root = settings.data_dir / 'tmp'
+
+    def _new_executor(self, workers: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=parsers.init_parse_worker,
+            initargs=(self.settings.parse_memory_limit_mb,),
+        )
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = self._new_executor(self.workers)
+        return self._executor
+
+    async def start(self) -> None:
+        self._pool()
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _recycle(self, executor: ProcessPoolExecutor) -> None:
+        if self._executor is executor:
+            self._executor = None
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            process.terminate()
+        # Queued parses are not cancelled: they fail with BrokenProcessPool and get retried.
+        executor.shutdown(wait=False)
+
+    async def _run(self, executor: ProcessPoolExecutor, filename: str, source_path: Path, target: Path) -> None:
+        timeout = self.settings.parse_timeout_seconds
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            executor, parsers.extract_to_file, filename, str(source_path), str(target), timeout
+        )
+        try:
+            # The in-process alarm normally fires first; this only catches parsers stuck in C code.
+            await asyncio.wait_for(future, timeout + 5)
+        except asyncio.TimeoutError as exc:
+            logger.warning('Parser for %s did not stop after %ss; recycling pool', filename, timeout)
+            self._recycle(executor)
+            raise ParseTimeoutError('Parsing timed out') from exc
+
+    async def extract(self, filename: str, source: Source) -> Iterable[str]:
+        parsers.check_supported(filename)
+        self._tmp_root.mkdir(parents=True, exist_ok=True)
+        workdir = Path(tempfile.mkdtemp(prefix='parse-', dir=self._tmp_root))
+        try:
+            if isinstance(source, Path):
+                source_path = source
+            else:
+                source_path = workdir / 'source'
+                await asyncio.to_thread(self._spool, source, source_path)
+            target = workdir / 'text'
+            executor = self._pool()
+            try:
+                await self._run(executor, filename, source_path, target)
+            except BrokenProcessPool:
+                # One dying worker breaks the whole pool and every parse running beside it. Retrying
+                # once in a process of its own means only the file that crashed it fails.
+                logger.warning('Parser pool broke while reading %s; retrying in a separate process', filename)
+                self._recycle(executor)
+                executor = self._new_executor(1)
+                try:
+                    await self._run(executor, filename, source_path, target)
+                finally:
+                    executor.shutdown(wait=False)
+        except BrokenProcessPool as exc:
+            logger.warning('Parser process died while reading %s', filename)
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise ParseError('Parser process crashed') from exc
+        except ParseError:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+        except Exception as exc:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise ParseError(f'Failed to parse file: {exc}') from exc
+        except BaseException:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+        return _ExtractedText(target, workdir)
+
+    @staticmethod
+    def _spool(stream: BinaryIO, target: Path) -> None:
+        stream.seek(0)
+        with open(target, 'wb') as output:
+            shutil.copyfileobj(stream, output, 1024 * 1024)
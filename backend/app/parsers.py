@@ -1,70 +1,138 @@
 import csv
 import io
+import resource
+import signal
 from pathlib import Path
-from typing import Callable, Dict
+from typing import BinaryIO, Callable, Dict, Iterator, Optional
 
 from docx import Document
 from openpyxl import load_workbook
 from pypdf import PdfReader
 
+_TEXT_BLOCK_SIZE = 64 * 1024
+
 
 class UnsupportedFileTypeError(ValueError):
     pass
 
 
-def _read_text_bytes(data: bytes) -> str:
-    return data.decode('utf-8', errors='ignore')
+class ParseError(ValueError):
+    pass
+
+
+class ParseTimeoutError(ParseError):
+    pass
+
+
+def _text_stream(stream: BinaryIO) -> io.TextIOWrapper:
+    return io.TextIOWrapper(stream, encoding='utf-8', errors='ignore', newline='')
 
 
-def _parse_pdf(data: bytes) -> str:
-    reader = PdfReader(io.BytesIO(data))
-    pages = []
+def _iter_text_bytes(stream: BinaryIO) -> Iterator[str]:
+    reader = _text_stream(stream)
+    try:
+        while True:
+            block = reader.read(_TEXT_BLOCK_SIZE)
+            if not block:
+                break
+            yield block
+    finally:
+        reader.detach()
+
+
+def _iter_pdf(stream: BinaryIO) -> Iterator[str]:
+    reader = PdfReader(stream)
     for page in reader.pages:
         text = page.extract_text() or ''
         if text:
-            pages.append(text.strip())
-    return '\n\n'.join(pages)
-
-
-def _parse_docx(data: bytes) -> str:
-    document = Document(io.BytesIO(data))
-    paragraphs = [para.text.strip() for para in document.paragraphs if para.text.strip()]
-    return '\n'.join(paragraphs)
-
-
-def _parse_csv(data: bytes) -> str:
-    text_stream = io.StringIO(_read_text_bytes(data))
-    reader = csv.reader(text_stream)
-    rows = ['\t'.join(cell.strip() for cell in row if cell.strip()) for row in reader]
-    return '\n'.join(row for row in rows if row)
-
-
-def _parse_xlsx(data: bytes) -> str:
-    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
-    rows = []
-    for sheet in workbook.worksheets:
-        rows.append(f'# Sheet: {sheet.title}')
-        for row in sheet.iter_rows(values_only=True):
-            cells = [str(cell).strip() for cell in row if cell is not None and str(cell).strip()]
-            if cells:
-                rows.append('\t'.join(cells))
-    workbook.close()
-    return '\n'.join(rows)
-
-
-_PARSERS: Dict[str, Callable[[bytes], str]] = {
-    '.txt': _read_text_bytes,
-    '.md': _read_text_bytes,
-    '.markdown': _read_text_bytes,
-    '.pdf': _parse_pdf,
-    '.docx': _parse_docx,
-    '.csv': _parse_csv,
-    '.xlsx': _parse_xlsx,
+            yield text.strip() + '\n\n'
+
+
+def _iter_docx(stream: BinaryIO) -> Iterator[str]:
+    document = Document(stream)
+    for para in document.paragraphs:
+        text = para.text.strip()
+        if text:
+            yield text + '\n'
+
+
+def _iter_csv(stream: BinaryIO) -> Iterator[str]:
+    text_stream = _text_stream(stream)
+    try:
+        for row in csv.reader(text_stream):
+            line = '\t'.join(cell.strip() for cell in row if cell.strip())
+            if line:
+                yield line + '\n'
+    finally:
+        text_stream.detach()
+
+
+def _iter_xlsx(stream: BinaryIO) -> Iterator[str]:
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield f'# Sheet: {sheet.title}\n'
+            for row in sheet.iter_rows(values_only=True):
+                cells = [str(cell).strip() for cell in row if cell is not None and str(cell).strip()]
+                if cells:
+                    yield '\t'.join(cells) + '\n'
+    finally:
+        workbook.close()
+
+
+_PARSERS: Dict[str, Callable[[BinaryIO], Iterator[str]]] = {
+    '.txt': _iter_text_bytes,
+    '.md': _iter_text_bytes,
+    '.markdown': _iter_text_bytes,
+    '.pdf': _iter_pdf,
+    '.docx': _iter_docx,
+    '.csv': _iter_csv,
+    '.xlsx': _iter_xlsx,
 }
 
 
-def extract_text(filename: str, data: bytes) -> str:
+def _parser_for(filename: str) -> Callable[[BinaryIO], Iterator[str]]:
     suffix = Path(filename).suffix.lower()
     if suffix not in _PARSERS:
         raise UnsupportedFileTypeError(f'Unsupported file type: {suffix}')
-    return _PARSERS[suffix](data).strip()
+    return _PARSERS[suffix]
+
+
+def check_supported(filename: str) -> None:
+    _parser_for(filename)
+
+
+def iter_text(filename: str, stream: BinaryIO) -> Iterator[str]:
+    return _parser_for(filename)(stream)
+
+
+def _on_alarm(signum, frame) -> None:
+    raise ParseTimeoutError('Parsing timed out')
+
+
+def init_parse_worker(memory_limit_mb: int) -> None:
+    if memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+
+def extract_to_file(filename: str, source: str, target: str, timeout: Optional[float] = None) -> int:
+    written = 0
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with open(source, 'rb') as stream, open(target, 'w', encoding='utf-8', newline='') as output:
+            for segment in iter_text(filename, stream):
+                output.write(segment)
+                written += len(segment)
+    except MemoryError as exc:
+        raise ParseError('Parsing exceeded the memory limit') from exc
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return written
+
+
+def extract_text(filename: str, data: bytes) -> str:
+    return ''.join(iter_text(filename, io.BytesIO(data))).strip()
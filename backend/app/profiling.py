@@ -0,0 +1,265 @@
+import asyncio
+import contextlib
+import hmac
+import json
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .settings import Settings
+
+PROFILE_HEADER = 'X-Profile-Token'
+ARTIFACTS = {
+    'cpu': ('cpu.folded', 'text/plain'),
+    'memory': ('memory.tracemalloc', 'application/octet-stream'),
+}
+_PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{12}-[0-9a-f]{8}$')
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float, in_flight: Callable[[], int] = lambda: 0) -> None:
+        self.interval = interval
+        self.samples = 0
+        self.peak_in_flight = 0
+        self._in_flight = in_flight
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        # Every thread is sampled: requests share the event loop thread and offload work to worker threads,
+        # so a profile is process-wide and also contains whatever concurrent requests were doing.
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.peak_in_flight = max(self.peak_in_flight, self._in_flight())
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                    frame = frame.f_back
+                stack.append(f'thread:{names.get(thread_id, thread_id)}')
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    def __init__(self, root: Path, max_reports: int) -> None:
+        self._root = root
+        self._max_reports = max_reports
+
+    def profile_dir(self, profile_id: str) -> Path:
+        return self._root / profile_id
+
+    def artifact_path(self, profile_id: str, artifact: str) -> Optional[Path]:
+        if not _PROFILE_ID.match(profile_id) or artifact not in ARTIFACTS:
+            return None
+        path = self.profile_dir(profile_id) / ARTIFACTS[artifact][0]
+        return path if path.exists() else None
+
+    def save(self, record: Dict[str, object], folded: str, snapshot: Optional[tracemalloc.Snapshot]) -> None:
+        directory = self.profile_dir(str(record['profile_id']))
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / ARTIFACTS['cpu'][0]).write_text(folded)
+        if snapshot is not None:
+            snapshot.dump(str(directory / ARTIFACTS['memory'][0]))
+        (directory / 'profile.json').write_text(json.dumps(record, indent=2))
+        self._prune()
+
+    def _prune(self) -> None:
+        directories = sorted(path for path in self._root.iterdir() if path.is_dir())
+        for path in directories[: max(0, len(directories) - self._max_reports)]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def load(self, profile_id: str) -> Optional[Dict[str, object]]:
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = self.profile_dir(profile_id) / 'profile.json'
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def list(self) -> List[Dict[str, object]]:
+        if not self._root.exists():
+            return []
+        records = []
+        for directory in sorted(self._root.iterdir(), reverse=True):
+            record = self.load(directory.name)
+            if record is not None:
+                records.append(record)
+        return records
+
+
+class ProfileCapture:
+    def __init__(self, profiler: 'RequestProfiler', profile_id: str, method: str, path: str, trigger: str) -> None:
+        self._profiler = profiler
+        self.profile_id = profile_id
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self._sampler = SamplingProfiler(profiler.settings.profiling_interval_ms / 1000, lambda: profiler.in_flight)
+        self._started_at = datetime.utcnow()
+        self._started = time.perf_counter()
+
+    def start(self) -> None:
+        self._profiler._adjust_in_flight(1)
+        self._profiler._start_tracing()
+        self._sampler.start()
+
+    def finish(self, status_code: int) -> Dict[str, object]:
+        self._sampler.stop()
+        self._profiler._adjust_in_flight(-1)
+        duration = time.perf_counter() - self._started
+        snapshot = None
+        peak = None
+        if tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+        self._profiler._stop_tracing()
+        top = []
+        if snapshot is not None:
+            for stat in snapshot.statistics('lineno')[:20]:
+                frame = stat.traceback[0]
+                top.append({'location': f'{frame.filename}:{frame.lineno}', 'size_bytes': stat.size, 'count': stat.count})
+        record: Dict[str, object] = {
+            'profile_id': self.profile_id,
+            'method': self.method,
+            'path': self.path,
+            'trigger': self.trigger,
+            'status_code': status_code,
+            'started_at': self._started_at.isoformat() + 'Z',
+            'duration_ms': round(duration * 1000, 2),
+            'cpu_samples': self._sampler.samples,
+            'interval_ms': self._profiler.settings.profiling_interval_ms,
+            'peak_traced_bytes': peak,
+            'concurrent_requests': max(0, self._sampler.peak_in_flight - 1),
+            'top_allocations': top,
+        }
+        self._profiler.store.save(record, self._sampler.folded(), snapshot)
+        return record
+
+
+class RequestProfiler:
+    def __init__(self, settings: Settings, store: ProfileStore) -> None:
+        self.settings = settings
+        self.store = store
+        self._tracing_lock = threading.Lock()
+        self._tracing = 0
+        self._owns_tracing = False
+        self._in_flight = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.settings.profiling_admin_token) or self.settings.profiling_sample_rate > 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _adjust_in_flight(self, delta: int) -> None:
+        with self._tracing_lock:
+            self._in_flight += delta
+
+    @contextlib.contextmanager
+    def track(self) -> Iterator[None]:
+        # Unprofiled requests are counted so reports show how many others ran alongside the captured one.
+        self._adjust_in_flight(1)
+        try:
+            yield
+        finally:
+            self._adjust_in_flight(-1)
+
+    def authorized(self, token: Optional[str]) -> bool:
+        expected = self.settings.profiling_admin_token
+        if not expected or token is None:
+            return False
+        return hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8'))
+
+    def trigger(self, token: Optional[str]) -> Optional[str]:
+        if self.authorized(token):
+            return 'header'
+        rate = self.settings.profiling_sample_rate
+        if rate > 0 and random.random() < rate:
+            return 'sample'
+        return None
+
+    def capture(self, method: str, path: str, trigger: str) -> ProfileCapture:
+        profile_id = f'{datetime.utcnow():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}'
+        return ProfileCapture(self, profile_id, method, path, trigger)
+
+    def _start_tracing(self) -> None:
+        # tracemalloc is process-wide, so overlapping captures share one tracing session.
+        with self._tracing_lock:
+            if self._tracing == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(self.settings.profiling_traceback_frames)
+                self._owns_tracing = True
+            self._tracing += 1
+
+    def _stop_tracing(self) -> None:
+        with self._tracing_lock:
+            self._tracing -= 1
+            if self._tracing == 0 and self._owns_tracing:
+                tracemalloc.stop()
+                self._owns_tracing = False
+
+
+class ProfilingMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware, so requests pass straight through while profiling is off.
+    def __init__(self, app: ASGIApp, profiler: RequestProfiler, paths: Iterable[str]) -> None:
+        self.app = app
+        self.profiler = profiler
+        self.paths = set(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not self.profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+        trigger = None
+        if scope['path'] in self.paths:
+            trigger = self.profiler.trigger(Headers(scope=scope).get(PROFILE_HEADER))
+        if trigger is None:
+            with self.profiler.track():
+                await self.app(scope, receive, send)
+            return
+        capture = self.profiler.capture(scope['method'], scope['path'], trigger)
+        status_code = 500
+
+        async def send_with_profile_id(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                MutableHeaders(scope=message).append('X-Profile-Id', capture.profile_id)
+            await send(message)
+
+        capture.start()
+        try:
+            # Streaming responses run inside this call, so the capture ends with the last body chunk.
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            # Snapshotting and writing run in a worker thread, which completes even if the client disconnects.
+            await asyncio.to_thread(capture.finish, status_code)
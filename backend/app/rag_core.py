@@ -1,25 +1,76 @@
 import asyncio
+import json
 import logging
+import re
+import time
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import httpx
-from qdrant_client import QdrantClient
+from grpc import RpcError
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http.exceptions import UnexpectedResponse
 from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Disabled,
     Distance,
     FieldCondition,
     Filter,
+    Fusion,
+    FusionQuery,
+    HnswConfigDiff,
+    IsEmptyCondition,
+    KeywordIndexParams,
+    KeywordIndexType,
     MatchAny,
     MatchValue,
+    Modifier,
+    PayloadField,
+    PointIdsList,
+    PayloadSchemaType,
     PointStruct,
+    Prefetch,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    ShardingMethod,
+    SparseVector,
+    SparseVectorParams,
     VectorParams,
+    VectorParamsDiff,
 )
 
+from . import metrics, sparse
+from .chunking import TextChunk, make_chunker
+from .context import ContextPacker
+from .mmr import maximal_marginal_relevance
+from .embedding_cache import EmbeddingCache, QueryEmbeddingCache, normalize_text
+from .ollama_client import OllamaClient
+from .scheduler import BULK, INTERACTIVE, OllamaScheduler, wait_for_capacity
 from .settings import Settings
+from .singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+_CHARS_PER_TOKEN = 6
+# How long to use /api/embeddings after /api/embed turned out to be missing before probing it again.
+_BATCH_EMBED_REPROBE_SECONDS = 600.0
+_COLLECTION_UNSAFE = re.compile(r'[^a-z0-9_-]')
+
+# Missing-collection and transport errors surface differently over REST and gRPC.
+QDRANT_ERRORS = (UnexpectedResponse, RpcError)
+
+_DEFAULT_SHARD_KEY = 'default'
+SPARSE_VECTOR_NAME = 'bm25'
+_PAYLOAD_INDEXES = {
+    'tenant_id': KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True),
+    'tags': PayloadSchemaType.KEYWORD,
+    'source': PayloadSchemaType.KEYWORD,
+}
+
 
 @dataclass
 class DocumentChunk:
@@ -39,52 +90,300 @@ class RAGPipeline:
     def __init__(self, settings: Settings) -> None:
         self.settings = settings
         api_key = settings.qdrant_api_key or None
-        self.client = QdrantClient(url=settings.qdrant_url, api_key=api_key)
-        self._collection_ready = False
+        if settings.qdrant_url == ':memory:':
+            # Embedded local mode, for load tests and development without a Qdrant server.
+            self.client = AsyncQdrantClient(location=':memory:')
+        else:
+            self.client = AsyncQdrantClient(
+                url=settings.qdrant_url,
+                api_key=api_key,
+                prefer_grpc=settings.qdrant_prefer_grpc,
+                grpc_port=settings.qdrant_grpc_port,
+                timeout=settings.qdrant_timeout,
+            )
+        self._ready_collections: Set[str] = set()
+        self._ready_shard_keys: Set[Tuple[str, str]] = set()
+        self._sparse_collections: Set[str] = set()
+        self._vector_size: Optional[int] = None
         self._collection_lock = asyncio.Lock()
+        self._batch_embed_unsupported_until = 0.0
+        self.ollama = OllamaClient(settings)
+        self.scheduler = OllamaScheduler(
+            settings.ollama_concurrency,
+            settings.ollama_queue_limit,
+            settings.ollama_tenant_queue_limit,
+            settings.ollama_interactive_weight,
+        )
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if settings.embed_cache_enabled:
+            self.embedding_cache = EmbeddingCache(
+                settings.data_dir / 'embedding_cache.sqlite3' if settings.embed_cache_disk_mb > 0 else None,
+                max_memory_bytes=settings.embed_cache_memory_mb * 1024 * 1024,
+                max_disk_bytes=settings.embed_cache_disk_mb * 1024 * 1024,
+            )
+        self.chunker = make_chunker(settings)
+        self.context_packer = ContextPacker(
+            max_tokens=settings.max_context_tokens,
+            max_chars=settings.max_context_chars,
+            max_overlap=settings.chunk_overlap,
+        )
+        self.query_cache: Optional[QueryEmbeddingCache] = None
+        if settings.query_cache_ttl_seconds > 0 and settings.query_cache_memory_mb > 0:
+            self.query_cache = QueryEmbeddingCache(
+                ttl_seconds=settings.query_cache_ttl_seconds,
+                max_bytes=settings.query_cache_memory_mb * 1024 * 1024,
+            )
+        self.coalescer: Optional[SingleFlight] = SingleFlight() if settings.coalesce_requests else None
+
+    async def start(self) -> None:
+        await self.ollama.start()
 
-    async def ensure_collection(self) -> None:
-        if self._collection_ready:
+    async def close(self) -> None:
+        await self.ollama.close()
+        await self.client.close()
+
+    def _collection_for(self, tenant_id: Optional[str]) -> str:
+        if self.settings.qdrant_tenant_layout == 'collection' and tenant_id:
+            return f'{self.settings.collection_name}__{_COLLECTION_UNSAFE.sub("_", tenant_id.lower())}'
+        return self.settings.collection_name
+
+    def _shard_key_for(self, tenant_id: Optional[str], writing: bool = False) -> Optional[str]:
+        if self.settings.qdrant_tenant_layout != 'shard':
+            return None
+        # Untenanted points live in a default shard; untenanted reads fan out to every shard.
+        if tenant_id:
+            return tenant_id
+        return _DEFAULT_SHARD_KEY if writing else None
+
+    def _collection_missing(self, collection: str, operation: str) -> None:
+        logger.warning('Collection %s missing during %s; it is recreated on the next write', collection, operation)
+        metrics.COLLECTION_RECREATIONS.labels(operation, metrics.tenant_label(), collection).inc()
+        self._ready_collections.discard(collection)
+        self._sparse_collections.discard(collection)
+        self._ready_shard_keys = {key for key in self._ready_shard_keys if key[0] != collection}
+
+    def _read_failed(self, collection: str, tenant_id: Optional[str], operation: str) -> None:
+        shard_key = self._shard_key_for(tenant_id)
+        if shard_key is not None and (collection, shard_key) not in self._ready_shard_keys:
+            # Reads do not create shard keys, so a tenant that has not ingested anything yet has none.
+            logger.debug('Shard key %s not readable in %s during %s', shard_key, collection, operation)
             return
+        self._collection_missing(collection, operation)
+
+    async def _prepare_collection(self, collection: str, create: bool) -> bool:
+        if await self.client.collection_exists(collection):
+            info = await self.client.get_collection(collection)
+            await self._migrate_collection(collection, info.config)
+        elif create:
+            await self._create_collection(collection)
+            info = await self.client.get_collection(collection)
+        else:
+            return False
+        await self._ensure_payload_indexes(collection, info.payload_schema or {})
+        self._check_sparse_vectors(collection, info.config)
+        self._ready_collections.add(collection)
+        return True
+
+    async def ensure_collection(self, tenant_id: Optional[str] = None) -> str:
+        collection = self._collection_for(tenant_id)
+        shard_key = self._shard_key_for(tenant_id, writing=True)
+        shard_ready = shard_key is None or (collection, shard_key) in self._ready_shard_keys
+        if collection in self._ready_collections and shard_ready:
+            return collection
         async with self._collection_lock:
-            if self._collection_ready:
-                return
-            try:
-                self.client.get_collection(self.settings.collection_name)
-                self._collection_ready = True
-                return
-            except UnexpectedResponse:
-                logger.info('Collection %s not found; creating', self.settings.collection_name)
-            vector_size = await self._embedding_dimension()
-            await asyncio.to_thread(
-                self.client.recreate_collection,
-                collection_name=self.settings.collection_name,
-                vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
+            if collection not in self._ready_collections:
+                await self._prepare_collection(collection, create=True)
+            if shard_key is not None and (collection, shard_key) not in self._ready_shard_keys:
+                try:
+                    await self.client.create_shard_key(collection, shard_key)
+                    logger.info('Shard key %s created in %s', shard_key, collection)
+                except QDRANT_ERRORS:
+                    logger.debug('Shard key %s already exists in %s', shard_key, collection)
+                self._ready_shard_keys.add((collection, shard_key))
+        return collection
+
+    async def _existing_collection(self, tenant_id: Optional[str]) -> Optional[str]:
+        # Read paths never create collections or shard keys; only ingestion does, through ensure_collection.
+        collection = self._collection_for(tenant_id)
+        if collection in self._ready_collections:
+            return collection
+        async with self._collection_lock:
+            if collection in self._ready_collections or await self._prepare_collection(collection, create=False):
+                return collection
+        return None
+
+    def _hnsw_config(self) -> Optional[HnswConfigDiff]:
+        options: Dict[str, int] = {}
+        if self.settings.qdrant_hnsw_m is not None:
+            options['m'] = self.settings.qdrant_hnsw_m
+        if self.settings.qdrant_hnsw_ef_construct is not None:
+            options['ef_construct'] = self.settings.qdrant_hnsw_ef_construct
+        if self.settings.qdrant_tenant_hnsw:
+            # Build per-tenant HNSW graphs only; unfiltered searches fall back to full scans.
+            options.update(payload_m=self.settings.qdrant_hnsw_m or 16, m=0)
+        return HnswConfigDiff(**options) if options else None
+
+    def _quantization_config(self) -> Optional[Any]:
+        always_ram = self.settings.qdrant_quantization_always_ram
+        if self.settings.qdrant_quantization == 'scalar':
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=always_ram)
+            )
+        if self.settings.qdrant_quantization == 'binary':
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=always_ram))
+        return None
+
+    def _search_params(self) -> Optional[SearchParams]:
+        quantization = None
+        if self.settings.qdrant_quantization != 'none':
+            quantization = QuantizationSearchParams(
+                rescore=self.settings.qdrant_search_rescore,
+                oversampling=self.settings.qdrant_search_oversampling,
+            )
+        if quantization is None and self.settings.qdrant_search_hnsw_ef is None:
+            return None
+        return SearchParams(hnsw_ef=self.settings.qdrant_search_hnsw_ef, quantization=quantization)
+
+    @property
+    def hybrid(self) -> bool:
+        return self.settings.retrieval_mode == 'hybrid'
+
+    def _sparse_vectors_config(self) -> Optional[Dict[str, SparseVectorParams]]:
+        if not self.hybrid:
+            return None
+        return {SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)}
+
+    def _check_sparse_vectors(self, collection: str, config: Any) -> None:
+        self._sparse_collections.discard(collection)
+        if SPARSE_VECTOR_NAME in (config.params.sparse_vectors or {}):
+            self._sparse_collections.add(collection)
+        elif self.hybrid:
+            # Qdrant cannot add a sparse vector to an existing collection; it has to be recreated and re-ingested.
+            logger.warning(
+                'Collection %s has no %s sparse vector; hybrid retrieval falls back to dense search until it is '
+                'recreated and re-ingested',
+                collection,
+                SPARSE_VECTOR_NAME,
+            )
+
+    def _uses_sparse(self, collection: str) -> bool:
+        return self.hybrid and collection in self._sparse_collections
+
+    async def _create_collection(self, collection: str) -> None:
+        logger.info('Collection %s not found; creating', collection)
+        vector_size = await self._embedding_dimension()
+        options: Dict[str, Any] = {}
+        if self.settings.qdrant_tenant_layout == 'shard':
+            options['sharding_method'] = ShardingMethod.CUSTOM
+        await self.client.create_collection(
+            collection_name=collection,
+            vectors_config=VectorParams(
+                size=vector_size,
+                distance=Distance.COSINE,
+                on_disk=self.settings.qdrant_on_disk_vectors,
+            ),
+            sparse_vectors_config=self._sparse_vectors_config(),
+            hnsw_config=self._hnsw_config(),
+            quantization_config=self._quantization_config(),
+            **options,
+        )
+        logger.info(
+            'Collection %s created (dimension=%s, quantization=%s, on_disk=%s)',
+            collection,
+            vector_size,
+            self.settings.qdrant_quantization,
+            self.settings.qdrant_on_disk_vectors,
+        )
+
+    async def _migrate_collection(self, collection: str, config: Any) -> None:
+        changes: Dict[str, Any] = {}
+        vectors = config.params.vectors
+        if isinstance(vectors, VectorParams) and bool(vectors.on_disk) != self.settings.qdrant_on_disk_vectors:
+            changes['vectors_config'] = {'': VectorParamsDiff(on_disk=self.settings.qdrant_on_disk_vectors)}
+        hnsw = self._hnsw_config()
+        if hnsw is not None:
+            current = config.hnsw_config
+            if any(getattr(current, name) != value for name, value in hnsw.dict(exclude_none=True).items()):
+                changes['hnsw_config'] = hnsw
+        wanted = self._quantization_config()
+        if wanted != config.quantization_config:
+            changes['quantization_config'] = wanted if wanted is not None else Disabled.DISABLED
+        if not changes:
+            return
+        logger.info('Migrating collection %s storage settings: %s', collection, ', '.join(sorted(changes)))
+        # Qdrant rebuilds indexes and quantized vectors in the background; searches keep working meanwhile.
+        await self.client.update_collection(collection_name=collection, **changes)
+
+    async def _ensure_payload_indexes(self, collection: str, payload_schema: Dict[str, Any]) -> None:
+        for field_name, field_schema in _PAYLOAD_INDEXES.items():
+            if field_name in payload_schema:
+                continue
+            await self.client.create_payload_index(
+                collection_name=collection,
+                field_name=field_name,
+                field_schema=field_schema,
+                wait=True,
             )
-            self._collection_ready = True
-            logger.info('Collection %s created (dimension=%s)', self.settings.collection_name, vector_size)
+            logger.info('Payload index on %s created in %s', field_name, collection)
 
     async def _embedding_dimension(self) -> int:
-        vector = await self.embed_text('dimension probe')
-        return len(vector)
+        if self._vector_size is None:
+            vector = await self.embed_text('dimension probe')
+            self._vector_size = len(vector)
+        return self._vector_size
 
     async def embed_text(self, text: str) -> List[float]:
-        payload = {'model': self.settings.embed_model, 'prompt': text, 'input': text}
-        url = f"{self.settings.ollama_host}/api/embeddings"
+        if self.embedding_cache is not None:
+            cached = await self.embedding_cache.get(self.settings.embed_model, text)
+            if cached is not None:
+                return cached
+        vector = await self._request_embedding(text)
+        if self.embedding_cache is not None:
+            await self.embedding_cache.put(self.settings.embed_model, text, vector)
+        return vector
+
+    @staticmethod
+    def _query_key(query: str) -> str:
+        return normalize_text(query).casefold()
+
+    async def embed_query(self, query: str) -> List[float]:
+        if self.coalescer is None:
+            return await self._embed_query(query)
+        key = (self.settings.embed_model, self._query_key(query))
+        return await self.coalescer.run('embed_query', key, lambda: self._embed_query(query))
+
+    async def _embed_query(self, query: str) -> List[float]:
+        if self.query_cache is None:
+            return await self._request_embedding(query)
+        cached = self.query_cache.get(self.settings.embed_model, query)
+        if cached is not None:
+            return cached
+        vector = await self._request_embedding(query)
+        self.query_cache.put(self.settings.embed_model, query, vector)
+        return vector
+
+    async def _request_embedding(self, text: str, priority: str = INTERACTIVE) -> List[float]:
+        payload = {
+            'model': self.settings.embed_model,
+            'prompt': text,
+            'input': text,
+            'keep_alive': self.settings.ollama_keep_alive,
+        }
         max_attempts = 5
         backoff = 1.0
 
+        model = self.settings.embed_model
         for attempt in range(1, max_attempts + 1):
-            async with httpx.AsyncClient(timeout=self.settings.ollama_timeout) as client:
-                try:
-                    response = await client.post(url, json=payload)
-                    response.raise_for_status()
-                except httpx.HTTPStatusError as exc:
-                    content_type = exc.response.headers.get('content-type', '')
-                    detail = exc.response.json() if content_type.startswith('application/json') else exc.response.text
-                    logger.error('Embedding request failed: %s', detail)
-                    raise ValueError(f'Embedding request failed: {detail}') from exc
-                data = response.json()
+            async with self.scheduler.slot(priority):
+                with metrics.stage('ollama_embed', model):
+                    response = await self.ollama.post('/api/embeddings', payload, self.ollama.embed_timeout)
+            try:
+                response.raise_for_status()
+            except httpx.HTTPStatusError as exc:
+                detail = self._error_detail(exc)
+                logger.error('Embedding request failed: %s', detail)
+                raise ValueError(f'Embedding request failed: {detail}') from exc
+            data = response.json()
 
             embedding = data.get('embedding') if isinstance(data, dict) else None
             if embedding and len(embedding) > 0:
@@ -100,36 +399,157 @@ class RAGPipeline:
                     raise ValueError(f'Embedding error from Ollama: {data["error"]}')
 
             logger.warning('Empty embedding response (attempt %s/%s): %s', attempt, max_attempts, data)
+            metrics.EMPTY_EMBEDDINGS.labels(metrics.tenant_label(), model).inc()
             if attempt < max_attempts:
+                metrics.OLLAMA_RETRIES.labels('embed', metrics.tenant_label(), model).inc()
                 await asyncio.sleep(backoff)
                 backoff = min(backoff * 2, 8.0)
 
         logger.error('Embedding service returned empty vectors after %s attempts', max_attempts)
         raise ValueError('Embedding response missing "embedding" field')
 
-    async def upsert_chunks(self, chunks: List[DocumentChunk]) -> int:
-        await self.ensure_collection()
+    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if self.embedding_cache is None:
+            return await self._embed_uncached(texts)
+        model = self.settings.embed_model
+        vectors = await self.embedding_cache.get_many(model, texts)
+        missing = [index for index, vector in enumerate(vectors) if vector is None]
+        if missing:
+            unique_texts = list(dict.fromkeys(texts[index] for index in missing))
+            fresh = dict(zip(unique_texts, await self._embed_uncached(unique_texts)))
+            for index in missing:
+                vectors[index] = fresh[texts[index]]
+            await self.embedding_cache.put_many(model, fresh.items())
+        return vectors
+
+    async def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        batch_size = max(1, self.settings.embed_batch_size)
+        batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+        semaphore = asyncio.Semaphore(max(1, self.settings.embed_concurrency))
+
+        async def run(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self._embed_batch(batch)
+
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    @property
+    def _batch_embed_supported(self) -> bool:
+        return time.monotonic() >= self._batch_embed_unsupported_until
+
+    async def load_embed_model(self) -> None:
+        # Bypasses the embedding cache so Ollama really loads the model, with the same /api/embeddings fallback.
+        with wait_for_capacity():
+            await self._embed_batch(['warm-up'])
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if not self._batch_embed_supported:
+            return [await self._request_embedding(text, BULK) for text in texts]
+        model = self.settings.embed_model
+        payload = {'model': model, 'input': texts, 'keep_alive': self.settings.ollama_keep_alive}
+        max_attempts = 5
+        backoff = 1.0
+
+        for attempt in range(1, max_attempts + 1):
+            async with self.scheduler.slot(BULK):
+                with metrics.stage('ollama_embed', model):
+                    response = await self.ollama.post('/api/embed', payload, self.ollama.embed_timeout)
+            try:
+                response.raise_for_status()
+            except httpx.HTTPStatusError as exc:
+                if self._endpoint_missing(exc):
+                    logger.info(
+                        'Ollama /api/embed unavailable; using /api/embeddings for %.0fs', _BATCH_EMBED_REPROBE_SECONDS
+                    )
+                    self._batch_embed_unsupported_until = time.monotonic() + _BATCH_EMBED_REPROBE_SECONDS
+                    return [await self._request_embedding(text, BULK) for text in texts]
+                detail = self._error_detail(exc)
+                logger.error('Batch embedding request failed: %s', detail)
+                raise ValueError(f'Embedding request failed: {detail}') from exc
+            data = response.json()
+
+            embeddings = data.get('embeddings') if isinstance(data, dict) else None
+            if embeddings and len(embeddings) == len(texts) and all(embeddings):
+                metrics.count_tokens({'prompt_eval_count': data.get('prompt_eval_count')}, model)
+                return embeddings
+
+            if isinstance(data, dict) and 'error' in data:
+                logger.error('Embedding error from Ollama: %s', data['error'])
+                raise ValueError(f'Embedding error from Ollama: {data["error"]}')
+
+            logger.warning(
+                'Empty batch embedding response (attempt %s/%s, batch=%s)', attempt, max_attempts, len(texts)
+            )
+            metrics.EMPTY_EMBEDDINGS.labels(metrics.tenant_label(), model).inc()
+            if attempt < max_attempts:
+                metrics.OLLAMA_RETRIES.labels('embed', metrics.tenant_label(), model).inc()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 8.0)
+
+        logger.error('Embedding service returned empty batch vectors after %s attempts', max_attempts)
+        raise ValueError('Embedding response missing "embeddings" field')
+
+    @staticmethod
+    def _error_detail(exc: httpx.HTTPStatusError) -> Any:
+        content_type = exc.response.headers.get('content-type', '')
+        return exc.response.json() if content_type.startswith('application/json') else exc.response.text
+
+    @classmethod
+    def _endpoint_missing(cls, exc: httpx.HTTPStatusError) -> bool:
+        # Ollama also answers 404 for unknown or still-downloading models, but with a JSON error body.
+        status = exc.response.status_code
+        if status in {405, 501}:
+            return True
+        return status == 404 and not isinstance(cls._error_detail(exc), dict)
+
+    async def upsert_chunks(
+        self,
+        chunks: List[DocumentChunk],
+        on_embedded: Optional[Callable[[int], None]] = None,
+    ) -> int:
         valid_chunks: List[DocumentChunk] = [chunk for chunk in chunks if chunk.text.strip()]
         if not valid_chunks:
             return 0
-        vectors: List[List[float]] = []
-        for chunk in valid_chunks:
-            vectors.append(await self.embed_text(chunk.text))
-        points = [
-            PointStruct(
-                id=chunk.chunk_id,
-                vector=vector,
-                payload={**chunk.metadata, 'text': chunk.text},
-            )
-            for chunk, vector in zip(valid_chunks, vectors)
-        ]
-        await asyncio.to_thread(
-            self.client.upsert,
-            collection_name=self.settings.collection_name,
-            wait=True,
-            points=points,
-        )
-        return len(points)
+        embed_model = self.settings.embed_model
+        with metrics.stage('embed', embed_model):
+            vectors = await self.embed_texts([chunk.text for chunk in valid_chunks])
+        metrics.CHUNKS.labels('embedded', metrics.tenant_label(), embed_model).inc(len(vectors))
+        if on_embedded is not None:
+            on_embedded(len(vectors))
+        chunks_by_tenant: Dict[Optional[str], List[Tuple[DocumentChunk, List[float]]]] = {}
+        for chunk, vector in zip(valid_chunks, vectors):
+            chunks_by_tenant.setdefault(chunk.metadata.get('tenant_id'), []).append((chunk, vector))
+        upserted = 0
+        for tenant_id, embedded in chunks_by_tenant.items():
+            collection = await self.ensure_collection(tenant_id)
+            points = [
+                PointStruct(
+                    id=chunk.chunk_id,
+                    vector=self._point_vector(collection, chunk.text, vector),
+                    payload={**chunk.metadata, 'text': chunk.text},
+                )
+                for chunk, vector in embedded
+            ]
+            with metrics.stage('upsert', embed_model, tenant_id):
+                await self.client.upsert(
+                    collection_name=collection,
+                    wait=True,
+                    points=points,
+                    shard_key_selector=self._shard_key_for(tenant_id, writing=True),
+                )
+            metrics.CHUNKS.labels('upserted', metrics.tenant_label(tenant_id), embed_model).inc(len(points))
+            upserted += len(points)
+        return upserted
+
+    def _point_vector(self, collection: str, text: str, vector: List[float]) -> Any:
+        if not self._uses_sparse(collection):
+            return vector
+        indices, values = sparse.document_vector(text, self.settings.chunk_size / _CHARS_PER_TOKEN)
+        # Token-less chunks still get an empty sparse vector, or existing_chunks would flag them for reindexing forever.
+        return {'': vector, SPARSE_VECTOR_NAME: SparseVector(indices=indices, values=values)}
 
     async def retrieve(
         self,
@@ -137,24 +557,62 @@ class RAGPipeline:
         top_k: int,
         tenant_id: Optional[str] = None,
         tags: Optional[List[str]] = None,
+        mmr_lambda: Optional[float] = None,
+    ) -> List[RetrievedChunk]:
+        if self.coalescer is None:
+            return await self._retrieve(query, top_k, tenant_id, tags, mmr_lambda)
+        key = (self._query_key(query), tenant_id, tuple(sorted(set(tags or []))), top_k, mmr_lambda)
+        retrieved = await self.coalescer.run(
+            'retrieve', key, lambda: self._retrieve(query, top_k, tenant_id, tags, mmr_lambda)
+        )
+        return list(retrieved)
+
+    async def _retrieve(
+        self,
+        query: str,
+        top_k: int,
+        tenant_id: Optional[str],
+        tags: Optional[List[str]],
+        mmr_lambda: Optional[float],
     ) -> List[RetrievedChunk]:
-        await self.ensure_collection()
         if not query.strip():
             return []
-        query_vector = await self.embed_text(query)
+        collection = await self._existing_collection(tenant_id)
+        if collection is None:
+            return []
+        embed_model = self.settings.embed_model
+        with metrics.stage('embed_query', embed_model, tenant_id):
+            query_vector = await self.embed_query(query)
         query_filter = self._build_filter(tenant_id, tags)
+        if mmr_lambda is None and self.settings.mmr_enabled:
+            mmr_lambda = self.settings.mmr_lambda
+        limit = top_k if mmr_lambda is None else top_k * max(1, self.settings.mmr_fetch_multiplier)
+        with_vectors = mmr_lambda is not None
         try:
-            results = await asyncio.to_thread(
-                self.client.search,
-                collection_name=self.settings.collection_name,
-                query_vector=query_vector,
-                limit=top_k,
-                query_filter=query_filter,
-            )
-        except UnexpectedResponse:
-            logger.warning('Collection %s missing during search; recreating', self.settings.collection_name)
-            self._collection_ready = False
+            with metrics.stage('search', embed_model, tenant_id):
+                if self._uses_sparse(collection):
+                    results = await self._hybrid_search(
+                        collection, query, query_vector, query_filter, limit, tenant_id, with_vectors
+                    )
+                else:
+                    results = await self.client.search(
+                        collection_name=collection,
+                        query_vector=query_vector,
+                        limit=limit,
+                        query_filter=query_filter,
+                        search_params=self._search_params(),
+                        with_vectors=with_vectors,
+                        shard_key_selector=self._shard_key_for(tenant_id),
+                    )
+        except QDRANT_ERRORS:
+            self._read_failed(collection, tenant_id, 'search')
             return []
+        if mmr_lambda is not None and len(results) > top_k:
+            with metrics.stage('mmr', embed_model, tenant_id):
+                vectors = [self._dense_vector(point.vector) for point in results]
+                selected = maximal_marginal_relevance(query_vector, vectors, top_k, mmr_lambda)
+            results = [results[index] for index in selected]
+        metrics.CHUNKS.labels('retrieved', metrics.tenant_label(tenant_id), embed_model).inc(len(results))
         retrieved: List[RetrievedChunk] = []
         for point in results:
             payload = point.payload or {}
@@ -168,41 +626,134 @@ class RAGPipeline:
             )
         return retrieved
 
+    async def _hybrid_search(
+        self,
+        collection: str,
+        query: str,
+        query_vector: List[float],
+        query_filter: Optional[Filter],
+        top_k: int,
+        tenant_id: Optional[str],
+        with_vectors: bool = False,
+    ) -> List[Any]:
+        candidates = top_k * max(1, self.settings.hybrid_prefetch_multiplier)
+        prefetch = [
+            Prefetch(query=query_vector, filter=query_filter, params=self._search_params(), limit=candidates),
+        ]
+        indices, values = sparse.query_vector(query)
+        if indices:
+            prefetch.append(
+                Prefetch(
+                    query=SparseVector(indices=indices, values=values),
+                    using=SPARSE_VECTOR_NAME,
+                    filter=query_filter,
+                    limit=candidates,
+                )
+            )
+        # Reciprocal rank fusion runs inside Qdrant, so both searches share one round trip.
+        response = await self.client.query_points(
+            collection_name=collection,
+            prefetch=prefetch,
+            query=FusionQuery(fusion=Fusion.RRF),
+            query_filter=query_filter,
+            limit=top_k,
+            with_vectors=[''] if with_vectors else False,
+            shard_key_selector=self._shard_key_for(tenant_id),
+        )
+        return response.points
+
+    @staticmethod
+    def _dense_vector(vector: Any) -> List[float]:
+        if isinstance(vector, dict):
+            return vector['']
+        return vector
+
+    async def existing_chunks(self, source: str, tenant_id: Optional[str]) -> Dict[str, Optional[List[str]]]:
+        # Maps point IDs to their tags; None marks points that must be upserted again because they lack the sparse vector.
+        collection = await self._existing_collection(tenant_id)
+        if collection is None:
+            return {}
+        sparse_vectors = self._uses_sparse(collection)
+        conditions: List[Any] = [FieldCondition(key='source', match=MatchValue(value=source))]
+        if tenant_id:
+            conditions.append(FieldCondition(key='tenant_id', match=MatchValue(value=tenant_id)))
+        else:
+            conditions.append(IsEmptyCondition(is_empty=PayloadField(key='tenant_id')))
+        found: Dict[str, Optional[List[str]]] = {}
+        offset = None
+        try:
+            while True:
+                points, offset = await self.client.scroll(
+                    collection_name=collection,
+                    scroll_filter=Filter(must=conditions),
+                    limit=1024,
+                    offset=offset,
+                    with_payload=['tags'],
+                    with_vectors=[SPARSE_VECTOR_NAME] if sparse_vectors else False,
+                    shard_key_selector=self._shard_key_for(tenant_id, writing=True),
+                )
+                for point in points:
+                    if sparse_vectors and SPARSE_VECTOR_NAME not in (point.vector or {}):
+                        found[str(point.id)] = None
+                    else:
+                        found[str(point.id)] = list((point.payload or {}).get('tags') or [])
+                if offset is None:
+                    break
+        except QDRANT_ERRORS:
+            self._read_failed(collection, tenant_id, 'scroll')
+            return {}
+        return found
+
+    async def delete_chunks(self, chunk_ids: List[str], tenant_id: Optional[str] = None) -> int:
+        if not chunk_ids:
+            return 0
+        await self.client.delete(
+            collection_name=self._collection_for(tenant_id),
+            points_selector=PointIdsList(points=chunk_ids),
+            wait=True,
+            shard_key_selector=self._shard_key_for(tenant_id, writing=True),
+        )
+        return len(chunk_ids)
+
+    async def set_chunk_tags(self, chunk_ids: List[str], tags: List[str], tenant_id: Optional[str] = None) -> None:
+        if not chunk_ids:
+            return
+        await self.client.set_payload(
+            collection_name=self._collection_for(tenant_id),
+            payload={'tags': tags},
+            points=chunk_ids,
+            wait=True,
+            shard_key_selector=self._shard_key_for(tenant_id, writing=True),
+        )
+
     async def count_segments(self, tenant_id: str) -> int:
-        await self.ensure_collection()
+        collection = await self._existing_collection(tenant_id)
+        if collection is None:
+            return 0
         query_filter = self._build_filter(tenant_id, None)
         try:
-            response = await asyncio.to_thread(
-                self.client.count,
-                collection_name=self.settings.collection_name,
+            response = await self.client.count(
+                collection_name=collection,
                 count_filter=query_filter,
                 exact=True,
+                shard_key_selector=self._shard_key_for(tenant_id),
             )
-        except UnexpectedResponse:
-            logger.warning('Collection %s missing during count; recreating', self.settings.collection_name)
-            self._collection_ready = False
+        except QDRANT_ERRORS:
+            self._read_failed(collection, tenant_id, 'count')
             return 0
         if isinstance(response, dict):
             return int(response.get('count', 0))
         return int(getattr(response, 'count', 0))
 
     def split_text(self, text: str) -> List[str]:
-        normalized = text.replace('\r\n', '\n').strip()
-        if not normalized:
-            return []
-        chunk_size = self.settings.chunk_size
-        overlap = min(self.settings.chunk_overlap, chunk_size - 1 if chunk_size > 1 else 0)
-        chunks: List[str] = []
-        start = 0
-        while start < len(normalized):
-            end = start + chunk_size
-            chunk = normalized[start:end]
-            if chunk.strip():
-                chunks.append(chunk.strip())
-            if end >= len(normalized):
-                break
-            start = max(0, end - overlap)
-        return chunks
+        return list(self.split_stream([text]))
+
+    def split_stream(self, segments: Iterable[str]) -> Iterator[str]:
+        for chunk in self.chunk_stream(segments):
+            yield chunk.text
+
+    def chunk_stream(self, segments: Iterable[str]) -> Iterator[TextChunk]:
+        return self.chunker.chunks(segments)
 
     def _build_filter(
         self,
@@ -218,12 +769,12 @@ class RAGPipeline:
             return Filter(must=conditions)
         return None
 
-    async def generate_answer(
+    def build_prompt(
         self,
         query: str,
         retrieved: List[RetrievedChunk],
         conversation: Optional[List[Dict[str, str]]] = None,
-    ) -> Tuple[str, List[Dict[str, Any]]]:
+    ) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
         context_text, sources = self._format_context(retrieved)
         user_prompt = (
             'Answer the question using the provided context. '
@@ -237,51 +788,99 @@ class RAGPipeline:
             for item in conversation:
                 role = item.get('role')
                 content = item.get('content')
-                if role in {'user', 'assistant'} and content:
+                if role in {'system', 'user', 'assistant'} and content:
                     messages.append({'role': role, 'content': content})
         messages.append({'role': 'user', 'content': user_prompt})
+        return messages, sources
 
-        payload = {
+    def _chat_payload(self, messages: List[Dict[str, str]], stream: bool) -> Dict[str, Any]:
+        return {
             'model': self.settings.llm_model,
             'messages': messages,
-            'stream': False,
+            'stream': stream,
+            'keep_alive': self.settings.ollama_keep_alive,
             'options': {'temperature': self.settings.temperature},
         }
-        url = f"{self.settings.ollama_host}/api/chat"
-        async with httpx.AsyncClient(timeout=self.settings.ollama_timeout) as client:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
-            data = response.json()
+
+    async def generate_answer(
+        self,
+        query: str,
+        retrieved: List[RetrievedChunk],
+        conversation: Optional[List[Dict[str, str]]] = None,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        messages, sources = self.build_prompt(query, retrieved, conversation)
+        if self.coalescer is None or not self.settings.coalesce_generation:
+            return await self._generate(messages), sources
+        # Identical prompts (same question, context and history) share one generation.
+        key = json.dumps(messages, sort_keys=True)
+        return await self.coalescer.run('generate', key, lambda: self._generate(messages)), sources
+
+    async def _generate(self, messages: List[Dict[str, str]]) -> str:
+        payload = self._chat_payload(messages, stream=False)
+        model = self.settings.llm_model
+        async with self.scheduler.slot(INTERACTIVE):
+            with metrics.stage('generate', model):
+                response = await self.ollama.post('/api/chat', payload, self.ollama.chat_timeout)
+                response.raise_for_status()
+                data = response.json()
+        metrics.count_tokens(data, model)
         message = data.get('message', {})
-        answer = message.get('content', '').strip()
-        return answer, sources
+        return message.get('content', '').strip()
+
+    async def summarize_history(self, summary: str, messages: List[Dict[str, Any]]) -> str:
+        transcript = '\n'.join(f'{item["role"]}: {item["content"]}' for item in messages)
+        prompt = (
+            'Update the running summary of a conversation with the new messages below. '
+            'Keep facts, names, decisions and open questions; drop pleasantries. '
+            f'Answer with the summary only, in at most {self.settings.session_summary_tokens} words.\n\n'
+            f'Current summary:\n{summary or "(empty)"}\n\nNew messages:\n{transcript}'
+        )
+        payload = self._chat_payload([{'role': 'user', 'content': prompt}], stream=False)
+        async with self.scheduler.slot(BULK):
+            response = await self.ollama.post('/api/chat', payload, self.ollama.chat_timeout)
+        response.raise_for_status()
+        return response.json().get('message', {}).get('content', '').strip()
+
+    async def stream_chat(self, messages: List[Dict[str, str]]) -> AsyncIterator[Dict[str, Any]]:
+        payload = self._chat_payload(messages, stream=True)
+        model = self.settings.llm_model
+        started = time.perf_counter()
+        try:
+            async with self.scheduler.slot(INTERACTIVE), self.ollama.stream(
+                '/api/chat', payload, self.ollama.chat_timeout
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if 'error' in data:
+                        logger.error('Chat error from Ollama: %s', data['error'])
+                        raise ValueError(f'Chat error from Ollama: {data["error"]}')
+                    if data.get('done'):
+                        metrics.count_tokens(data, model)
+                    yield data
+                    if data.get('done'):
+                        return
+        finally:
+            # Time spent by the consumer between tokens is included, as it is for the client.
+            metrics.observe('generate', time.perf_counter() - started, model)
 
     def _format_context(self, retrieved: List[RetrievedChunk]) -> Tuple[str, List[Dict[str, Any]]]:
         if not retrieved:
             return 'No supporting documents available.', []
-        max_chars = self.settings.max_context_chars
-        used = 0
-        context_lines: List[str] = []
-        sources: List[Dict[str, Any]] = []
-        for index, chunk in enumerate(retrieved, start=1):
-            text = chunk.text.strip()
-            if not text:
-                continue
-            remaining = max_chars - used
-            if remaining <= 0:
-                break
-            snippet = text[:remaining]
-            source_name = chunk.metadata.get('source', 'unknown')
-            context_lines.append(f'[Source {index}] {source_name}\n{snippet}\n')
-            used += len(snippet)
-            sources.append(
-                {
-                    'source': source_name,
-                    'score': chunk.score,
-                    'text': snippet,
-                    'chunk_id': chunk.metadata.get('chunk_id'),
-                }
-            )
-        if not context_lines:
+        spans, included = self.context_packer.pack(retrieved)
+        sources: List[Dict[str, Any]] = [
+            {
+                'source': chunk.metadata.get('source', 'unknown'),
+                'score': chunk.score,
+                'text': chunk.text.strip(),
+                'chunk_id': chunk.metadata.get('chunk_id'),
+            }
+            for chunk in included
+        ]
+        if not spans:
             return 'No supporting documents available.', sources
-        return '\n'.join(context_lines), sources
+        return self.context_packer.render(spans), sources
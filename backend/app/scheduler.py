@@ -0,0 +1,174 @@
+import asyncio
+import contextlib
+import math
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional
+
+from . import metrics
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITIES = (INTERACTIVE, BULK)
+
+_MAX_RETRY_AFTER = 120
+_patient: ContextVar[bool] = ContextVar('ollama_wait_for_capacity', default=False)
+
+
+class OllamaBusyError(RuntimeError):
+    def __init__(self, priority: str, retry_after: int) -> None:
+        super().__init__(f'Ollama is at capacity ({priority} queue is full); retry in {retry_after}s')
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+@contextlib.contextmanager
+def wait_for_capacity() -> Iterator[None]:
+    # Background work (ingest jobs, session summaries) has nobody to send a 429 to, so it queues instead.
+    token = _patient.set(True)
+    try:
+        yield
+    finally:
+        _patient.reset(token)
+
+
+class OllamaScheduler:
+    def __init__(
+        self,
+        concurrency: int,
+        queue_limit: int,
+        tenant_queue_limit: int,
+        interactive_weight: int = 4,
+    ) -> None:
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.tenant_queue_limit = tenant_queue_limit
+        self.interactive_weight = max(1, interactive_weight)
+        self._active = 0
+        # One FIFO per tenant and priority; tenants are served round-robin in insertion order.
+        self._queues: Dict[str, 'OrderedDict[str, Deque[asyncio.Future]]'] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        self._interactive_streak = 0
+        self._hold_seconds = {priority: 1.0 for priority in PRIORITIES}
+        self.granted = {priority: 0 for priority in PRIORITIES}
+        self.rejected = {priority: 0 for priority in PRIORITIES}
+
+    @property
+    def enabled(self) -> bool:
+        return self.concurrency > 0
+
+    def admit(self, priority: str, tenant: Optional[str] = None) -> None:
+        if not self.enabled or _patient.get() or self._active < self.concurrency and not any(self._waiting.values()):
+            return
+        tenant = metrics.tenant_label(tenant)
+        queued = self._queues[priority].get(tenant)
+        if self._waiting[priority] >= self.queue_limit or len(queued or ()) >= self.tenant_queue_limit:
+            self.rejected[priority] += 1
+            metrics.OLLAMA_REJECTIONS.labels(priority, tenant).inc()
+            raise OllamaBusyError(priority, self.retry_after(priority))
+
+    def retry_after(self, priority: str) -> int:
+        ahead = self._waiting[INTERACTIVE] + (self._waiting[BULK] if priority == BULK else 0)
+        estimate = self._hold_seconds[priority] * (ahead + 1) / max(1, self.concurrency)
+        return max(1, min(_MAX_RETRY_AFTER, math.ceil(estimate)))
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: str) -> AsyncIterator[None]:
+        if not self.enabled:
+            yield
+            return
+        await self._acquire(priority)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            held = time.perf_counter() - started
+            self._hold_seconds[priority] = 0.8 * self._hold_seconds[priority] + 0.2 * held
+            self._active -= 1
+            metrics.OLLAMA_ACTIVE.set(self._active)
+            self._dispatch()
+
+    async def _acquire(self, priority: str) -> None:
+        if self._active < self.concurrency and not any(self._waiting.values()):
+            self._grant(priority)
+            return
+        self.admit(priority)
+        tenant = metrics.tenant_label()
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(tenant, deque()).append(waiter)
+        self._set_waiting(priority, 1)
+        started = time.perf_counter()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just before the caller gave up: hand the slot on.
+                self._active -= 1
+                metrics.OLLAMA_ACTIVE.set(self._active)
+                self._dispatch()
+            else:
+                self._discard(priority, tenant, waiter)
+            raise
+        finally:
+            metrics.observe('ollama_queue', time.perf_counter() - started)
+
+    def _grant(self, priority: str) -> None:
+        self._active += 1
+        self.granted[priority] += 1
+        metrics.OLLAMA_ACTIVE.set(self._active)
+
+    def _set_waiting(self, priority: str, delta: int) -> None:
+        self._waiting[priority] += delta
+        metrics.OLLAMA_QUEUE_DEPTH.labels(priority).set(self._waiting[priority])
+
+    def _discard(self, priority: str, tenant: str, waiter: asyncio.Future) -> None:
+        queue = self._queues[priority].get(tenant)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[priority][tenant]
+        self._set_waiting(priority, -1)
+
+    def _next_priority(self) -> Optional[str]:
+        interactive, bulk = self._waiting[INTERACTIVE], self._waiting[BULK]
+        # Interactive calls go first, but every `interactive_weight` grants one waiting bulk call is let through.
+        if interactive and not bulk:
+            self._interactive_streak = 0
+            return INTERACTIVE
+        if interactive and self._interactive_streak < self.interactive_weight:
+            self._interactive_streak += 1
+            return INTERACTIVE
+        self._interactive_streak = 0
+        return BULK if bulk else None
+
+    def _dispatch(self) -> None:
+        while self._active < self.concurrency:
+            priority = self._next_priority()
+            if priority is None:
+                return
+            tenants = self._queues[priority]
+            tenant, queue = next(iter(tenants.items()))
+            waiter = queue.popleft()
+            if queue:
+                tenants.move_to_end(tenant)
+            else:
+                del tenants[tenant]
+            self._set_waiting(priority, -1)
+            if waiter.cancelled():
+                continue
+            self._grant(priority)
+            waiter.set_result(None)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'concurrency': self.concurrency,
+            'active': self._active,
+            'waiting': dict(self._waiting),
+            'waiting_tenants': {priority: len(self._queues[priority]) for priority in PRIORITIES},
+            'granted': dict(self.granted),
+            'rejected': dict(self.rejected),
+        }
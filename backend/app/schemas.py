@@ -15,6 +15,9 @@ class ChatRequest(BaseModel):
     tenant_id: Optional[str] = None
     tags: Optional[List[str]] = None
     conversation: Optional[List[ChatMessage]] = None
+    stream: bool = False
+    session_id: Optional[str] = None
+    mmr_lambda: Optional[float] = Field(None, ge=0, le=1)
 
 
 class SourceChunk(BaseModel):
@@ -27,14 +30,84 @@ class SourceChunk(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
     sources: List[SourceChunk]
+    session_id: Optional[str] = None
+
+
+class SessionCreate(BaseModel):
+    tenant_id: Optional[str] = None
+
+
+class SessionMessage(BaseModel):
+    role: str
+    content: str
+
+
+class SessionRead(BaseModel):
+    session_id: str
+    tenant_id: Optional[str] = None
+    summary: str
+    messages: List[SessionMessage]
+    compacted_messages: int
+    created_at: datetime
+    updated_at: datetime
 
 
 class IngestResponse(BaseModel):
     files_processed: int
     chunks_indexed: int
+    chunks_unchanged: int = 0
+    chunks_deleted: int = 0
     skipped: Dict[str, str]
 
 
+class IngestJobRead(BaseModel):
+    job_id: str
+    status: str
+    tenant_id: Optional[str] = None
+    tags: List[str] = Field(default_factory=list)
+    files: List[str]
+    files_total: int
+    files_parsed: int
+    chunks_embedded: int
+    chunks_upserted: int
+    chunks_unchanged: int = 0
+    chunks_deleted: int = 0
+    errors: Dict[str, str]
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    created_at: datetime
+    updated_at: datetime
+
+
+class IngestJobListResponse(BaseModel):
+    jobs: List[IngestJobRead]
+
+
+class ProfileAllocation(BaseModel):
+    location: str
+    size_bytes: int
+    count: int
+
+
+class ProfileRead(BaseModel):
+    profile_id: str
+    method: str
+    path: str
+    trigger: str
+    status_code: int
+    started_at: datetime
+    duration_ms: float
+    cpu_samples: int
+    interval_ms: float
+    peak_traced_bytes: Optional[int] = None
+    concurrent_requests: int = 0
+    top_allocations: List[ProfileAllocation]
+
+
+class ProfileListResponse(BaseModel):
+    profiles: List[ProfileRead]
+
+
 class DebugSearchResponse(BaseModel):
     query: str
     results: List[Dict[str, Any]]
@@ -68,6 +141,9 @@ class TenantRead(TenantBase):
 
 class TenantListResponse(BaseModel):
     tenants: List[TenantRead]
+    total: int
+    offset: int
+    limit: int
 
 
 class TenantSegmentsResponse(BaseModel):
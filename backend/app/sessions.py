@@ -0,0 +1,245 @@
+import asyncio
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from .context import estimate_tokens, truncate_to_tokens
+from .rag_core import RAGPipeline
+from .scheduler import wait_for_capacity
+from .settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+class SessionStore:
+    def __init__(self, root: Path) -> None:
+        self._root = root
+        self._lock_path = root / 'sessions.lock'
+
+    def _path(self, session_id: str) -> Path:
+        return self._root / f'{session_id}.json'
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        # flock serializes read-modify-write cycles across uvicorn workers, not just coroutines.
+        self._root.mkdir(parents=True, exist_ok=True)
+        with open(self._lock_path, 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _write(self, record: Dict[str, object]) -> None:
+        path = self._path(str(record['session_id']))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(record, indent=2))
+        os.replace(tmp_path, path)
+
+    def _read(self, session_id: str) -> Optional[Dict[str, object]]:
+        path = self._path(session_id)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    async def save(self, record: Dict[str, object]) -> None:
+        record['updated_at'] = _now()
+        await asyncio.to_thread(self._write, record)
+
+    async def load(self, session_id: str) -> Optional[Dict[str, object]]:
+        if not self._safe_id(session_id):
+            return None
+        return await asyncio.to_thread(self._read, session_id)
+
+    async def update(
+        self, session_id: str, change: Callable[[Dict[str, object]], None]
+    ) -> Optional[Dict[str, object]]:
+        if not self._safe_id(session_id):
+            return None
+
+        def apply() -> Optional[Dict[str, object]]:
+            with self._locked():
+                record = self._read(session_id)
+                if record is None:
+                    return None
+                change(record)
+                record['updated_at'] = _now()
+                self._write(record)
+                return record
+
+        return await asyncio.to_thread(apply)
+
+    async def delete(self, session_id: str) -> bool:
+        if not self._safe_id(session_id):
+            return False
+
+        def remove() -> bool:
+            with self._locked():
+                try:
+                    self._path(session_id).unlink()
+                except FileNotFoundError:
+                    return False
+                return True
+
+        return await asyncio.to_thread(remove)
+
+    async def prune(self, max_age_hours: float) -> int:
+        cutoff = time.time() - max_age_hours * 3600
+
+        def remove_expired() -> int:
+            if not self._root.exists():
+                return 0
+            removed = 0
+            with self._locked():
+                for path in self._root.glob('*.json'):
+                    try:
+                        if path.stat().st_mtime < cutoff:
+                            path.unlink()
+                            removed += 1
+                    except FileNotFoundError:
+                        continue
+            return removed
+
+        return await asyncio.to_thread(remove_expired)
+
+    @staticmethod
+    def _safe_id(session_id: str) -> bool:
+        try:
+            return str(uuid.UUID(session_id)) == session_id
+        except ValueError:
+            return False
+
+
+class ChatSessionManager:
+    def __init__(self, store: SessionStore, settings: Settings, pipeline: Callable[[], RAGPipeline]) -> None:
+        self.store = store
+        self.settings = settings
+        self._pipeline = pipeline
+        self._summarizing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._pruner: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.settings.session_ttl_hours > 0:
+            self._pruner = asyncio.create_task(self._prune_periodically(), name='session-pruner')
+
+    async def stop(self) -> None:
+        tasks = set(self._tasks) | ({self._pruner} if self._pruner else set())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._pruner = None
+
+    async def _prune_periodically(self) -> None:
+        ttl = self.settings.session_ttl_hours
+        while True:
+            try:
+                removed = await self.store.prune(ttl)
+                if removed:
+                    logger.info('Pruned %d chat sessions idle for more than %sh', removed, ttl)
+            except Exception as exc:  # pragma: no cover
+                logger.warning('Pruning chat sessions failed: %s', exc)
+            await asyncio.sleep(min(3600.0, ttl * 3600 / 4))
+
+    async def create(self, tenant_id: Optional[str]) -> Dict[str, object]:
+        now = _now()
+        record: Dict[str, object] = {
+            'session_id': str(uuid.uuid4()),
+            'tenant_id': tenant_id,
+            'summary': '',
+            'messages': [],
+            'pending': [],
+            'compacted_messages': 0,
+            'created_at': now,
+            'updated_at': now,
+        }
+        await self.store.save(record)
+        return record
+
+    async def get(self, session_id: str) -> Optional[Dict[str, object]]:
+        return await self.store.load(session_id)
+
+    async def delete(self, session_id: str) -> bool:
+        return await self.store.delete(session_id)
+
+    def history(self, record: Dict[str, object]) -> List[Dict[str, str]]:
+        messages: List[Dict[str, str]] = []
+        if record['summary']:
+            messages.append({'role': 'system', 'content': f'Summary of the earlier conversation:\n{record["summary"]}'})
+        messages.extend({'role': item['role'], 'content': item['content']} for item in record['messages'])
+        return messages
+
+    async def append_turn(self, session_id: str, query: str, answer: str) -> None:
+        def add_turn(record: Dict[str, object]) -> None:
+            messages: List[Dict[str, object]] = record['messages']
+            for role, content in (('user', query), ('assistant', answer)):
+                messages.append({'role': role, 'content': content, 'tokens': estimate_tokens(content)})
+            overflow = self._compact(messages)
+            if overflow:
+                record['compacted_messages'] += len(overflow)
+                if self.settings.session_compaction == 'summarize':
+                    record['pending'].extend(overflow)
+
+        record = await self.store.update(session_id, add_turn)
+        if record is not None and record['pending']:
+            self._schedule_summary(session_id)
+
+    def _compact(self, messages: List[Dict[str, object]]) -> List[Dict[str, object]]:
+        # Oldest turns leave the live history first; the latest exchange is always kept.
+        budget = self.settings.session_history_tokens
+        total = sum(int(item['tokens']) for item in messages)
+        overflow: List[Dict[str, object]] = []
+        while len(messages) > 2 and total > budget:
+            item = messages.pop(0)
+            total -= int(item['tokens'])
+            overflow.append(item)
+        return overflow
+
+    def _schedule_summary(self, session_id: str) -> None:
+        if session_id in self._summarizing:
+            return
+        self._summarizing.add(session_id)
+        task = asyncio.create_task(self._summarize(session_id), name=f'session-summary-{session_id}')
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, session_id: str) -> None:
+        try:
+            while True:
+                record = await self.store.load(session_id)
+                if record is None or not record['pending']:
+                    return
+                pending = list(record['pending'])
+                try:
+                    with wait_for_capacity():
+                        summary = await self._pipeline().summarize_history(str(record['summary']), pending)
+                except Exception as exc:
+                    # Falling back to plain truncation keeps the history bounded even when Ollama is down.
+                    logger.warning('Summarizing session %s failed: %s', session_id, exc)
+                    summary = None
+
+                def apply_summary(record: Dict[str, object]) -> None:
+                    # Another worker may have folded the same messages in already.
+                    if record['pending'][:len(pending)] != pending:
+                        return
+                    record['pending'] = record['pending'][len(pending):]
+                    if summary:
+                        record['summary'] = truncate_to_tokens(summary.strip(), self.settings.session_summary_tokens)
+
+                if await self.store.update(session_id, apply_summary) is None:
+                    return
+        finally:
+            self._summarizing.discard(session_id)
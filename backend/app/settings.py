@@ -1,5 +1,6 @@
 from functools import lru_cache
 from pathlib import Path
+from typing import Optional
 
 from pydantic import BaseSettings, Field
 
@@ -13,17 +14,80 @@ class Settings(BaseSettings):
     llm_model: str = Field('llama3.1', env='LLM_MODEL')
     embed_model: str = Field('mxbai-embed-large', env='EMBED_MODEL')
     ollama_timeout: int = Field(120, env='OLLAMA_TIMEOUT')
+    ollama_connect_timeout: float = Field(5.0, env='OLLAMA_CONNECT_TIMEOUT')
+    ollama_embed_timeout: Optional[float] = Field(None, env='OLLAMA_EMBED_TIMEOUT')
+    ollama_chat_timeout: Optional[float] = Field(None, env='OLLAMA_CHAT_TIMEOUT')
+    ollama_max_connections: int = Field(32, env='OLLAMA_MAX_CONNECTIONS')
+    ollama_max_keepalive: int = Field(16, env='OLLAMA_MAX_KEEPALIVE')
+    ollama_keepalive_expiry: float = Field(30.0, env='OLLAMA_KEEPALIVE_EXPIRY')
+    ollama_http2: bool = Field(True, env='OLLAMA_HTTP2')
+    ollama_keep_alive: str = Field('30m', env='OLLAMA_KEEP_ALIVE')
+    ollama_warmup: bool = Field(True, env='OLLAMA_WARMUP')
+    ollama_keepalive_interval: float = Field(240.0, env='OLLAMA_KEEPALIVE_INTERVAL')
+    ollama_concurrency: int = Field(4, env='OLLAMA_CONCURRENCY', ge=0)
+    ollama_queue_limit: int = Field(64, env='OLLAMA_QUEUE_LIMIT', ge=0)
+    ollama_tenant_queue_limit: int = Field(16, env='OLLAMA_TENANT_QUEUE_LIMIT', ge=0)
+    ollama_interactive_weight: int = Field(4, env='OLLAMA_INTERACTIVE_WEIGHT', ge=1)
+    embed_batch_size: int = Field(32, env='EMBED_BATCH_SIZE')
+    embed_concurrency: int = Field(4, env='EMBED_CONCURRENCY')
+    embed_cache_enabled: bool = Field(True, env='EMBED_CACHE_ENABLED')
+    embed_cache_memory_mb: int = Field(64, env='EMBED_CACHE_MEMORY_MB')
+    embed_cache_disk_mb: int = Field(1024, env='EMBED_CACHE_DISK_MB')
+    query_cache_ttl_seconds: float = Field(600.0, env='QUERY_CACHE_TTL_SECONDS')
+    query_cache_memory_mb: int = Field(8, env='QUERY_CACHE_MEMORY_MB')
+    coalesce_requests: bool = Field(True, env='COALESCE_REQUESTS')
+    coalesce_generation: bool = Field(False, env='COALESCE_GENERATION')
 
     qdrant_url: str = Field('http://qdrant:6333', env='QDRANT_URL')
     qdrant_api_key: str = Field('', env='QDRANT_API_KEY')
     collection_name: str = Field('rag_documents', env='QDRANT_COLLECTION')
+    qdrant_prefer_grpc: bool = Field(False, env='QDRANT_PREFER_GRPC')
+    qdrant_grpc_port: int = Field(6334, env='QDRANT_GRPC_PORT')
+    qdrant_timeout: int = Field(30, env='QDRANT_TIMEOUT')
+    qdrant_tenant_layout: str = Field('shared', env='QDRANT_TENANT_LAYOUT', regex='^(shared|collection|shard)$')
+    qdrant_tenant_hnsw: bool = Field(False, env='QDRANT_TENANT_HNSW')
+    qdrant_quantization: str = Field('none', env='QDRANT_QUANTIZATION', regex='^(none|scalar|binary)$')
+    qdrant_quantization_always_ram: bool = Field(True, env='QDRANT_QUANTIZATION_ALWAYS_RAM')
+    qdrant_on_disk_vectors: bool = Field(False, env='QDRANT_ON_DISK_VECTORS')
+    qdrant_hnsw_m: Optional[int] = Field(None, env='QDRANT_HNSW_M')
+    qdrant_hnsw_ef_construct: Optional[int] = Field(None, env='QDRANT_HNSW_EF_CONSTRUCT')
+    qdrant_search_hnsw_ef: Optional[int] = Field(None, env='QDRANT_SEARCH_HNSW_EF')
+    qdrant_search_rescore: bool = Field(True, env='QDRANT_SEARCH_RESCORE')
+    qdrant_search_oversampling: float = Field(2.0, env='QDRANT_SEARCH_OVERSAMPLING')
+    retrieval_mode: str = Field('dense', env='RETRIEVAL_MODE', regex='^(dense|hybrid)$')
+    hybrid_prefetch_multiplier: int = Field(4, env='HYBRID_PREFETCH_MULTIPLIER')
+    mmr_enabled: bool = Field(False, env='MMR_ENABLED')
+    mmr_lambda: float = Field(0.5, env='MMR_LAMBDA', ge=0, le=1)
+    mmr_fetch_multiplier: int = Field(4, env='MMR_FETCH_MULTIPLIER')
 
     data_dir: Path = Field(Path('data'), env='DATA_DIR')
+    tenant_store_backend: str = Field('sqlite', env='TENANT_STORE_BACKEND', regex='^(sqlite|json)$')
+    tenant_refresh_seconds: float = Field(2.0, env='TENANT_REFRESH_SECONDS')
+    profiling_admin_token: str = Field('', env='PROFILING_ADMIN_TOKEN')
+    profiling_sample_rate: float = Field(0.0, env='PROFILING_SAMPLE_RATE', ge=0, le=1)
+    profiling_interval_ms: float = Field(5.0, env='PROFILING_INTERVAL_MS', gt=0)
+    profiling_traceback_frames: int = Field(25, env='PROFILING_TRACEBACK_FRAMES', ge=1)
+    profiling_max_reports: int = Field(50, env='PROFILING_MAX_REPORTS', ge=1)
 
     chunk_size: int = Field(800, env='CHUNK_SIZE')
     chunk_overlap: int = Field(100, env='CHUNK_OVERLAP')
+    chunk_strategy: str = Field('structured', env='CHUNK_STRATEGY', regex='^(structured|window)$')
     default_top_k: int = Field(4, env='TOP_K')
     max_context_chars: int = Field(4000, env='MAX_CONTEXT_CHARS')
+    max_context_tokens: int = Field(1000, env='MAX_CONTEXT_TOKENS')
+    session_history_tokens: int = Field(1024, env='SESSION_HISTORY_TOKENS')
+    session_summary_tokens: int = Field(256, env='SESSION_SUMMARY_TOKENS')
+    session_compaction: str = Field('summarize', env='SESSION_COMPACTION', regex='^(summarize|truncate)$')
+    session_ttl_hours: float = Field(168.0, env='SESSION_TTL_HOURS')
+    ingest_batch_size: int = Field(256, env='INGEST_BATCH_SIZE')
+    ingest_max_inflight_mb: int = Field(16, env='INGEST_MAX_INFLIGHT_MB')
+    ingest_background: bool = Field(False, env='INGEST_BACKGROUND')
+    ingest_workers: int = Field(2, env='INGEST_WORKERS')
+    ingest_queue_size: int = Field(64, env='INGEST_QUEUE_SIZE')
+    ingest_job_retention_hours: float = Field(24.0, env='INGEST_JOB_RETENTION_HOURS')
+    parse_workers: int = Field(2, env='PARSE_WORKERS')
+    parse_timeout_seconds: float = Field(120.0, env='PARSE_TIMEOUT_SECONDS')
+    parse_memory_limit_mb: int = Field(2048, env='PARSE_MEMORY_LIMIT_MB')
 
     system_prompt: str = Field(
         'You are JamAI, a calm assistant who answers using the provided context. '
@@ -0,0 +1,48 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+from . import metrics
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.leaders: Dict[str, int] = {}
+        self.followers: Dict[str, int] = {}
+
+    async def run(self, operation: str, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        # Concurrent callers with the same key share one call; the first caller's context runs it.
+        key = (operation, key)
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            self.leaders[operation] = self.leaders.get(operation, 0) + 1
+        else:
+            self.followers[operation] = self.followers.get(operation, 0) + 1
+            metrics.COALESCED.labels(operation).inc()
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # The shared call is only abandoned once every caller waiting for it has gone.
+            if self._calls.get(key) is task:
+                self._waiters[key] -= 1
+                if not self._waiters[key]:
+                    task.cancel()
+            raise
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'in_flight': len(self._calls), 'leaders': dict(self.leaders), 'followers': dict(self.followers)}
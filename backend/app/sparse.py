@@ -0,0 +1,50 @@
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Tuple
+
+# Compound tokens such as product codes (ab-1234) and error strings (e.connrefused) are kept whole
+# alongside their parts so exact identifiers outrank partial matches.
+_TOKEN = re.compile(r'\w+(?:[-./:]\w+)*')
+_PART = re.compile(r'\w+')
+
+_K1 = 1.2
+_B = 0.75
+
+SparseEntries = Tuple[List[int], List[float]]
+
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(_PART.findall(token))
+    return tokens
+
+
+def _token_id(token: str) -> int:
+    return zlib.crc32(token.encode('utf-8'))
+
+
+def _term_counts(tokens: List[str]) -> Dict[int, int]:
+    counts: Dict[int, int] = Counter()
+    for token in tokens:
+        counts[_token_id(token)] += 1
+    return counts
+
+
+def document_vector(text: str, avg_length: float) -> SparseEntries:
+    # BM25 term-frequency saturation only; Qdrant applies IDF at query time via Modifier.IDF.
+    tokens = tokenize(text)
+    length_norm = _K1 * (1 - _B + _B * len(tokens) / max(avg_length, 1.0))
+    counts = _term_counts(tokens)
+    indices = sorted(counts)
+    values = [counts[index] * (_K1 + 1) / (counts[index] + length_norm) for index in indices]
+    return indices, values
+
+
+def query_vector(text: str) -> SparseEntries:
+    indices = sorted(_term_counts(tokenize(text)))
+    return indices, [1.0] * len(indices)
@@ -1,73 +1,322 @@
 import asyncio
+import bisect
+import contextlib
+import fcntl
 import json
+import logging
+import os
+import sqlite3
+import threading
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
 
 from .schemas import TenantRead
 
+logger = logging.getLogger(__name__)
 
-class TenantStore:
+Record = Dict[str, object]
+Version = Union[int, Tuple[int, int], None]
+
+_MAX_MISSES = 10_000
+
+
+class JsonTenantBackend:
     def __init__(self, file_path: Path) -> None:
         self._file_path = file_path
-        self._lock = asyncio.Lock()
+        self._lock_path = file_path.with_suffix('.lock')
 
-    async def initialise(self) -> None:
-        async with self._lock:
-            if not self._file_path.parent.exists():
-                self._file_path.parent.mkdir(parents=True, exist_ok=True)
-            if not self._file_path.exists():
-                await asyncio.to_thread(
-                    self._file_path.write_text,
-                    json.dumps({'tenants': []}, indent=2),
-                )
-
-    async def _read(self) -> Dict[str, List[Dict[str, object]]]:
-        await self.initialise()
-        data = await asyncio.to_thread(self._file_path.read_text)
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        # flock serializes read-modify-write cycles across uvicorn workers, not just coroutines.
+        self._file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._lock_path, 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def version(self) -> Version:
+        try:
+            stat = self._file_path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self) -> Dict[str, Record]:
+        if not self._file_path.exists():
+            return {}
+        data = self._file_path.read_text()
         if not data:
-            return {'tenants': []}
-        return json.loads(data)
-
-    async def _write(self, payload: Dict[str, List[Dict[str, object]]]) -> None:
-        await asyncio.to_thread(self._file_path.write_text, json.dumps(payload, indent=2))
-
-    async def list(self) -> List[Dict[str, object]]:
-        data = await self._read()
-        return data['tenants']
-
-    async def get(self, tenant_id: str) -> Optional[Dict[str, object]]:
-        tenants = await self.list()
-        for item in tenants:
-            if item['tenant_id'] == tenant_id:
-                return item
-        return None
-
-    async def create(self, record: Dict[str, object]) -> TenantRead:
-        async with self._lock:
-            data = await self._read()
-            if any(item['tenant_id'] == record['tenant_id'] for item in data['tenants']):
-                raise ValueError('Tenant already exists')
-            data['tenants'].append(record)
-            await self._write(data)
-            return TenantRead(**record)
-
-    async def update(self, tenant_id: str, updates: Dict[str, object]) -> Optional[TenantRead]:
-        async with self._lock:
-            data = await self._read()
-            for index, item in enumerate(data['tenants']):
-                if item['tenant_id'] == tenant_id:
-                    item.update(updates)
-                    data['tenants'][index] = item
-                    await self._write(data)
-                    return TenantRead(**item)
-        return None
+            return {}
+        return {str(item['tenant_id']): item for item in json.loads(data)['tenants']}
 
-    async def delete(self, tenant_id: str) -> bool:
-        async with self._lock:
-            data = await self._read()
-            remaining = [item for item in data['tenants'] if item['tenant_id'] != tenant_id]
-            if len(remaining) == len(data['tenants']):
+    def _dump(self, records: Dict[str, Record]) -> None:
+        tmp_path = self._file_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps({'tenants': list(records.values())}, indent=2))
+        os.replace(tmp_path, self._file_path)
+
+    def initialise(self) -> None:
+        with self._locked():
+            if not self._file_path.exists():
+                self._dump({})
+
+    def load_all(self) -> Dict[str, Record]:
+        return self._load()
+
+    def fetch(self, tenant_id: str) -> Optional[Record]:
+        return self._load().get(tenant_id)
+
+    def insert(self, record: Record) -> bool:
+        with self._locked():
+            records = self._load()
+            if record['tenant_id'] in records:
                 return False
-            data['tenants'] = remaining
-            await self._write(data)
+            records[str(record['tenant_id'])] = record
+            self._dump(records)
             return True
+
+    def update(self, tenant_id: str, updates: Record) -> Optional[Record]:
+        with self._locked():
+            records = self._load()
+            if tenant_id not in records:
+                return None
+            records[tenant_id] = {**records[tenant_id], **updates}
+            self._dump(records)
+            return records[tenant_id]
+
+    def delete(self, tenant_id: str) -> bool:
+        with self._locked():
+            records = self._load()
+            if records.pop(tenant_id, None) is None:
+                return False
+            self._dump(records)
+            return True
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteTenantBackend:
+    def __init__(self, file_path: Path, legacy_json: Optional[Path] = None) -> None:
+        self._file_path = file_path
+        self._legacy_json = legacy_json
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._file_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self._file_path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS tenants (tenant_id TEXT PRIMARY KEY, record TEXT NOT NULL)')
+            self._conn = conn
+        return self._conn
+
+    def version(self) -> Version:
+        # data_version changes whenever another connection (e.g. another worker) commits.
+        with self._conn_lock:
+            return self._connection().execute('PRAGMA data_version').fetchone()[0]
+
+    def initialise(self) -> None:
+        with self._conn_lock:
+            conn = self._connection()
+            if self._legacy_json is None or not self._legacy_json.exists():
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('SELECT COUNT(*) FROM tenants').fetchone()[0] == 0:
+                    data = self._legacy_json.read_text()
+                    tenants = json.loads(data)['tenants'] if data else []
+                    conn.executemany(
+                        'INSERT OR IGNORE INTO tenants (tenant_id, record) VALUES (?, ?)',
+                        [(item['tenant_id'], json.dumps(item)) for item in tenants],
+                    )
+                    if tenants:
+                        logger.info('Imported %s tenants from %s', len(tenants), self._legacy_json)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def load_all(self) -> Dict[str, Record]:
+        with self._conn_lock:
+            rows = self._connection().execute('SELECT tenant_id, record FROM tenants').fetchall()
+        return {tenant_id: json.loads(record) for tenant_id, record in rows}
+
+    def fetch(self, tenant_id: str) -> Optional[Record]:
+        with self._conn_lock:
+            row = self._connection().execute('SELECT record FROM tenants WHERE tenant_id = ?', (tenant_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def insert(self, record: Record) -> bool:
+        with self._conn_lock:
+            cursor = self._connection().execute(
+                'INSERT OR IGNORE INTO tenants (tenant_id, record) VALUES (?, ?)',
+                (record['tenant_id'], json.dumps(record)),
+            )
+            return cursor.rowcount == 1
+
+    def update(self, tenant_id: str, updates: Record) -> Optional[Record]:
+        with self._conn_lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT record FROM tenants WHERE tenant_id = ?', (tenant_id,)).fetchone()
+                if row is None:
+                    conn.execute('ROLLBACK')
+                    return None
+                record = {**json.loads(row[0]), **updates}
+                conn.execute('UPDATE tenants SET record = ? WHERE tenant_id = ?', (json.dumps(record), tenant_id))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            return record
+
+    def delete(self, tenant_id: str) -> bool:
+        with self._conn_lock:
+            cursor = self._connection().execute('DELETE FROM tenants WHERE tenant_id = ?', (tenant_id,))
+            return cursor.rowcount == 1
+
+    def close(self) -> None:
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+TenantBackend = Union[JsonTenantBackend, SqliteTenantBackend]
+
+
+class TenantStore:
+    def __init__(
+        self,
+        file_path: Path,
+        backend: Optional[TenantBackend] = None,
+        refresh_seconds: float = 2.0,
+    ) -> None:
+        if backend is None:
+            if file_path.suffix == '.json':
+                backend = JsonTenantBackend(file_path)
+            else:
+                backend = SqliteTenantBackend(file_path, legacy_json=file_path.with_name('tenants.json'))
+        self._backend = backend
+        self._refresh_seconds = refresh_seconds
+        self._index: Dict[str, Record] = {}
+        self._order: List[str] = []
+        # Local writes made while a refresh reads its snapshot; they are newer than the snapshot.
+        self._recent: Dict[str, Optional[Record]] = {}
+        # Unknown ids already looked up since the last reload, so bogus tenants never reach the backend twice.
+        self._misses: Set[str] = set()
+        self._version: Version = None
+        self._loaded = False
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def initialise(self) -> None:
+        await asyncio.to_thread(self._backend.initialise)
+        await self._refresh(force=True)
+        if self._refresh_task is None and self._refresh_seconds > 0:
+            self._refresh_task = asyncio.create_task(self._watch(), name='tenant-store-refresh')
+
+    async def close(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+        await asyncio.to_thread(self._backend.close)
+
+    async def _watch(self) -> None:
+        # Reads are served from memory; other workers' writes are picked up here instead of per request.
+        while True:
+            await asyncio.sleep(self._refresh_seconds)
+            try:
+                await self._refresh()
+            except Exception as exc:  # pragma: no cover
+                logger.warning('Refreshing tenant index failed: %s', exc)
+
+    async def _refresh(self, force: bool = False) -> None:
+        async with self._refresh_lock:
+            version = await asyncio.to_thread(self._backend.version)
+            if not force and self._loaded and version == self._version:
+                return
+            self._recent = {}
+            records = await asyncio.to_thread(self._backend.load_all)
+            for tenant_id, record in self._recent.items():
+                if record is None:
+                    records.pop(tenant_id, None)
+                else:
+                    records[tenant_id] = record
+            self._index = records
+            self._order = sorted(records)
+            self._misses = set()
+            self._version = version
+            self._loaded = True
+
+    async def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            await asyncio.to_thread(self._backend.initialise)
+            await self._refresh(force=True)
+
+    def _put(self, record: Record) -> None:
+        tenant_id = str(record['tenant_id'])
+        if tenant_id not in self._index:
+            bisect.insort(self._order, tenant_id)
+        self._index[tenant_id] = record
+        self._recent[tenant_id] = record
+        self._misses.discard(tenant_id)
+
+    def _remove(self, tenant_id: str) -> None:
+        self._recent[tenant_id] = None
+        if self._index.pop(tenant_id, None) is not None:
+            self._order.pop(bisect.bisect_left(self._order, tenant_id))
+
+    async def list(self) -> List[Record]:
+        await self._ensure_loaded()
+        return [self._index[tenant_id] for tenant_id in self._order]
+
+    async def page(self, offset: int, limit: int) -> Tuple[List[Record], int]:
+        await self._ensure_loaded()
+        ids = self._order[offset:offset + limit]
+        return [self._index[tenant_id] for tenant_id in ids], len(self._order)
+
+    def known(self, tenant_id: str) -> bool:
+        return tenant_id in self._index
+
+    async def get(self, tenant_id: str) -> Optional[Record]:
+        await self._ensure_loaded()
+        record = self._index.get(tenant_id)
+        if record is None and tenant_id not in self._misses:
+            # Tenants created by another worker since the last refresh are looked up by primary key.
+            record = await asyncio.to_thread(self._backend.fetch, tenant_id)
+            if record is not None:
+                self._put(record)
+            else:
+                if len(self._misses) >= _MAX_MISSES:
+                    self._misses.clear()
+                self._misses.add(tenant_id)
+        return record
+
+    async def create(self, record: Record) -> TenantRead:
+        await self._ensure_loaded()
+        if not await asyncio.to_thread(self._backend.insert, record):
+            raise ValueError('Tenant already exists')
+        self._put(record)
+        return TenantRead(**record)
+
+    async def update(self, tenant_id: str, updates: Record) -> Optional[TenantRead]:
+        await self._ensure_loaded()
+        record = await asyncio.to_thread(self._backend.update, tenant_id, updates)
+        if record is None:
+            self._remove(tenant_id)
+            return None
+        self._put(record)
+        return TenantRead(**record)
+
+    async def delete(self, tenant_id: str) -> bool:
+        await self._ensure_loaded()
+        removed = await asyncio.to_thread(self._backend.delete, tenant_id)
+        self._remove(tenant_id)
+        return removed
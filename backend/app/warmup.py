@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+
+from .rag_core import RAGPipeline
+from .settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+def _model_name(name: str) -> str:
+    return name if ':' in name else f'{name}:latest'
+
+
+class ModelWarmer:
+    def __init__(self, settings: Settings, pipeline: RAGPipeline) -> None:
+        self.settings = settings
+        self.pipeline = pipeline
+        self.ollama = pipeline.ollama
+        self._task: Optional[asyncio.Task] = None
+        self._probe_timeout = httpx.Timeout(5.0, connect=settings.ollama_connect_timeout)
+        self.last_error: Optional[str] = None
+        self.warmed = False
+
+    @property
+    def models(self) -> Dict[str, str]:
+        return {'embed': self.settings.embed_model, 'llm': self.settings.llm_model}
+
+    async def start(self) -> None:
+        if self.settings.ollama_warmup:
+            self._task = asyncio.create_task(self._run(), name='ollama-warmup')
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def warm(self) -> None:
+        # Empty chat messages and a one-word embed make Ollama load the model and reset its keep_alive timer.
+        await self.pipeline.load_embed_model()
+        chat = {'model': self.settings.llm_model, 'messages': [], 'keep_alive': self.settings.ollama_keep_alive}
+        response = await self.ollama.post('/api/chat', chat, self.ollama.chat_timeout)
+        response.raise_for_status()
+
+    async def _run(self) -> None:
+        interval = self.settings.ollama_keepalive_interval
+        delay = 1.0
+        while True:
+            try:
+                await self.warm()
+            except (httpx.HTTPError, OSError, ValueError) as exc:
+                self.last_error = str(exc) or exc.__class__.__name__
+                logger.warning('Ollama warm-up failed (%s); retrying in %.0fs', self.last_error, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60.0)
+                continue
+            if not self.warmed or self.last_error is not None:
+                logger.info('Ollama models warm: %s', ', '.join(self.models.values()))
+            self.warmed = True
+            self.last_error = None
+            delay = 1.0
+            if interval <= 0:
+                return
+            await asyncio.sleep(interval)
+
+    async def readiness(self) -> Dict[str, Any]:
+        try:
+            response = await self.ollama.get('/api/ps', self._probe_timeout)
+            response.raise_for_status()
+            loaded = {_model_name(str(item.get('name') or item.get('model'))) for item in response.json().get('models', [])}
+        except (httpx.HTTPError, OSError, ValueError) as exc:
+            return {'ready': False, 'models': {}, 'error': str(exc) or exc.__class__.__name__}
+        models = {role: _model_name(name) in loaded for role, name in self.models.items()}
+        return {'ready': all(models.values()), 'models': models, 'error': self.last_error}
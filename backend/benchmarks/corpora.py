@@ -0,0 +1,141 @@
+import csv
+import io
+import random
+from typing import List
+
+from docx import Document
+from openpyxl import Workbook
+
+from app.rag_core import RetrievedChunk
+
+_WORDS = (
+    'tenant ingestion vector embedding retrieval context answer source chunk qdrant ollama latency '
+    'throughput payload index shard quantization cache session summary stream token model prompt '
+    'invoice contract policy warranty shipment customer region quarter revenue margin forecast audit'
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(6, 18))]
+    return ' '.join(words).capitalize() + rng.choice('...?!')
+
+
+def _paragraph(rng: random.Random) -> str:
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(2, 7)))
+
+
+def markdown_text(size_bytes: int, seed: int = 7) -> str:
+    # Headings, prose, code fences and tables, so the structured chunker exercises every branch.
+    rng = random.Random(seed)
+    parts: List[str] = []
+    total = 0
+    section = 0
+    while total < size_bytes:
+        section += 1
+        block = [f'## Section {section}\n']
+        for _ in range(rng.randint(2, 6)):
+            block.append(_paragraph(rng) + '\n')
+        if section % 5 == 0:
+            block.append('```python\n' + '\n'.join(f'value_{i} = compute({i})' for i in range(12)) + '\n```\n')
+        if section % 7 == 0:
+            rows = [f'| {rng.choice(_WORDS)} | {rng.randint(1, 999)} | {rng.random():.3f} |' for _ in range(8)]
+            block.append('| name | count | ratio |\n|---|---|---|\n' + '\n'.join(rows) + '\n')
+        text = '\n'.join(block) + '\n'
+        parts.append(text)
+        total += len(text)
+    return ''.join(parts)
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def pdf_document(pages: int, lines_per_page: int = 50, seed: int = 11) -> bytes:
+    # A minimal uncompressed PDF with one Helvetica text stream per page.
+    rng = random.Random(seed)
+    page_ids = [4 + index * 2 for index in range(pages)]
+    objects = {
+        1: b'<< /Type /Catalog /Pages 2 0 R >>',
+        2: f'<< /Type /Pages /Kids [{" ".join(f"{pid} 0 R" for pid in page_ids)}] /Count {pages} >>'.encode(),
+        3: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    }
+    for pid in page_ids:
+        lines = [_pdf_escape(' '.join(rng.choice(_WORDS) for _ in range(12))) for _ in range(lines_per_page)]
+        body = 'BT /F1 10 Tf 14 TL 40 800 Td ' + ' '.join(f'({line}) Tj T*' for line in lines) + ' ET'
+        stream = body.encode('latin-1')
+        objects[pid] = (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {pid + 1} 0 R >>'
+        ).encode()
+        objects[pid + 1] = b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream'
+    output = io.BytesIO()
+    output.write(b'%PDF-1.4\n')
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = output.tell()
+        output.write(b'%d 0 obj\n' % number + objects[number] + b'\nendobj\n')
+    xref = output.tell()
+    count = max(objects) + 1
+    output.write(b'xref\n0 %d\n0000000000 65535 f \n' % count)
+    for number in range(1, count):
+        output.write(b'%010d 00000 n \n' % offsets[number])
+    output.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (count, xref))
+    return output.getvalue()
+
+
+def _rows(count: int, seed: int) -> List[List[object]]:
+    rng = random.Random(seed)
+    return [
+        [index, f'customer-{rng.randint(1, 5000)}', rng.choice(_WORDS), rng.randint(1, 10000), round(rng.random() * 1000, 2), _sentence(rng)]
+        for index in range(count)
+    ]
+
+
+def csv_document(rows: int, seed: int = 13) -> bytes:
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['id', 'customer', 'category', 'quantity', 'amount', 'note'])
+    writer.writerows(_rows(rows, seed))
+    return output.getvalue().encode('utf-8')
+
+
+def xlsx_document(rows: int, seed: int = 17) -> bytes:
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('orders')
+    sheet.append(['id', 'customer', 'category', 'quantity', 'amount', 'note'])
+    for row in _rows(rows, seed):
+        sheet.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def docx_document(paragraphs: int, seed: int = 19) -> bytes:
+    rng = random.Random(seed)
+    document = Document()
+    for index in range(paragraphs):
+        if index % 20 == 0:
+            document.add_heading(f'Chapter {index // 20 + 1}', level=1)
+        document.add_paragraph(_paragraph(rng))
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def retrieved_chunks(count: int, chunk_chars: int, sources: int = 6, seed: int = 23) -> List[RetrievedChunk]:
+    # Neighbouring chunk indexes and shared overlaps, as real top-k results from a few documents look.
+    rng = random.Random(seed)
+    chunks: List[RetrievedChunk] = []
+    for index in range(count):
+        source = f'document-{index % sources}.pdf'
+        text = ''
+        while len(text) < chunk_chars:
+            text += _sentence(rng) + ' '
+        chunks.append(
+            RetrievedChunk(
+                text=text[:chunk_chars],
+                score=1.0 - index / (count * 2),
+                metadata={'source': source, 'chunk_index': index // sources + rng.choice((0, 1)), 'tenant_id': 'acme'},
+            )
+        )
+    return chunks
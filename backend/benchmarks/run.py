@@ -0,0 +1,327 @@
+import argparse
+import csv
+import gc
+import io
+import json
+import platform
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from xml.etree import ElementTree
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.parsers import extract_text
+from app.rag_core import RAGPipeline
+from app.settings import Settings
+
+from . import corpora
+
+BASELINE_PATH = Path(__file__).with_name('baseline.json')
+_MIN_CASES_FOR_RATIOS = 4
+
+
+@dataclass
+class Case:
+    name: str
+    unit: str
+    units: float
+    run: Callable[[], Any]
+
+
+@dataclass
+class Result:
+    name: str
+    unit: str
+    units: float
+    seconds: float
+    throughput: float
+    peak_mb: float
+
+
+def _pipeline(chunk_strategy: str, data_dir: Path) -> RAGPipeline:
+    return RAGPipeline(Settings(chunk_strategy=chunk_strategy, embed_cache_enabled=False, data_dir=data_dir))
+
+
+def build_cases(scale: float, data_dir: Path, only: str = '') -> List[Case]:
+    def scaled(value: int) -> int:
+        return max(1, int(value * scale))
+
+    def wanted(name: str) -> bool:
+        return only in name
+
+    cases: List[Case] = []
+    text = corpora.markdown_text(scaled(8 * 1024 * 1024))
+    text_mb = len(text.encode('utf-8')) / (1024 * 1024)
+    for strategy in ('structured', 'window'):
+        if wanted(f'split_text[{strategy}]'):
+            pipeline = _pipeline(strategy, data_dir)
+            cases.append(Case(f'split_text[{strategy}]', 'MB/s', text_mb, lambda pipeline=pipeline: pipeline.split_text(text)))
+
+    documents: Dict[str, Tuple[str, Callable[[], bytes]]] = {
+        'txt': ('corpus.txt', lambda: text.encode('utf-8')),
+        'pdf': ('report.pdf', lambda: corpora.pdf_document(scaled(500))),
+        'docx': ('handbook.docx', lambda: corpora.docx_document(scaled(5000))),
+        'csv': ('orders.csv', lambda: corpora.csv_document(scaled(100_000))),
+        'xlsx': ('orders.xlsx', lambda: corpora.xlsx_document(scaled(100_000))),
+    }
+    for kind, (filename, generate) in documents.items():
+        if not wanted(f'extract_text[{kind}]'):
+            continue
+        data = generate()
+        size_mb = len(data) / (1024 * 1024)
+        cases.append(
+            Case(f'extract_text[{kind}]', 'MB/s', size_mb, lambda filename=filename, data=data: extract_text(filename, data))
+        )
+
+    pipeline = _pipeline('structured', data_dir)
+    retrieved = corpora.retrieved_chunks(20, 800)
+    calls = scaled(100)
+
+    def format_context() -> None:
+        for _ in range(calls):
+            pipeline._format_context(retrieved)
+
+    filter_calls = scaled(20_000)
+    tags = ['finance', 'legal', 'emea']
+
+    def build_filter() -> None:
+        for _ in range(filter_calls):
+            pipeline._build_filter('acme', tags)
+
+    cases.append(Case('_format_context[top20]', 'calls/s', calls, format_context))
+    cases.append(Case('_build_filter', 'calls/s', filter_calls, build_filter))
+    return [case for case in cases if wanted(case.name)]
+
+
+def _calibration_workload() -> Callable[[], None]:
+    # Mirrors what the cases spend their time on (regex scans, slicing and joining text, CSV rows, zipped XML)
+    # using only the standard library, so changes to the code under test cannot move the calibration.
+    paragraph = 'Plain sentence with several words. Another one follows! Does it end? ' * 12
+    text = ''.join(f'## Section {index}\n\n{paragraph}\n\n' for index in range(300))
+    rows = '\n'.join(f'{index},customer-{index % 97},{index * 3.5:.2f},2024-01-{index % 28 + 1:02d}' for index in range(16_000))
+    cells = ''.join(f'<c r="A{index}"><v>{index}</v></c><c r="B{index}" t="s"><v>{index % 50}</v></c>' for index in range(12_000))
+    packed = zlib.compress(f'<sheetData><row>{cells}</row></sheetData>'.encode('utf-8'))
+    sentence = re.compile(r'[.!?]+\s+')
+
+    def run() -> None:
+        pieces = []
+        offset = 0
+        for match in sentence.finditer(text):
+            pieces.append(text[offset:match.end()].strip())
+            offset = match.end()
+        '\n'.join(pieces)
+        counts: Dict[str, int] = {}
+        for word in text.split():
+            counts[word] = counts.get(word, 0) + 1
+        '\n'.join(','.join(row) for row in csv.reader(io.StringIO(rows)))
+        root = ElementTree.fromstring(zlib.decompress(packed))
+        ' '.join(value.text or '' for value in root.iter('v'))
+
+    return run
+
+
+def calibrate() -> float:
+    # Baselines are rescaled by this timing so slower machines do not fail spuriously.
+    workload = _calibration_workload()
+    best = float('inf')
+    for _ in range(7):
+        gc.collect()
+        started = time.perf_counter()
+        workload()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def measure(cases: List[Case], repeat: int, min_seconds: float = 1.0) -> List[Result]:
+    # Cases run round-robin so a busy spell on the machine slows every case rather than whichever ran then.
+    # Within a round, fast cases repeat until they fill their share of min_seconds.
+    best = {case.name: float('inf') for case in cases}
+    for _ in range(repeat):
+        for case in cases:
+            spent = 0.0
+            gc.collect()
+            while True:
+                started = time.perf_counter()
+                case.run()
+                elapsed = time.perf_counter() - started
+                best[case.name] = min(best[case.name], elapsed)
+                spent += elapsed
+                if spent >= min_seconds / repeat:
+                    break
+    return [_result(case, best[case.name], _peak_mb(case)) for case in cases]
+
+
+def _peak_mb(case: Case) -> float:
+    # Peak memory is taken in a separate pass because tracemalloc slows allocation-heavy code.
+    gc.collect()
+    tracemalloc.start()
+    try:
+        case.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def _result(case: Case, seconds: float, peak_mb: float) -> Result:
+    return Result(
+        name=case.name,
+        unit=case.unit,
+        units=round(case.units, 4),
+        seconds=round(seconds, 6),
+        throughput=round(case.units / seconds, 4),
+        peak_mb=round(peak_mb, 3),
+    )
+
+
+def calibration_factor(baseline: Dict[str, Any], calibration: float) -> float:
+    return baseline['calibration_seconds'] / calibration
+
+
+def _ratios(results: List[Result], baseline: Dict[str, Any]) -> List[float]:
+    return [
+        result.throughput / baseline['results'][result.name]['throughput']
+        for result in results
+        if result.name in baseline['results']
+    ]
+
+
+def machine_factor(results: List[Result], baseline: Dict[str, Any], calibration: float) -> float:
+    ratios = _ratios(results, baseline)
+    if len(ratios) >= _MIN_CASES_FOR_RATIOS:
+        # Cases are judged relative to each other: the median ratio absorbs machine speed and load during the run.
+        # compare() checks that median against the calibration, so a slowdown shared by most cases still fails.
+        return _median(ratios)
+    return calibration_factor(baseline, calibration)
+
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def _median_results(runs: List[List[Result]]) -> List[Result]:
+    # A baseline taken from one lucky pass makes every later run look like a regression.
+    return [sorted(group, key=lambda result: result.throughput)[len(group) // 2] for group in zip(*runs)]
+
+
+def compare(
+    results: List[Result],
+    baseline: Dict[str, Any],
+    calibration: float,
+    tolerance: float,
+    memory_tolerance: float,
+) -> List[str]:
+    failures: List[str] = []
+    speed = machine_factor(results, baseline, calibration)
+    if len(_ratios(results, baseline)) >= _MIN_CASES_FOR_RATIOS:
+        expected_speed = calibration_factor(baseline, calibration)
+        if speed < expected_speed * (1 - tolerance):
+            failures.append(
+                f'all cases: median throughput ratio {speed:.2f} is below {expected_speed * (1 - tolerance):.2f} '
+                f'(calibration factor {expected_speed:.2f})'
+            )
+    for result in results:
+        expected = baseline['results'].get(result.name)
+        if expected is None:
+            continue
+        minimum = expected['throughput'] * speed * (1 - tolerance)
+        if result.throughput < minimum:
+            failures.append(
+                f'{result.name}: throughput {result.throughput:.2f} {result.unit} '
+                f'is below {minimum:.2f} (baseline {expected["throughput"]:.2f}, machine factor {speed:.2f})'
+            )
+        # A small absolute slack keeps tiny allocations from failing on interpreter noise.
+        limit = expected['peak_mb'] * (1 + memory_tolerance) + 1.0
+        if result.peak_mb > limit:
+            failures.append(f'{result.name}: peak memory {result.peak_mb:.1f} MB exceeds {limit:.1f} MB')
+    return failures
+
+
+def _print_table(results: List[Result], baseline: Optional[Dict[str, Any]], speed: float) -> None:
+    print(f'{"benchmark":<26} {"size":>10} {"best s":>9} {"throughput":>16} {"peak MB":>9} {"vs baseline":>12}')
+    for result in results:
+        delta = ''
+        expected = (baseline or {}).get('results', {}).get(result.name)
+        if expected:
+            delta = f'{(result.throughput / (expected["throughput"] * speed) - 1) * 100:+.1f}%'
+        print(
+            f'{result.name:<26} {result.units:>10.2f} {result.seconds:>9.3f} '
+            f'{result.throughput:>10.2f} {result.unit:<5} {result.peak_mb:>9.1f} {delta:>12}'
+        )
+
+
+def _minor_version(version: Optional[str]) -> str:
+    return '.'.join(str(version).split('.')[:2])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Microbenchmarks for chunking, parsing and context formatting.')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--scale', type=float, default=1.0, help='corpus size factor; baselines only apply at the same scale')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--min-seconds', type=float, default=1.0, help='minimum timed seconds per benchmark')
+    parser.add_argument('--baseline-runs', type=int, default=3, help='passes whose median becomes the new baseline')
+    parser.add_argument('--only', default='', help='run benchmarks whose name contains this text')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed throughput drop (fraction)')
+    parser.add_argument('--memory-tolerance', type=float, default=0.2, help='allowed peak memory growth (fraction)')
+    parser.add_argument('--json', type=Path, help='write the results to this file')
+    args = parser.parse_args(argv)
+
+    calibrations: List[float] = []
+    runs: List[List[Result]] = []
+    with tempfile.TemporaryDirectory(prefix='rag-bench-') as data_dir:
+        cases = build_cases(args.scale, Path(data_dir), args.only)
+        for _ in range(max(1, args.baseline_runs) if args.update_baseline else 1):
+            calibrations.append(calibrate())
+            runs.append(measure(cases, max(1, args.repeat), args.min_seconds))
+    calibration = _median(calibrations)
+    results = _median_results(runs)
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else None
+    if baseline is not None and baseline.get('scale') != args.scale:
+        print(f'Baseline was recorded at scale {baseline.get("scale")}; skipping comparison')
+        baseline = None
+    # Interpreter releases shift the cases by different amounts than the calibration, so only compare like with like.
+    if baseline is not None and _minor_version(baseline.get('python')) != _minor_version(platform.python_version()):
+        print(
+            f'Baseline was recorded on Python {baseline.get("python")}, this is {platform.python_version()}; '
+            'skipping comparison (record one with --update-baseline on this interpreter)'
+        )
+        baseline = None
+    speed = machine_factor(results, baseline, calibration) if baseline else 1.0
+    if baseline:
+        print(f'machine factor {speed:.2f}, calibration factor {calibration_factor(baseline, calibration):.2f}')
+    _print_table(results, baseline, speed)
+
+    report = {
+        'scale': args.scale,
+        'calibration_seconds': round(calibration, 6),
+        'python': platform.python_version(),
+        'results': {result.name: asdict(result) for result in results},
+    }
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+    if args.update_baseline:
+        if baseline is not None and args.only:
+            report['results'] = {**baseline['results'], **report['results']}
+        args.baseline.write_text(json.dumps(report, indent=2) + '\n')
+        print(f'Baseline written to {args.baseline}')
+        return 0
+    if baseline is None:
+        return 0
+    failures = compare(results, baseline, calibration, args.tolerance, args.memory_tolerance)
+    for failure in failures:
+        print(f'REGRESSION {failure}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
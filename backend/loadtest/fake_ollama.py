@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import re
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_WORD = re.compile(r'\w+')
+
+
+@dataclass
+class FakeOllamaConfig:
+    embed_dim: int = 384
+    embed_latency_ms: float = 15.0
+    embed_item_ms: float = 1.5
+    chat_latency_ms: float = 120.0
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 40
+    parallel: int = 4
+
+
+def embed(text: str, dim: int) -> List[float]:
+    # Hashed bag of words: deterministic, and texts sharing words land close together, so retrieval is meaningful.
+    vector = [0.0] * dim
+    for word in _WORD.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], 'little') % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector))
+    if not norm:
+        vector[0] = 1.0
+        return vector
+    return [value / norm for value in vector]
+
+
+def _tokens(texts: List[str]) -> int:
+    return sum(len(_WORD.findall(text)) for text in texts)
+
+
+def create_app(config: FakeOllamaConfig) -> FastAPI:
+    app = FastAPI(title='Fake Ollama')
+    # Models one GPU: requests beyond `parallel` queue, as they do in Ollama with OLLAMA_NUM_PARALLEL.
+    slots = asyncio.Semaphore(max(1, config.parallel))
+    stats: Dict[str, int] = {'embed_requests': 0, 'embedded_inputs': 0, 'chat_requests': 0}
+
+    async def _embed_inputs(inputs: List[str]) -> List[List[float]]:
+        async with slots:
+            await asyncio.sleep((config.embed_latency_ms + config.embed_item_ms * len(inputs)) / 1000)
+        stats['embed_requests'] += 1
+        stats['embedded_inputs'] += len(inputs)
+        return [embed(text, config.embed_dim) for text in inputs]
+
+    @app.post('/api/embed')
+    async def api_embed(request: Request) -> JSONResponse:
+        payload = await request.json()
+        raw: Union[str, List[str]] = payload.get('input', '')
+        inputs = [raw] if isinstance(raw, str) else list(raw)
+        vectors = await _embed_inputs(inputs)
+        return JSONResponse(
+            {'model': payload.get('model'), 'embeddings': vectors, 'prompt_eval_count': _tokens(inputs)}
+        )
+
+    @app.post('/api/embeddings')
+    async def api_embeddings(request: Request) -> JSONResponse:
+        payload = await request.json()
+        vectors = await _embed_inputs([payload.get('prompt') or payload.get('input') or ''])
+        return JSONResponse({'embedding': vectors[0]})
+
+    def _answer_words(messages: List[Dict[str, str]]) -> List[str]:
+        question = messages[-1]['content'] if messages else ''
+        words = _WORD.findall(question)[-12:] or ['answer']
+        return [words[index % len(words)] for index in range(config.answer_tokens)]
+
+    @app.post('/api/chat')
+    async def api_chat(request: Request):
+        payload = await request.json()
+        messages = payload.get('messages') or []
+        stats['chat_requests'] += 1
+        prompt_tokens = _tokens([str(message.get('content', '')) for message in messages])
+        if not messages:
+            # Warm-up requests only load the model.
+            return JSONResponse({'model': payload.get('model'), 'message': {'role': 'assistant', 'content': ''}, 'done': True})
+        words = _answer_words(messages)
+        delay = 1 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        done = {'done': True, 'prompt_eval_count': prompt_tokens, 'eval_count': len(words)}
+
+        if not payload.get('stream', True):
+            async with slots:
+                await asyncio.sleep(config.chat_latency_ms / 1000 + delay * len(words))
+            message = {'role': 'assistant', 'content': ' '.join(words)}
+            return JSONResponse({'model': payload.get('model'), 'message': message, **done})
+
+        async def stream() -> AsyncIterator[bytes]:
+            async with slots:
+                await asyncio.sleep(config.chat_latency_ms / 1000)
+                for index, word in enumerate(words):
+                    content = word if index == 0 else f' {word}'
+                    yield (json.dumps({'message': {'role': 'assistant', 'content': content}, 'done': False}) + '\n').encode()
+                    await asyncio.sleep(delay)
+            yield (json.dumps({'message': {'role': 'assistant', 'content': ''}, **done}) + '\n').encode()
+
+        return StreamingResponse(stream(), media_type='application/x-ndjson')
+
+    @app.get('/api/ps')
+    async def api_ps() -> Dict[str, object]:
+        return {'models': [{'name': name} for name in app.state.models]}
+
+    @app.get('/stats')
+    async def api_stats() -> Dict[str, int]:
+        return stats
+
+    app.state.models = ['mxbai-embed-large:latest', 'llama3.1:latest']
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Ollama stand-in with configurable latency and token rate.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    defaults = FakeOllamaConfig()
+    for name, value in vars(defaults).items():
+        parser.add_argument(f'--{name.replace("_", "-")}', type=type(value), default=value)
+    args = parser.parse_args(argv)
+    config = FakeOllamaConfig(**{name: getattr(args, name) for name in vars(defaults)})
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.corpora import markdown_text
+
+from .fake_ollama import FakeOllamaConfig
+
+_SENTENCE = re.compile(r'[A-Z][^.?!\n]{20,}[.?!]')
+
+
+@dataclass
+class Sample:
+    operation: str
+    seconds: float
+    error: Optional[str] = None
+
+
+@dataclass
+class Recorder:
+    samples: List[Sample] = field(default_factory=list)
+    started: float = 0.0
+    finished: float = 0.0
+
+    def add(self, operation: str, seconds: float, error: Optional[str] = None) -> None:
+        self.samples.append(Sample(operation, seconds, error))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(recorder: Recorder) -> Dict[str, Dict[str, float]]:
+    elapsed = max(recorder.finished - recorder.started, 1e-9)
+    groups: Dict[str, List[Sample]] = defaultdict(list)
+    for sample in recorder.samples:
+        groups[sample.operation].append(sample)
+    groups['all'] = [sample for sample in recorder.samples if not sample.operation.endswith('_ttft')]
+    report: Dict[str, Dict[str, float]] = {}
+    for operation, samples in groups.items():
+        latencies = [sample.seconds * 1000 for sample in samples if sample.error is None]
+        report[operation] = {
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample.error is not None),
+            'throughput_rps': round(len(samples) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+            'max_ms': round(max(latencies, default=0.0), 1),
+        }
+    return report
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _log_tail(log: Optional[Path]) -> str:
+    if log is None or not log.exists():
+        return ''
+    return '\n' + '\n'.join(log.read_text(errors='replace').splitlines()[-20:])
+
+
+def _wait_for(url: str, timeout: float, process: subprocess.Popen, log: Optional[Path]) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{process.args} exited with code {process.returncode}{_log_tail(log)}')
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'Timed out waiting for {url}{_log_tail(log)}')
+
+
+@contextmanager
+def local_stack(config: FakeOllamaConfig, app_env: Dict[str, str], verbose: bool = False) -> Iterator[str]:
+    # Both servers run as subprocesses so their CPU time does not compete with the load generator's.
+    backend_dir = Path(__file__).resolve().parents[1]
+    ollama_port, app_port = _free_port(), _free_port()
+    fake_args = [f'--{name.replace("_", "-")}={value}' for name, value in vars(config).items()]
+    processes: List[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory(prefix='rag-load-') as data_dir:
+        env = {
+            **os.environ,
+            'OLLAMA_HOST': f'http://127.0.0.1:{ollama_port}',
+            'QDRANT_URL': ':memory:',
+            'DATA_DIR': data_dir,
+            **app_env,
+        }
+        logs = {name: None if verbose else Path(data_dir) / f'{name}.log' for name in ('ollama', 'app')}
+
+        def spawn(name: str, command: List[str], process_env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+            log = logs[name]
+            with open(log if log is not None else os.devnull, 'ab') as output:
+                process = subprocess.Popen(
+                    command,
+                    cwd=backend_dir,
+                    env=process_env,
+                    stdout=None if log is None else output,
+                    stderr=None if log is None else subprocess.STDOUT,
+                )
+            processes.append(process)
+            return process
+
+        try:
+            fake = spawn('ollama', [sys.executable, '-m', 'loadtest.fake_ollama', '--port', str(ollama_port), *fake_args])
+            _wait_for(f'http://127.0.0.1:{ollama_port}/api/ps', 30, fake, logs['ollama'])
+            app = spawn(
+                'app',
+                [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(app_port), '--log-level', 'warning'],
+                env,
+            )
+            _wait_for(f'http://127.0.0.1:{app_port}/health', 60, app, logs['app'])
+            yield f'http://127.0.0.1:{app_port}'
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+            for process in processes:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+class Workload:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.tenants = [f'load-{index}' for index in range(args.tenants)] or [None]
+        corpus = markdown_text(200_000, seed=args.seed)
+        self.questions = _SENTENCE.findall(corpus)[: args.query_pool] or ['What is in the documents?']
+        self._documents = 0
+
+    def document(self) -> Tuple[str, bytes]:
+        self._documents += 1
+        text = markdown_text(self.args.doc_kb * 1024, seed=self.args.seed * 1000 + self._documents)
+        return f'doc-{self._documents}.md', text.encode('utf-8')
+
+    def tenant(self) -> Optional[str]:
+        return self.rng.choice(self.tenants)
+
+
+async def _ingest(client: httpx.AsyncClient, workload: Workload, recorder: Recorder) -> None:
+    name, data = workload.document()
+    form = {'tenant_id': workload.tenant()} if workload.tenants[0] else {}
+    started = time.perf_counter()
+    error = None
+    try:
+        response = await client.post('/ingest', files={'files': (name, data, 'text/markdown')}, data=form)
+        if response.status_code >= 400:
+            error = str(response.status_code)
+    except httpx.HTTPError as exc:
+        error = exc.__class__.__name__
+    recorder.add('ingest', time.perf_counter() - started, error)
+
+
+async def _chat(client: httpx.AsyncClient, workload: Workload, recorder: Recorder, stream: bool) -> None:
+    payload = {'query': workload.rng.choice(workload.questions), 'tenant_id': workload.tenant(), 'stream': stream}
+    started = time.perf_counter()
+    error = None
+    operation = 'chat_stream' if stream else 'chat'
+    try:
+        if stream:
+            async with client.stream('POST', '/chat', json=payload) as response:
+                if response.status_code >= 400:
+                    error = str(response.status_code)
+                first = None
+                async for line in response.aiter_lines():
+                    if first is None and line.startswith('event: token'):
+                        first = time.perf_counter()
+                        recorder.add('chat_stream_ttft', first - started)
+                    if line.startswith('event: error'):
+                        error = 'stream-error'
+        else:
+            response = await client.post('/chat', json=payload)
+            if response.status_code >= 400:
+                error = str(response.status_code)
+    except httpx.HTTPError as exc:
+        error = exc.__class__.__name__
+    recorder.add(operation, time.perf_counter() - started, error)
+
+
+async def run_load(base_url: str, args: argparse.Namespace) -> Tuple[Recorder, Dict[str, object]]:
+    workload = Workload(args)
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        for tenant in workload.tenants:
+            if tenant:
+                await client.post('/tenants', json={'tenant_id': tenant, 'name': tenant, 'status': 'active', 'tags': []})
+        seed = Recorder()
+        for _ in range(args.seed_docs):
+            await _ingest(client, workload, seed)
+        failed = [sample for sample in seed.samples if sample.error]
+        if failed:
+            raise RuntimeError(f'Seeding the corpus failed: {failed[0].error}')
+
+        recorder = Recorder(started=time.perf_counter())
+        deadline = recorder.started + args.duration
+
+        async def client_loop() -> None:
+            while time.perf_counter() < deadline:
+                if workload.rng.random() < args.chat_ratio:
+                    await _chat(client, workload, recorder, workload.rng.random() < args.stream_ratio)
+                else:
+                    await _ingest(client, workload, recorder)
+
+        await asyncio.gather(*(client_loop() for _ in range(args.clients)))
+        recorder.finished = time.perf_counter()
+        extras: Dict[str, object] = {}
+        try:
+            extras['ollama_pool'] = (await client.get('/debug/ollama')).json()
+        except (httpx.HTTPError, ValueError):
+            pass
+    return recorder, extras
+
+
+def _print_report(report: Dict[str, Dict[str, float]]) -> None:
+    columns = ('requests', 'errors', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+    print(f'{"operation":<18}' + ''.join(f'{column:>16}' for column in columns))
+    for operation in sorted(report, key=lambda name: (name == 'all', name)):
+        print(f'{operation:<18}' + ''.join(f'{report[operation][column]:>16}' for column in columns))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Replay mixed chat and ingest load against the API.')
+    parser.add_argument('--target', help='URL of a running API; by default a local stack with a fake Ollama is started')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--chat-ratio', type=float, default=0.8)
+    parser.add_argument('--stream-ratio', type=float, default=0.5)
+    parser.add_argument('--tenants', type=int, default=4, help='0 sends untenanted requests')
+    parser.add_argument('--seed-docs', type=int, default=8)
+    parser.add_argument('--doc-kb', type=int, default=32)
+    parser.add_argument('--query-pool', type=int, default=200, help='distinct questions; repeats exercise caching')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--app-env', action='append', default=[], metavar='KEY=VALUE', help='extra settings for the local API')
+    parser.add_argument('--json', type=Path, help='write the report to this file')
+    parser.add_argument('--verbose', action='store_true', help='show the local servers\' logs')
+    defaults = FakeOllamaConfig()
+    for name, value in vars(defaults).items():
+        parser.add_argument(f'--{name.replace("_", "-")}', type=type(value), default=value, help='fake Ollama')
+    args = parser.parse_args(argv)
+
+    if args.target:
+        recorder, extras = asyncio.run(run_load(args.target, args))
+    else:
+        config = FakeOllamaConfig(**{name: getattr(args, name) for name in vars(defaults)})
+        app_env = dict(item.split('=', 1) for item in args.app_env)
+        with local_stack(config, app_env, args.verbose) as base_url:
+            recorder, extras = asyncio.run(run_load(base_url, args))
+
+    report = summarize(recorder)
+    _print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps({'report': report, **extras}, indent=2))
+    return 1 if report.get('all', {}).get('errors') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,6 @@
 import contextlib
+import json
+import re
 from typing import List, Optional
 
 import pytest
@@ -7,14 +9,28 @@ from fastapi.testclient import TestClient
 from app.main import app as fastapi_app
 from app.main import get_pipeline as get_pipeline_dependency
 from app import main as main_module
+from app.chunking import TextChunk
 from app.rag_core import RetrievedChunk
+from app.scheduler import OllamaBusyError, OllamaScheduler
+
+
+def word_chunks(text):
+    return [TextChunk(text=match.group(), start=match.start(), end=match.end()) for match in re.finditer(r'\S+', text)]
 
 
 class StubPipeline:
     def __init__(self) -> None:
         self.upsert_payload = None
+        self.upsert_batches = []
         self.retrieve_args = None
         self.ensure_called = False
+        self.scheduler = OllamaScheduler(0, 0, 0)
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
 
     async def ensure_collection(self) -> None:
         self.ensure_called = True
@@ -22,8 +38,23 @@ class StubPipeline:
     def split_text(self, text: str) -> List[str]:
         return [text]
 
-    async def upsert_chunks(self, chunks):
+    def chunk_stream(self, segments):
+        text = ''.join(segments).strip()
+        if text:
+            yield TextChunk(text=text, start=0, end=len(text))
+
+    async def existing_chunks(self, source, tenant_id):
+        return {}
+
+    async def delete_chunks(self, chunk_ids, tenant_id=None):
+        return len(chunk_ids)
+
+    async def set_chunk_tags(self, chunk_ids, tags, tenant_id=None):
+        pass
+
+    async def upsert_chunks(self, chunks, on_embedded=None):
         self.upsert_payload = chunks
+        self.upsert_batches.append(len(chunks))
         return len(chunks)
 
     async def retrieve(
@@ -32,6 +63,7 @@ class StubPipeline:
         top_k: int,
         tenant_id: Optional[str] = None,
         tags: Optional[List[str]] = None,
+        mmr_lambda: Optional[float] = None,
     ) -> List[RetrievedChunk]:
         self.retrieve_args = (query, top_k, tenant_id, tags)
         return [
@@ -45,9 +77,19 @@ class StubPipeline:
     async def generate_answer(self, query, retrieved, conversation=None):
         return ('Stub answer for ' + query, [{'source': 'doc.txt', 'score': 0.88, 'text': 'Context snippet', 'chunk_id': 'chunk-1'}])
 
+    def build_prompt(self, query, retrieved, conversation=None):
+        sources = [{'source': 'doc.txt', 'score': 0.88, 'text': 'Context snippet', 'chunk_id': 'chunk-1'}]
+        return [{'role': 'user', 'content': query}], sources
+
+    async def stream_chat(self, messages):
+        for token in ['Stub ', 'answer']:
+            yield {'message': {'content': token}, 'done': False}
+        yield {'message': {'content': ''}, 'done': True, 'eval_count': 2, 'prompt_eval_count': 7}
+
 
 @pytest.fixture()
-def client():
+def client(monkeypatch):
+    monkeypatch.setattr(main_module.settings, 'ollama_warmup', False)
     stub = StubPipeline()
     original_pipeline = getattr(main_module, '_pipeline', None)
     main_module._pipeline = stub
@@ -83,6 +125,24 @@ def test_ingest_uploads_file(client):
     assert 'testing' in chunk_metadata['tags']
 
 
+def test_ingest_indexes_in_bounded_batches(client, monkeypatch):
+    http, stub = client
+    monkeypatch.setattr(main_module.settings, 'ingest_batch_size', 2)
+    monkeypatch.setattr(stub, 'chunk_stream', lambda segments: iter(word_chunks(''.join(segments))))
+    files = [
+        ('files', ('a.txt', b'one two three', 'text/plain')),
+        ('files', ('b.txt', b'four five', 'text/plain')),
+        ('files', ('c.svg', b'<svg/>', 'image/svg+xml')),
+    ]
+    response = http.post('/ingest', files=files)
+    assert response.status_code == 200
+    body = response.json()
+    assert body['files_processed'] == 2
+    assert body['chunks_indexed'] == 5
+    assert 'c.svg' in body['skipped']
+    assert stub.upsert_batches == [2, 2, 1]
+
+
 def test_chat_returns_answer_and_sources(client):
     http, stub = client
     payload = {
@@ -102,6 +162,40 @@ def test_chat_returns_answer_and_sources(client):
 
 
 
+def test_chat_stream_sends_sources_tokens_then_done(client):
+    http, _ = client
+    response = http.post('/chat', json={'query': 'What is AI?', 'stream': True})
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/event-stream')
+    events = [
+        (block.split('\n')[0][len('event: '):], json.loads(block.split('\n')[1][len('data: '):]))
+        for block in response.text.strip().split('\n\n')
+    ]
+    names = [name for name, _ in events]
+    assert names == ['sources', 'token', 'token', 'done']
+    assert events[0][1][0]['source'] == 'doc.txt'
+    assert ''.join(data['content'] for name, data in events if name == 'token') == 'Stub answer'
+    assert events[-1][1]['completion_tokens'] == 2
+    assert events[-1][1]['timings']['first_token_ms'] is not None
+
+
+def test_chat_returns_429_when_ollama_queue_is_full(client, monkeypatch):
+    http, stub = client
+    stub.scheduler = OllamaScheduler(1, 0, 0)
+    stub.scheduler._active = 1
+    response = http.post('/chat', json={'query': 'What is AI?', 'stream': True})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+    async def busy(query, retrieved, conversation=None):
+        raise OllamaBusyError('interactive', 7)
+
+    monkeypatch.setattr(stub, 'generate_answer', busy)
+    response = http.post('/chat', json={'query': 'What is AI?'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '7'
+
+
 def test_swagger_ui_served(client):
     http, _ = client
     response = http.get('/swagger')
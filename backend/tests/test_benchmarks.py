@@ -0,0 +1,69 @@
+import json
+from pathlib import Path
+
+from benchmarks import corpora
+from benchmarks.run import Result, compare, machine_factor, main
+
+from app.parsers import extract_text
+
+
+def test_generated_corpora_parse():
+    assert 'Section 1' in corpora.markdown_text(2000)
+    assert extract_text('report.pdf', corpora.pdf_document(2, lines_per_page=3)).count('\n') >= 1
+    assert 'customer-' in extract_text('orders.csv', corpora.csv_document(5))
+    assert '# Sheet: orders' in extract_text('orders.xlsx', corpora.xlsx_document(5))
+
+
+def test_compare_flags_throughput_and_memory_regressions():
+    baseline = {
+        'calibration_seconds': 1.0,
+        'results': {'split_text[window]': {'throughput': 100.0, 'peak_mb': 10.0}},
+    }
+    fast = Result('split_text[window]', 'MB/s', 1.0, 0.01, 90.0, 10.5)
+    assert compare([fast], baseline, 1.0, 0.25, 0.2) == []
+    slow = Result('split_text[window]', 'MB/s', 1.0, 0.02, 50.0, 30.0)
+    assert len(compare([slow], baseline, 1.0, 0.25, 0.2)) == 2
+    # On a machine twice as slow the same throughput is within budget.
+    assert compare([Result('split_text[window]', 'MB/s', 1.0, 0.02, 50.0, 10.0)], baseline, 2.0, 0.25, 0.2) == []
+
+
+def test_machine_factor_uses_median_ratio_across_cases():
+    names = ['a', 'b', 'c', 'd', 'e']
+    baseline = {
+        'calibration_seconds': 1.0,
+        'results': {name: {'throughput': 100.0, 'peak_mb': 1.0} for name in names},
+    }
+    # The whole run is 20% slower and one case regressed further; only that case is flagged.
+    results = [Result(name, 'MB/s', 1.0, 0.01, 80.0, 1.0) for name in names[:4]]
+    results.append(Result('e', 'MB/s', 1.0, 0.01, 40.0, 1.0))
+    assert machine_factor(results, baseline, 5.0) == 0.8
+    [failure] = compare(results, baseline, 5.0, 0.25, 0.2)
+    assert failure.startswith('e: throughput')
+
+
+def test_compare_flags_slowdowns_shared_by_most_cases():
+    names = ['a', 'b', 'c', 'd', 'e']
+    baseline = {
+        'calibration_seconds': 1.0,
+        'results': {name: {'throughput': 100.0, 'peak_mb': 1.0} for name in names},
+    }
+    # Every case halved on a machine as fast as the baseline's: the median absorbs it, the calibration does not.
+    results = [Result(name, 'MB/s', 1.0, 0.02, 50.0, 1.0) for name in names]
+    [failure] = compare(results, baseline, 1.0, 0.25, 0.2)
+    assert failure.startswith('all cases: median throughput ratio 0.50')
+    assert compare(results, baseline, 2.0, 0.25, 0.2) == []
+
+
+def test_run_writes_and_checks_baseline(tmp_path: Path):
+    baseline = tmp_path / 'baseline.json'
+    args = ['--scale', '0.01', '--repeat', '1', '--min-seconds', '0', '--only', 'split_text', '--baseline', str(baseline)]
+    assert main(args + ['--update-baseline', '--baseline-runs', '2']) == 0
+    recorded = json.loads(baseline.read_text())
+    assert set(recorded['results']) == {'split_text[structured]', 'split_text[window]'}
+    recorded['results']['split_text[window]']['throughput'] *= 1000
+    baseline.write_text(json.dumps(recorded))
+    assert main(args) == 1
+    # Baselines from another interpreter release are not compared.
+    recorded['python'] = '2.7.18'
+    baseline.write_text(json.dumps(recorded))
+    assert main(args) == 0
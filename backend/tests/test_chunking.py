@@ -0,0 +1,74 @@
+from app.chunking import StructuredChunker, WindowChunker, make_chunker
+from app.settings import Settings
+
+DOC = '''# Guide
+
+Intro paragraph one. It has two sentences.
+
+## Install
+
+Run the installer. Then reboot the machine! Done?
+
+```
+# not a heading
+code line
+```
+
+## Usage
+''' + 'Use it well. ' * 20
+
+
+def test_structured_chunks_follow_headings_and_sentences():
+    chunks = list(StructuredChunker(80, 20).chunks([DOC]))
+    assert chunks[0].text == '# Guide\n\nIntro paragraph one. It has two sentences.'
+    assert chunks[0].headings == ['Guide']
+    assert chunks[1].headings == ['Guide', 'Install']
+    assert chunks[1].text.endswith('Done?')
+    assert '# not a heading' in chunks[1].text or '# not a heading' in chunks[2].text
+    assert all(chunk.headings == ['Guide', 'Usage'] for chunk in chunks[-2:])
+    assert all(chunk.text.endswith('well.') and len(chunk.text) <= 80 for chunk in chunks[-3:])
+    for chunk in chunks:
+        assert DOC[chunk.start:chunk.end] == chunk.text
+
+
+def test_structured_chunks_are_independent_of_segmentation():
+    chunker = StructuredChunker(60, 10)
+    segments = [DOC[i:i + 7] for i in range(0, len(DOC), 7)]
+    assert [vars(c) for c in chunker.chunks(segments)] == [vars(c) for c in chunker.chunks([DOC])]
+    crlf = list(chunker.chunks(['first line\r', '\nsecond line\r\n']))
+    assert [chunk.text for chunk in crlf] == ['first line\nsecond line']
+
+
+def test_unbroken_text_falls_back_to_overlapping_windows():
+    text = 'x' * 5000
+    chunks = list(StructuredChunker(100, 10).chunks([text[i:i + 333] for i in range(0, len(text), 333)]))
+    assert all(len(chunk.text) <= 100 for chunk in chunks)
+    assert all(text[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+    assert chunks[-1].end == len(text)
+
+
+def test_table_of_contents_headings_are_flushed_by_size():
+    text = ''.join(f'## Chapter {i}: a fairly long chapter title\n' for i in range(2000)) + '\nBody text.'
+    chunker = StructuredChunker(800, 100)
+    chunks = list(chunker.chunks([text[i:i + 4096] for i in range(0, len(text), 4096)]))
+    assert len(chunks) > 100
+    assert all(len(chunk.text) <= 800 for chunk in chunks)
+    assert all(text[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+    assert chunks[-1].text.endswith('Body text.')
+
+
+def test_oversized_heading_line_is_windowed():
+    text = '# ' + 'very long title ' * 300 + '\n\nBody text.'
+    chunks = list(StructuredChunker(200, 20).chunks([text]))
+    assert all(len(chunk.text) <= 200 for chunk in chunks)
+    assert all(text[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+    assert chunks[0].text.startswith('# very long title')
+    assert chunks[-1].text.endswith('Body text.')
+
+
+def test_window_chunker_reports_offsets():
+    text = '  abcdefghij' * 3
+    chunks = list(WindowChunker(10, 3).chunks([text]))
+    assert all(text[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+    assert isinstance(make_chunker(Settings(chunk_strategy='window')), WindowChunker)
+    assert isinstance(make_chunker(Settings()), StructuredChunker)
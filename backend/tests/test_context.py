@@ -0,0 +1,63 @@
+from app.context import ContextPacker, estimate_tokens, truncate_to_tokens
+from app.rag_core import RetrievedChunk
+
+
+def chunk(text, score, source='guide.md', index=None):
+    metadata = {'source': source}
+    if index is not None:
+        metadata['chunk_index'] = index
+    return RetrievedChunk(text=text, score=score, metadata=metadata)
+
+
+def test_overlapping_neighbours_are_merged_once():
+    packer = ContextPacker(max_tokens=1000, max_chars=10000, max_overlap=20)
+    spans, included = packer.pack(
+        [
+            chunk('alpha beta gamma delta', 0.9, index=0),
+            chunk('gamma delta epsilon zeta', 0.8, index=1),
+            chunk('unrelated text', 0.7, source='other.md', index=0),
+        ]
+    )
+    assert [span.text(20) for span in spans] == ['alpha beta gamma delta epsilon zeta', 'unrelated text']
+    assert len(included) == 3
+    rendered = packer.render(spans)
+    assert rendered.count('gamma delta') == 1
+    assert rendered.startswith('[Source 1] guide.md\n')
+
+
+def test_chunk_bridging_two_spans_collapses_them():
+    packer = ContextPacker(max_tokens=1000, max_chars=10000, max_overlap=0)
+    spans, _ = packer.pack([chunk('one', 0.9, index=0), chunk('three', 0.8, index=2), chunk('two', 0.7, index=1)])
+    assert len(spans) == 1
+    assert spans[0].text(0) == 'onetwothree'
+
+
+def test_duplicates_and_covered_chunks_are_dropped():
+    packer = ContextPacker(max_tokens=1000, max_chars=10000, max_overlap=10)
+    spans, included = packer.pack(
+        [
+            chunk('same text here', 0.9, source='a.md', index=0),
+            chunk('same  text here', 0.8, source='b.md', index=0),
+            chunk('text', 0.7, source='a.md', index=4),
+        ]
+    )
+    assert len(spans) == 1
+    assert [item.score for item in included] == [0.9]
+
+
+def test_budget_is_filled_by_relevance():
+    first = 'word ' * 40
+    packer = ContextPacker(max_tokens=60, max_chars=10000, max_overlap=0)
+    spans, included = packer.pack(
+        [chunk('low ' * 30, 0.1, source='low.md'), chunk(first, 0.9, source='high.md'), chunk('tiny', 0.5, source='t.md')]
+    )
+    assert [span.source for span in spans] == ['high.md', 't.md']
+    assert sum(estimate_tokens(block) for block in packer.render(spans).split('\n\n')) <= 60
+
+
+def test_oversized_top_chunk_is_truncated_to_budget():
+    packer = ContextPacker(max_tokens=10, max_chars=10000, max_overlap=0)
+    spans, included = packer.pack([chunk('token ' * 100, 0.9)])
+    assert len(spans) == 1
+    assert estimate_tokens(packer.render(spans)) <= 10
+    assert included[0].text == truncate_to_tokens('token ' * 100, 10 - estimate_tokens('[Source 1] guide.md\n'))
@@ -0,0 +1,103 @@
+import asyncio
+import io
+from typing import Dict, List
+
+from app.chunking import TextChunk
+from app.ingestion import IngestProgress, ingest_files
+from app.settings import Settings
+
+
+class MemoryPipeline:
+    def __init__(self) -> None:
+        self.points: Dict[str, dict] = {}
+        self.embedded: List[str] = []
+
+    def chunk_stream(self, segments):
+        offset = 0
+        for line in ''.join(segments).split('\n'):
+            if line:
+                yield TextChunk(text=line, start=offset, end=offset + len(line))
+            offset += len(line) + 1
+
+    async def existing_chunks(self, source, tenant_id):
+        return {
+            chunk_id: payload.get('tags', [])
+            for chunk_id, payload in self.points.items()
+            if payload['source'] == source and payload.get('tenant_id') == tenant_id
+        }
+
+    async def upsert_chunks(self, chunks, on_embedded=None):
+        self.embedded.extend(chunk.text for chunk in chunks)
+        for chunk in chunks:
+            self.points[chunk.chunk_id] = {**chunk.metadata, 'text': chunk.text}
+        return len(chunks)
+
+    async def delete_chunks(self, chunk_ids, tenant_id=None):
+        for chunk_id in chunk_ids:
+            del self.points[chunk_id]
+        return len(chunk_ids)
+
+    async def set_chunk_tags(self, chunk_ids, tags, tenant_id=None):
+        for chunk_id in chunk_ids:
+            self.points[chunk_id]['tags'] = tags
+
+
+def ingest(pipeline, text: bytes, tags=None) -> IngestProgress:
+    settings = Settings(ingest_batch_size=2)
+    files = [('guide.txt', io.BytesIO(text))]
+    return asyncio.run(ingest_files(pipeline, settings, files, 'acme', tags or [], IngestProgress()))
+
+
+def test_reingest_only_embeds_changed_chunks_and_removes_stale():
+    pipeline = MemoryPipeline()
+    first = ingest(pipeline, b'intro\nsetup\nusage\nfaq')
+    assert first.chunks_upserted == 4
+    first_ids = set(pipeline.points)
+
+    unchanged = ingest(pipeline, b'intro\nsetup\nusage\nfaq')
+    assert unchanged.chunks_upserted == 0
+    assert unchanged.chunks_unchanged == 4
+    assert set(pipeline.points) == first_ids
+
+    pipeline.embedded.clear()
+    edited = ingest(pipeline, b'intro\nsetup v2\nusage')
+    assert pipeline.embedded == ['setup v2']
+    assert edited.chunks_unchanged == 2
+    assert edited.chunks_deleted == 2
+    assert sorted(payload['text'] for payload in pipeline.points.values()) == ['intro', 'setup v2', 'usage']
+
+
+def test_reingest_with_new_tags_updates_payload_without_embedding():
+    pipeline = MemoryPipeline()
+    ingest(pipeline, b'intro\nsetup')
+    pipeline.embedded.clear()
+    progress = ingest(pipeline, b'intro\nsetup', tags=['docs'])
+    assert pipeline.embedded == []
+    assert progress.chunks_unchanged == 2
+    assert all(payload['tags'] == ['docs'] for payload in pipeline.points.values())
+
+
+def test_reingest_of_emptied_file_removes_its_chunks():
+    pipeline = MemoryPipeline()
+    ingest(pipeline, b'intro\nsetup')
+    progress = ingest(pipeline, b'')
+    assert progress.errors == {'guide.txt': 'File contained no readable text'}
+    assert progress.chunks_deleted == 2
+    assert pipeline.points == {}
+
+
+def test_reingest_upserts_points_flagged_for_reindexing():
+    pipeline = MemoryPipeline()
+    ingest(pipeline, b'intro\nsetup')
+    existing_chunks = pipeline.existing_chunks
+
+    async def flag_all(source, tenant_id):
+        return {chunk_id: None for chunk_id in await existing_chunks(source, tenant_id)}
+
+    pipeline.existing_chunks = flag_all
+    pipeline.embedded.clear()
+    progress = ingest(pipeline, b'intro\nsetup')
+    assert pipeline.embedded == ['intro', 'setup']
+    assert progress.chunks_unchanged == 0
+    assert progress.chunks_deleted == 0
+    assert len(pipeline.points) == 2
@@ -0,0 +1,178 @@
+import asyncio
+import re
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main as main_module
+from app.chunking import TextChunk
+from app.jobs import IngestJobManager, JobStore
+from app.main import app as fastapi_app
+from app.main import get_job_manager as get_job_manager_dependency
+from app.main import get_pipeline as get_pipeline_dependency
+
+
+class StubPipeline:
+    def __init__(self) -> None:
+        self.upserted: List[str] = []
+        self.release = asyncio.Event()
+        self.block = False
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def ensure_collection(self) -> None:
+        pass
+
+    def chunk_stream(self, segments):
+        for match in re.finditer(r'\S+', ''.join(segments)):
+            yield TextChunk(text=match.group(), start=match.start(), end=match.end())
+
+    async def existing_chunks(self, source, tenant_id):
+        return {}
+
+    async def delete_chunks(self, chunk_ids, tenant_id=None):
+        return len(chunk_ids)
+
+    async def set_chunk_tags(self, chunk_ids, tags, tenant_id=None):
+        pass
+
+    async def upsert_chunks(self, chunks, on_embedded=None):
+        if self.block:
+            await self.release.wait()
+        if on_embedded is not None:
+            on_embedded(len(chunks))
+        self.upserted.extend(chunk.text for chunk in chunks)
+        return len(chunks)
+
+
+@pytest.fixture()
+def jobs_client(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(main_module.settings, 'ollama_warmup', False)
+    stub = StubPipeline()
+    manager = IngestJobManager(JobStore(tmp_path / 'jobs'), main_module.settings, lambda: stub)
+    original_pipeline = main_module._pipeline
+    original_manager = main_module._job_manager
+    main_module._pipeline = stub
+    main_module._job_manager = manager
+    fastapi_app.dependency_overrides[get_pipeline_dependency] = lambda: stub
+    fastapi_app.dependency_overrides[get_job_manager_dependency] = lambda: manager
+    with TestClient(fastapi_app) as test_client:
+        yield test_client, stub, manager
+    fastapi_app.dependency_overrides.clear()
+    main_module._pipeline = original_pipeline
+    main_module._job_manager = original_manager
+
+
+def wait_for_status(http, job_id, statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        body = http.get(f'/ingest/jobs/{job_id}').json()
+        if body['status'] in statuses:
+            return body
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} never reached {statuses}')
+
+
+def test_background_ingest_reports_progress(jobs_client):
+    http, stub, _ = jobs_client
+    files = [
+        ('files', ('a.txt', b'alpha beta', 'text/plain')),
+        ('files', ('b.svg', b'<svg/>', 'image/svg+xml')),
+    ]
+    response = http.post('/ingest', files=files, data={'background': 'true'})
+    assert response.status_code == 202
+    job_id = response.json()['job_id']
+
+    body = wait_for_status(http, job_id, {'completed'})
+    assert body['files_total'] == 2
+    assert body['files_parsed'] == 1
+    assert body['chunks_embedded'] == 2
+    assert body['chunks_upserted'] == 2
+    assert 'b.svg' in body['errors']
+    assert stub.upserted == ['alpha', 'beta']
+    assert [job['job_id'] for job in http.get('/ingest/jobs').json()['jobs']] == [job_id]
+
+
+def test_cancel_running_job(jobs_client, monkeypatch):
+    http, stub, _ = jobs_client
+    stub.block = True
+    monkeypatch.setattr(main_module.settings, 'ingest_batch_size', 1)
+    files = {'files': ('a.txt', b'one two three', 'text/plain')}
+    job_id = http.post('/ingest', files=files, data={'background': 'true'}).json()['job_id']
+    wait_for_status(http, job_id, {'running'})
+
+    response = http.post(f'/ingest/jobs/{job_id}/cancel')
+    assert response.status_code == 200
+    assert response.json()['cancel_requested'] is True
+    http.portal.call(stub.release.set)
+
+    body = wait_for_status(http, job_id, {'cancelled'})
+    assert body['chunks_upserted'] == 1
+    assert stub.upserted == ['one']
+
+
+def test_jobs_survive_restart(tmp_path: Path):
+    stub = StubPipeline()
+    store = JobStore(tmp_path / 'jobs')
+
+    async def scenario():
+        job_id = 'a3c5b0de-7c1f-4ad4-9a52-1d3a3b1f6c11'
+        store.files_dir(job_id).mkdir(parents=True)
+        (store.files_dir(job_id) / '00000').write_bytes(b'persisted words')
+        await store.save(
+            {
+                'job_id': job_id,
+                'status': 'running',
+                'tenant_id': None,
+                'tags': [],
+                'files': ['notes.txt'],
+                'files_total': 1,
+                'files_parsed': 0,
+                'chunks_embedded': 0,
+                'chunks_upserted': 0,
+                'errors': {},
+                'error': None,
+                'created_at': '2024-01-01T00:00:00Z',
+            }
+        )
+        manager = IngestJobManager(store, main_module.settings, lambda: stub)
+        await manager.start()
+        await asyncio.wait_for(manager._queue.join(), timeout=5)
+        await manager.stop()
+        return await store.load(job_id)
+
+    record = asyncio.run(scenario())
+    assert record['status'] == 'completed'
+    assert stub.upserted == ['persisted', 'words']
+
+
+def test_prune_removes_only_expired_finished_jobs(tmp_path: Path):
+    store = JobStore(tmp_path / 'jobs')
+    ids = {
+        'old_done': '0b8f3c8e-1111-4c1a-9a52-1d3a3b1f6c11',
+        'new_done': '0b8f3c8e-2222-4c1a-9a52-1d3a3b1f6c11',
+        'old_running': '0b8f3c8e-3333-4c1a-9a52-1d3a3b1f6c11',
+    }
+    for name, job_id in ids.items():
+        store._write(
+            {
+                'job_id': job_id,
+                'status': 'running' if name == 'old_running' else 'completed',
+                'created_at': '2024-01-01T00:00:00Z',
+                'updated_at': '2024-01-01T00:00:00Z' if name.startswith('old') else '2999-01-01T00:00:00Z',
+            }
+        )
+
+    removed = asyncio.run(store.prune(24))
+
+    assert removed == 1
+    assert not store.job_dir(ids['old_done']).exists()
+    assert store.job_dir(ids['new_done']).exists()
+    assert store.job_dir(ids['old_running']).exists()
@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+import httpx
+
+from loadtest.fake_ollama import FakeOllamaConfig, create_app, embed
+from loadtest.run import Recorder, percentile, summarize
+
+
+def test_fake_ollama_embeds_and_streams():
+    config = FakeOllamaConfig(embed_dim=16, embed_latency_ms=0, embed_item_ms=0, chat_latency_ms=0, tokens_per_second=0, answer_tokens=3)
+
+    async def scenario():
+        async with httpx.AsyncClient(app=create_app(config), base_url='http://test') as client:
+            embedded = (await client.post('/api/embed', json={'input': ['alpha beta', 'alpha beta']})).json()
+            messages = [{'role': 'user', 'content': 'What about gamma?'}]
+            streamed = await client.post('/api/chat', json={'messages': messages, 'stream': True})
+            answer = (await client.post('/api/chat', json={'messages': messages, 'stream': False})).json()
+            stats = (await client.get('/stats')).json()
+        return embedded, [json.loads(line) for line in streamed.text.splitlines()], answer, stats
+
+    embedded, chunks, answer, stats = asyncio.run(scenario())
+    assert len(embedded['embeddings'][0]) == 16
+    assert embedded['embeddings'][0] == embedded['embeddings'][1] == embed('alpha beta', 16)
+    assert len(chunks) == 4 and chunks[-1]['done'] and chunks[-1]['eval_count'] == 3
+    assert answer['done'] and len(answer['message']['content'].split()) == 3
+    assert stats == {'embed_requests': 1, 'embedded_inputs': 2, 'chat_requests': 2}
+
+
+def test_summarize_reports_percentiles_and_errors():
+    assert percentile([], 95) == 0.0
+    assert percentile([float(value) for value in range(1, 101)], 99) == 99.0
+    recorder = Recorder(started=0.0, finished=2.0)
+    for value in (0.1, 0.2, 0.3):
+        recorder.add('chat', value)
+    recorder.add('chat', 5.0, error='500')
+    recorder.add('chat_stream_ttft', 0.05)
+    report = summarize(recorder)
+    assert report['chat']['requests'] == 4 and report['chat']['errors'] == 1
+    assert report['chat']['max_ms'] == 300.0
+    assert report['all']['throughput_rps'] == 2.0
@@ -0,0 +1,93 @@
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app import main as main_module
+from app import metrics
+from app.main import app as fastapi_app
+from app.main import get_pipeline as get_pipeline_dependency
+from app.rag_core import RetrievedChunk
+
+
+class StubPipeline:
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def ensure_collection(self) -> None:
+        pass
+
+    async def retrieve(self, query, top_k, tenant_id=None, tags=None, mmr_lambda=None):
+        return [RetrievedChunk(text='Context snippet', score=0.88, metadata={'source': 'doc.txt'})]
+
+    async def generate_answer(self, query, retrieved, conversation=None):
+        return 'Stub answer for ' + query, [{'source': 'doc.txt', 'score': 0.88, 'text': 'Context snippet'}]
+
+
+@pytest.fixture()
+def client(monkeypatch):
+    monkeypatch.setattr(main_module.settings, 'ollama_warmup', False)
+    stub = StubPipeline()
+    monkeypatch.setattr(main_module, '_pipeline', stub)
+    fastapi_app.dependency_overrides[get_pipeline_dependency] = lambda: stub
+    with TestClient(fastapi_app) as test_client:
+        yield test_client
+    fastapi_app.dependency_overrides.clear()
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_stage_records_histogram_and_request_timings():
+    before = _sample('rag_stage_duration_seconds_count', stage='search', tenant='acme', model='embed')
+    with metrics.request_scope('acme') as scope:
+        with metrics.stage('search', 'embed'):
+            pass
+        with metrics.stage('search', 'embed'):
+            pass
+        assert metrics.tenant_label() == 'acme'
+    assert metrics.tenant_label() == 'none'
+    assert _sample('rag_stage_duration_seconds_count', stage='search', tenant='acme', model='embed') == before + 2
+    assert list(scope.timings) == ['search']
+    assert metrics.server_timing({'search': 0.0125, 'total': 0.5}) == 'search;dur=12.5, total;dur=500.0'
+
+
+def test_timed_iter_observes_once_and_counts_tokens():
+    before = _sample('rag_stage_duration_seconds_count', stage='extract', tenant='globex', model='')
+    tokens = _sample('rag_tokens_total', kind='completion', tenant='globex', model='llm')
+    with metrics.request_scope('globex') as scope:
+        assert list(metrics.timed_iter(iter(['a', 'b']), 'extract', elapsed=1.0)) == ['a', 'b']
+        metrics.count_tokens({'prompt_eval_count': 12, 'eval_count': 3}, 'llm')
+    assert _sample('rag_stage_duration_seconds_count', stage='extract', tenant='globex', model='') == before + 1
+    assert scope.timings['extract'] >= 1.0
+    assert _sample('rag_tokens_total', kind='completion', tenant='globex', model='llm') == tokens + 3
+
+
+def test_unregistered_tenants_are_labelled_none():
+    metrics.set_tenant_registry({'acme'}.__contains__)
+    try:
+        assert metrics.tenant_label('acme') == 'acme'
+        assert metrics.tenant_label('made-up') == 'none'
+        with metrics.request_scope('made-up') as scope:
+            assert scope.tenant == 'none'
+            assert metrics.tenant_label() == 'none'
+    finally:
+        metrics.set_tenant_registry(None)
+
+
+def test_app_labels_only_tenants_in_its_store(client):
+    assert metrics.tenant_label('made-up') == 'none'
+    assert metrics._known_tenant == main_module._tenant_store.known
+
+
+def test_chat_reports_server_timing_and_metrics(client):
+    response = client.post('/chat', json={'query': 'What is JamAI?'})
+    assert response.status_code == 200
+    assert 'total;dur=' in response.headers['server-timing']
+
+    metrics_response = client.get('/metrics')
+    assert metrics_response.status_code == 200
+    assert 'rag_stage_duration_seconds' in metrics_response.text
@@ -1,8 +1,14 @@
+import asyncio
 import io
+import os
+import signal
+import time
 
 import pytest
 
 from app import parsers
+from app.parse_pool import ParserPool
+from app.settings import Settings
 
 
 def test_extract_text_from_txt():
@@ -21,3 +27,66 @@ def test_extract_text_from_csv():
 def test_extract_text_unsupported():
     with pytest.raises(parsers.UnsupportedFileTypeError):
         parsers.extract_text('diagram.svg', b'<svg></svg>')
+
+
+def test_parser_pool_extracts_in_worker_process(tmp_path):
+    pool = ParserPool(Settings(data_dir=tmp_path, parse_workers=1))
+
+    async def scenario():
+        try:
+            text = ''.join(await pool.extract('people.csv', io.BytesIO(b'name,role\nAlex,Engineer\n')))
+            with pytest.raises(parsers.ParseError):
+                await pool.extract('broken.pdf', io.BytesIO(b'not a pdf'))
+            with pytest.raises(parsers.UnsupportedFileTypeError):
+                await pool.extract('diagram.svg', io.BytesIO(b'<svg></svg>'))
+            return text
+        finally:
+            await pool.close()
+
+    assert asyncio.run(scenario()) == 'name\trole\nAlex\tEngineer\n'
+    assert list((tmp_path / 'tmp').iterdir()) == []
+
+
+def _crash_on_poison(filename, source, target, timeout=None):
+    # Runs in the spawned worker: the poison file kills it while the other file is still parsing.
+    if filename.startswith('poison'):
+        time.sleep(0.3)
+        os._exit(1)
+    time.sleep(1.5)
+    return parsers.extract_to_file(filename, source, target, timeout)
+
+
+def test_parser_pool_retries_files_caught_in_a_worker_crash(tmp_path, monkeypatch):
+    monkeypatch.setattr(parsers, 'extract_to_file', _crash_on_poison)
+    pool = ParserPool(Settings(data_dir=tmp_path, parse_workers=2))
+
+    async def extract(filename):
+        return ''.join(await pool.extract(filename, io.BytesIO(b'plain text')))
+
+    async def scenario():
+        try:
+            return await asyncio.gather(extract('poison.txt'), extract('innocent.txt'), return_exceptions=True)
+        finally:
+            await pool.close()
+
+    poisoned, innocent = asyncio.run(scenario())
+    assert isinstance(poisoned, parsers.ParseError)
+    assert innocent == 'plain text'
+    assert list((tmp_path / 'tmp').iterdir()) == []
+
+
+def test_extract_to_file_enforces_timeout(tmp_path, monkeypatch):
+    source = tmp_path / 'slow.txt'
+    source.write_bytes(b'slow')
+
+    def slow_parser(stream):
+        time.sleep(2)
+        yield 'never'
+
+    monkeypatch.setitem(parsers._PARSERS, '.txt', slow_parser)
+    previous = signal.signal(signal.SIGALRM, parsers._on_alarm)
+    try:
+        with pytest.raises(parsers.ParseTimeoutError):
+            parsers.extract_to_file('slow.txt', str(source), str(tmp_path / 'out.txt'), timeout=0.1)
+    finally:
+        signal.signal(signal.SIGALRM, previous)
@@ -0,0 +1,119 @@
+import tracemalloc
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main as main_module
+from app.main import app as fastapi_app
+from app.main import get_pipeline as get_pipeline_dependency
+from app.profiling import ProfileStore, RequestProfiler
+from app.rag_core import RetrievedChunk
+from app.settings import Settings
+
+
+class StubPipeline:
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def ensure_collection(self) -> None:
+        pass
+
+    async def retrieve(self, query, top_k, tenant_id=None, tags=None, mmr_lambda=None):
+        return [RetrievedChunk(text='Context snippet', score=0.88, metadata={'source': 'doc.txt'})]
+
+    async def generate_answer(self, query, retrieved, conversation=None):
+        return 'Stub answer for ' + query, [{'source': 'doc.txt', 'score': 0.88, 'text': 'Context snippet'}]
+
+
+@pytest.fixture()
+def client(monkeypatch):
+    monkeypatch.setattr(main_module.settings, 'ollama_warmup', False)
+    stub = StubPipeline()
+    monkeypatch.setattr(main_module, '_pipeline', stub)
+    fastapi_app.dependency_overrides[get_pipeline_dependency] = lambda: stub
+    with TestClient(fastapi_app) as test_client:
+        yield test_client
+    fastapi_app.dependency_overrides.clear()
+
+
+def _profiler(tmp_path: Path, **overrides) -> RequestProfiler:
+    settings = Settings(profiling_admin_token='secret', profiling_interval_ms=1, profiling_max_reports=1, **overrides)
+    return RequestProfiler(settings, ProfileStore(tmp_path, settings.profiling_max_reports))
+
+
+def test_trigger_requires_token_or_sample_rate(tmp_path: Path):
+    assert _profiler(tmp_path).trigger('secret') == 'header'
+    assert _profiler(tmp_path).trigger('wrong') is None
+    assert _profiler(tmp_path).trigger('sécret') is None
+    assert not _profiler(tmp_path).authorized(None)
+    assert _profiler(tmp_path, profiling_sample_rate=1.0).trigger(None) == 'sample'
+    assert RequestProfiler(Settings(), ProfileStore(tmp_path, 1)).trigger('') is None
+
+
+def test_capture_writes_cpu_and_memory_artifacts_and_prunes(tmp_path: Path):
+    profiler = _profiler(tmp_path)
+    ids = []
+    for _ in range(2):
+        capture = profiler.capture('POST', '/chat', 'header')
+        capture.start()
+        payload = [str(index) * 10 for index in range(20000)]
+        while capture._sampler.samples < 2:
+            sum(len(item) for item in payload)
+        record = capture.finish(200)
+        ids.append(capture.profile_id)
+
+    assert not tracemalloc.is_tracing()
+    assert record['cpu_samples'] >= 2 and record['top_allocations']
+    assert [item['profile_id'] for item in profiler.store.list()] == ids[1:]
+    folded = profiler.store.artifact_path(ids[-1], 'cpu').read_text()
+    assert 'test_capture_writes_cpu_and_memory_artifacts_and_prunes' in folded
+    snapshot = tracemalloc.Snapshot.load(str(profiler.store.artifact_path(ids[-1], 'memory')))
+    assert snapshot.statistics('filename')
+    assert profiler.store.artifact_path('../etc', 'cpu') is None
+
+
+def test_capture_counts_overlapping_requests(tmp_path: Path):
+    profiler = _profiler(tmp_path)
+    with profiler.track():
+        capture = profiler.capture('POST', '/chat', 'header')
+        capture.start()
+        while capture._sampler.samples < 2:
+            pass
+        record = capture.finish(200)
+    assert record['concurrent_requests'] == 1
+    assert profiler.in_flight == 0
+
+
+def test_profiled_chat_is_listed_and_downloadable(client, tmp_path: Path, monkeypatch):
+    profiler = main_module._profiler
+    monkeypatch.setattr(profiler.settings, 'profiling_admin_token', 'secret')
+    monkeypatch.setattr(profiler, 'store', ProfileStore(tmp_path / 'profiles', 5))
+
+    response = client.post('/chat', json={'query': 'What is JamAI?'}, headers={'X-Profile-Token': 'secret'})
+    assert response.status_code == 200
+    profile_id = response.headers['x-profile-id']
+
+    assert client.get('/profiles').status_code == 403
+    listing = client.get('/profiles', headers={'X-Profile-Token': 'secret'}).json()['profiles']
+    assert [item['profile_id'] for item in listing] == [profile_id]
+    assert listing[0]['path'] == '/chat' and listing[0]['trigger'] == 'header'
+    download = client.get(f'/profiles/{profile_id}/memory', headers={'X-Profile-Token': 'secret'})
+    assert download.status_code == 200 and download.content
+
+
+def test_requests_pass_straight_through_while_profiling_is_off(client, monkeypatch):
+    profiler = main_module._profiler
+    monkeypatch.setattr(profiler.settings, 'profiling_admin_token', '')
+    monkeypatch.setattr(profiler.settings, 'profiling_sample_rate', 0.0)
+
+    def untracked():
+        raise AssertionError('requests must not be tracked while profiling is off')
+
+    monkeypatch.setattr(profiler, 'track', untracked)
+    response = client.post('/chat', json={'query': 'What is JamAI?'}, headers={'X-Profile-Token': 'secret'})
+    assert response.status_code == 200
+    assert 'x-profile-id' not in response.headers
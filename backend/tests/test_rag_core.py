@@ -1,14 +1,71 @@
-from app import rag_core
+import asyncio
+import json
+import random
+import uuid
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+from qdrant_client import AsyncQdrantClient
+
+from app import embedding_cache, mmr, ollama_client, rag_core, sparse
+from app.rag_core import RetrievedChunk
 from app.settings import Settings
+from app.singleflight import SingleFlight
 
 
 class DummyQdrantClient:
     def __init__(self, *_, **__):
+        self.collections = {}
+        self.shard_keys = []
+        self.updates = []
+
+    async def collection_exists(self, collection_name):
+        return collection_name in self.collections
+
+    async def create_collection(self, collection_name, vectors_config, **kwargs):
+        self.collections[collection_name] = {'vectors_config': vectors_config, 'payload_schema': {}, **kwargs}
+
+    async def get_collection(self, collection_name):
+        collection = self.collections[collection_name]
+        hnsw = collection.get('hnsw_config')
+        config = SimpleNamespace(
+            params=SimpleNamespace(
+                vectors=collection['vectors_config'],
+                sparse_vectors=collection.get('sparse_vectors_config'),
+            ),
+            hnsw_config=SimpleNamespace(**{'m': 16, 'ef_construct': 100, **(hnsw.dict(exclude_none=True) if hnsw else {})}),
+            quantization_config=collection.get('quantization_config'),
+        )
+        return SimpleNamespace(payload_schema=collection['payload_schema'], config=config)
+
+    async def update_collection(self, collection_name, **changes):
+        # Like Qdrant, only vectors that already exist can be reconfigured.
+        existing = self.collections[collection_name].get('sparse_vectors_config') or {}
+        for name in changes.get('sparse_vectors_config') or {}:
+            if name not in existing:
+                raise ValueError(f'Vector {name} does not exist in the collection')
+        self.updates.append((collection_name, changes))
+
+    async def create_payload_index(self, collection_name, field_name, field_schema, **kwargs):
+        self.collections[collection_name]['payload_schema'][field_name] = field_schema
+
+    async def create_shard_key(self, collection_name, shard_key):
+        self.shard_keys.append((collection_name, shard_key))
+
+    async def search(self, collection_name, shard_key_selector=None, **kwargs):
+        if shard_key_selector is not None and (collection_name, shard_key_selector) not in self.shard_keys:
+            raise rag_core.UnexpectedResponse(404, 'Not Found', b'Shard key not found', httpx.Headers())
+        return []
+
+    async def close(self):
         pass
 
 
 def make_pipeline(monkeypatch, **settings_overrides):
-    monkeypatch.setattr(rag_core, 'QdrantClient', lambda *args, **kwargs: DummyQdrantClient())
+    monkeypatch.setattr(rag_core, 'AsyncQdrantClient', lambda *args, **kwargs: DummyQdrantClient())
+    settings_overrides.setdefault('embed_cache_enabled', False)
     settings = Settings(**settings_overrides)
     return rag_core.RAGPipeline(settings)
 
@@ -23,6 +80,27 @@ def test_split_text_respects_overlap(monkeypatch):
         assert first[-3:] == second[:3]
 
 
+def test_split_stream_matches_split_text_across_segments(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, chunk_size=12, chunk_overlap=4)
+    text = '  Intro line\r\nSecond paragraph with words.\r\n\r\nThird one here.  \n'
+    segments = [text[i:i + 5] for i in range(0, len(text), 5)]
+    assert list(pipeline.split_stream(segments)) == pipeline.split_text(text)
+
+    # Lines several times longer than the chunker's max_line (4 * chunk_size) get cut mid-line.
+    rng = random.Random(7)
+    words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'theta']
+    lines = [
+        ' '.join(rng.choice(words) + rng.choice(['', '', '.', '!', '?']) for _ in range(rng.randint(1, 30)))
+        for _ in range(12)
+    ]
+    text = '\n'.join(lines) + '\n\n' + 'x' * 70
+    pipeline = make_pipeline(monkeypatch, chunk_size=40, chunk_overlap=12)
+    expected = [vars(chunk) for chunk in pipeline.chunk_stream([text])]
+    for offset in range(1, len(text)):
+        chunks = [vars(chunk) for chunk in pipeline.chunk_stream([text[:offset], text[offset:]])]
+        assert chunks == expected, offset
+
+
 def test_build_filter_handles_tenant_and_tags(monkeypatch):
     pipeline = make_pipeline(monkeypatch)
     filter_obj = pipeline._build_filter('tenant-1', ['sales', 'playbooks'])
@@ -35,3 +113,507 @@ def test_build_filter_handles_tenant_and_tags(monkeypatch):
 def test_build_filter_none_when_no_inputs(monkeypatch):
     pipeline = make_pipeline(monkeypatch)
     assert pipeline._build_filter(None, None) is None
+
+
+def mock_ollama(monkeypatch, handler):
+    transport = httpx.MockTransport(handler)
+    original_client = httpx.AsyncClient
+
+    def factory(*args, **kwargs):
+        kwargs['transport'] = transport
+        return original_client(*args, **kwargs)
+
+    monkeypatch.setattr(ollama_client.httpx, 'AsyncClient', factory)
+
+
+def test_embed_texts_batches_and_preserves_order(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, embed_batch_size=2, embed_concurrency=2)
+    batches = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == '/api/embed'
+        inputs = json.loads(request.content)['input']
+        batches.append(inputs)
+        return httpx.Response(200, json={'embeddings': [[float(len(text))] for text in inputs]})
+
+    mock_ollama(monkeypatch, handler)
+    vectors = asyncio.run(pipeline.embed_texts(['a', 'bb', 'ccc', 'dddd', 'eeeee']))
+    assert vectors == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert sorted(len(batch) for batch in batches) == [1, 2, 2]
+
+
+def test_embed_texts_falls_back_to_single_prompt_endpoint(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, embed_batch_size=8)
+    paths = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        paths.append(request.url.path)
+        if request.url.path == '/api/embed':
+            return httpx.Response(404, text='not found')
+        prompt = json.loads(request.content)['prompt']
+        return httpx.Response(200, json={'embedding': [float(len(prompt))]})
+
+    mock_ollama(monkeypatch, handler)
+    vectors = asyncio.run(pipeline.embed_texts(['a', 'bb']))
+    assert vectors == [[1.0], [2.0]]
+    assert paths == ['/api/embed', '/api/embeddings', '/api/embeddings']
+    assert pipeline._batch_embed_supported is False
+
+    # The endpoint is probed again once the fallback period is over.
+    pipeline._batch_embed_unsupported_until = 0.0
+    asyncio.run(pipeline.embed_texts(['ccc']))
+    assert paths[3:] == ['/api/embed', '/api/embeddings']
+
+
+def test_embed_texts_model_not_found_does_not_disable_batching(monkeypatch):
+    pipeline = make_pipeline(monkeypatch)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == '/api/embed'
+        return httpx.Response(404, json={'error': 'model "mxbai-embed-large" not found, try pulling it first'})
+
+    mock_ollama(monkeypatch, handler)
+    with pytest.raises(ValueError, match='not found'):
+        asyncio.run(pipeline.embed_texts(['a']))
+    assert pipeline._batch_embed_supported is True
+
+
+def test_ollama_client_is_shared_across_calls(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, embed_batch_size=1, embed_concurrency=1)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={'embeddings': [[0.5]]})
+
+    mock_ollama(monkeypatch, handler)
+
+    async def scenario():
+        await pipeline.start()
+        first = pipeline.ollama.client
+        await pipeline.embed_texts(['one', 'two', 'three'])
+        assert pipeline.ollama.client is first
+        stats = pipeline.ollama.pool_stats()
+        await pipeline.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats['requests_total'] == 3
+    assert stats['in_flight_requests'] == 0
+
+
+def test_embedding_cache_skips_repeated_chunks(monkeypatch, tmp_path):
+    pipeline = make_pipeline(monkeypatch, embed_cache_enabled=True, data_dir=tmp_path)
+    embedded = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        inputs = json.loads(request.content)['input']
+        embedded.extend(inputs)
+        return httpx.Response(200, json={'embeddings': [[float(len(text))] for text in inputs]})
+
+    mock_ollama(monkeypatch, handler)
+    first = asyncio.run(pipeline.embed_texts(['footer', 'body text', 'footer']))
+    assert first == [[6.0], [9.0], [6.0]]
+    assert embedded == ['footer', 'body text']
+
+    # A fresh pipeline (another worker) shares the on-disk tier.
+    other = make_pipeline(monkeypatch, embed_cache_enabled=True, data_dir=tmp_path)
+    second = asyncio.run(other.embed_texts(['footer  ', 'body text', 'new chunk']))
+    assert second == [[6.0], [9.0], [9.0]]
+    assert embedded == ['footer', 'body text', 'new chunk']
+    assert other.embedding_cache.stats()['disk_hits'] == 2
+    assert other.embedding_cache.stats()['misses'] == 1
+
+
+def test_memory_tiers_hold_packed_vectors_within_byte_budget():
+    vector = [0.5] * 256
+    entry = embedding_cache._entry_bytes('k' * 64, embedding_cache._encode(vector))
+    cache = embedding_cache.EmbeddingCache(None, max_memory_bytes=entry * 2 + 100, max_disk_bytes=0)
+
+    async def scenario():
+        await cache.put_many('m', [(f'text {index}', vector) for index in range(3)])
+        return await cache.get_many('m', ['text 0', 'text 1', 'text 2'])
+
+    assert asyncio.run(scenario()) == [None, vector, vector]
+    stats = cache.stats()
+    assert stats['memory_entries'] == 2 and stats['memory_bytes'] <= entry * 2 + 100
+
+    queries = embedding_cache.QueryEmbeddingCache(ttl_seconds=60, max_bytes=entry + 100)
+    queries.put('m', 'first', vector)
+    queries.put('m', 'second', vector)
+    assert queries.get('m', 'first') is None and queries.get('m', 'second') == vector
+    assert queries.stats()['entries'] == 1
+
+
+def test_query_cache_reuses_embedding_until_ttl(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, query_cache_ttl_seconds=60, query_cache_memory_mb=1)
+    prompts = []
+    hits = REGISTRY.get_sample_value('rag_cache_lookups_total', {'cache': 'query', 'result': 'hit'}) or 0.0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        prompts.append(json.loads(request.content)['prompt'])
+        return httpx.Response(200, json={'embedding': [0.1, 0.2]})
+
+    mock_ollama(monkeypatch, handler)
+
+    async def scenario():
+        await pipeline.embed_query('How do I reset my password?')
+        await pipeline.embed_query('  how do I reset my   PASSWORD? ')
+
+    asyncio.run(scenario())
+    assert len(prompts) == 1
+    assert pipeline.query_cache.stats()['hits'] == 1
+    assert REGISTRY.get_sample_value('rag_cache_lookups_total', {'cache': 'query', 'result': 'hit'}) == hits + 1
+
+    monkeypatch.setattr(embedding_cache.time, 'monotonic', lambda: float('inf'))
+    asyncio.run(pipeline.embed_query('How do I reset my password?'))
+    assert len(prompts) == 2
+    assert pipeline.query_cache.stats()['expired'] == 1
+
+
+def test_concurrent_identical_queries_share_one_ollama_call(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, query_cache_ttl_seconds=0, coalesce_generation=True)
+    paths = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        paths.append(request.url.path)
+        if request.url.path == '/api/chat':
+            return httpx.Response(200, json={'message': {'content': 'Shared answer'}, 'done': True})
+        return httpx.Response(200, json={'embedding': [0.1, 0.2]})
+
+    mock_ollama(monkeypatch, handler)
+    retrieved = [RetrievedChunk(text='Reset it from settings.', score=0.9, metadata={'source': 'faq.md'})]
+
+    async def scenario():
+        queries = ['How do I reset my password?', ' how do I reset my PASSWORD? '] * 3
+        vectors = await asyncio.gather(*(pipeline.embed_query(query) for query in queries))
+        answers = await asyncio.gather(
+            *(pipeline.generate_answer('How do I reset my password?', retrieved) for _ in range(4))
+        )
+        return vectors, answers
+
+    vectors, answers = asyncio.run(scenario())
+    assert paths == ['/api/embeddings', '/api/chat']
+    assert all(vector == [0.1, 0.2] for vector in vectors)
+    assert {answer for answer, _ in answers} == {'Shared answer'}
+    stats = pipeline.coalescer.stats()
+    assert stats['followers'] == {'embed_query': 5, 'generate': 3} and stats['in_flight'] == 0
+
+
+def test_single_flight_call_survives_until_last_caller_cancels():
+    flight = SingleFlight()
+    started = []
+
+    async def slow():
+        started.append(1)
+        await asyncio.sleep(10)
+
+    async def scenario():
+        first = asyncio.create_task(flight.run('op', 'key', slow))
+        second = asyncio.create_task(flight.run('op', 'key', slow))
+        await asyncio.sleep(0)
+        call = flight._calls[('op', 'key')]
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        assert not call.cancelled()
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+        await asyncio.sleep(0)
+        return call
+
+    call = asyncio.run(scenario())
+    assert call.cancelled() and started == [1]
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_stream_chat_yields_ndjson_chunks(monkeypatch):
+    pipeline = make_pipeline(monkeypatch)
+    lines = [
+        {'message': {'content': 'Hel'}, 'done': False},
+        {'message': {'content': 'lo'}, 'done': False},
+        {'message': {'content': ''}, 'done': True, 'eval_count': 2},
+    ]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)['stream'] is True
+        body = '\n'.join(json.dumps(line) for line in lines) + '\n'
+        return httpx.Response(200, content=body.encode('utf-8'))
+
+    mock_ollama(monkeypatch, handler)
+
+    async def collect():
+        return [chunk async for chunk in pipeline.stream_chat([{'role': 'user', 'content': 'hi'}])]
+
+    chunks = asyncio.run(collect())
+    assert ''.join(chunk['message']['content'] for chunk in chunks) == 'Hello'
+    assert chunks[-1]['done'] is True
+
+
+def test_ensure_collection_creates_missing_collection(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, collection_name='docs')
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={'embedding': [0.1, 0.2, 0.3]})
+
+    mock_ollama(monkeypatch, handler)
+    asyncio.run(pipeline.ensure_collection())
+    assert pipeline.client.collections['docs']['vectors_config'].size == 3
+    assert 'docs' in pipeline._ready_collections
+
+
+def test_ensure_collection_creates_tenant_payload_indexes(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, collection_name='docs')
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={'embedding': [0.1, 0.2, 0.3]})
+
+    mock_ollama(monkeypatch, handler)
+    assert asyncio.run(pipeline.ensure_collection('acme')) == 'docs'
+    schema = pipeline.client.collections['docs']['payload_schema']
+    assert set(schema) == {'tenant_id', 'tags', 'source'}
+    assert schema['tenant_id'].is_tenant is True
+
+
+def test_tenant_layouts_route_to_collection_or_shard(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={'embedding': [0.1, 0.2, 0.3]})
+
+    pipeline = make_pipeline(monkeypatch, collection_name='docs', qdrant_tenant_layout='collection')
+    mock_ollama(monkeypatch, handler)
+    assert asyncio.run(pipeline.ensure_collection('Acme Corp')) == 'docs__acme_corp'
+    assert pipeline._shard_key_for('acme') is None
+
+    pipeline = make_pipeline(monkeypatch, collection_name='docs', qdrant_tenant_layout='shard')
+
+    async def run():
+        await pipeline.ensure_collection('acme')
+        await pipeline.ensure_collection('acme')
+        await pipeline.ensure_collection()
+
+    asyncio.run(run())
+    assert pipeline.client.collections['docs']['sharding_method'] == rag_core.ShardingMethod.CUSTOM
+    assert pipeline.client.shard_keys == [('docs', 'acme'), ('docs', 'default')]
+    assert pipeline._shard_key_for(None) is None
+    assert pipeline._shard_key_for(None, writing=True) == 'default'
+
+
+def test_read_paths_do_not_create_collections_or_shard_keys(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={'embedding': [0.1, 0.2, 0.3]})
+
+    pipeline = make_pipeline(monkeypatch, collection_name='docs', qdrant_tenant_layout='collection')
+    pipeline.client = AsyncQdrantClient(location=':memory:')
+    mock_ollama(monkeypatch, handler)
+
+    async def read_collection_layout():
+        return (
+            await pipeline.retrieve('anything', top_k=3, tenant_id='ghost'),
+            await pipeline.count_segments('ghost'),
+            await pipeline.existing_chunks('guide', 'ghost'),
+            (await pipeline.client.get_collections()).collections,
+        )
+
+    assert asyncio.run(read_collection_layout()) == ([], 0, {}, [])
+
+    pipeline = make_pipeline(monkeypatch, collection_name='docs', qdrant_tenant_layout='shard')
+    mock_ollama(monkeypatch, handler)
+
+    async def read_shard_layout():
+        await pipeline.ensure_collection()
+        return await pipeline.retrieve('anything', top_k=3, tenant_id='ghost')
+
+    assert asyncio.run(read_shard_layout()) == []
+    assert pipeline.client.shard_keys == [('docs', 'default')]
+    assert 'docs' in pipeline._ready_collections
+
+
+def test_collection_created_with_quantization_and_on_disk_vectors(monkeypatch):
+    pipeline = make_pipeline(
+        monkeypatch,
+        collection_name='docs',
+        qdrant_quantization='scalar',
+        qdrant_on_disk_vectors=True,
+        qdrant_hnsw_m=32,
+    )
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={'embedding': [0.1, 0.2, 0.3]})
+
+    mock_ollama(monkeypatch, handler)
+    asyncio.run(pipeline.ensure_collection())
+    collection = pipeline.client.collections['docs']
+    assert collection['vectors_config'].on_disk is True
+    assert collection['quantization_config'].scalar.type == rag_core.ScalarType.INT8
+    assert collection['hnsw_config'].m == 32
+    assert pipeline.client.updates == []
+    params = pipeline._search_params()
+    assert params.quantization.rescore is True
+    assert params.quantization.oversampling == 2.0
+
+
+def test_existing_collection_is_migrated_to_new_storage_settings(monkeypatch):
+    pipeline = make_pipeline(
+        monkeypatch,
+        collection_name='docs',
+        qdrant_quantization='binary',
+        qdrant_on_disk_vectors=True,
+        retrieval_mode='hybrid',
+    )
+    pipeline.client.collections['docs'] = {
+        'vectors_config': rag_core.VectorParams(size=3, distance=rag_core.Distance.COSINE),
+        'payload_schema': {'tenant_id': None, 'tags': None, 'source': None},
+    }
+    asyncio.run(pipeline.ensure_collection())
+    [(name, changes)] = pipeline.client.updates
+    assert name == 'docs'
+    assert changes['vectors_config'][''].on_disk is True
+    assert changes['quantization_config'].binary.always_ram is True
+    assert 'sparse_vectors_config' not in changes
+    assert 'hnsw_config' not in changes
+    assert not pipeline._uses_sparse('docs')
+
+    pipeline = make_pipeline(monkeypatch, collection_name='docs', retrieval_mode='dense')
+    pipeline.client.collections['docs'] = {
+        'vectors_config': rag_core.VectorParams(size=3, distance=rag_core.Distance.COSINE),
+        'payload_schema': {'tenant_id': None, 'tags': None, 'source': None},
+    }
+    asyncio.run(pipeline.ensure_collection())
+    assert pipeline.client.updates == []
+    assert pipeline._search_params() is None
+
+
+def test_sparse_tokens_keep_compound_identifiers():
+    assert sparse.tokenize('Error E-1042 in pkg.mod') == ['error', 'e-1042', 'e', '1042', 'in', 'pkg.mod', 'pkg', 'mod']
+    indices, values = sparse.document_vector('error error code', avg_length=3)
+    assert len(indices) == 2
+    assert max(values) == values[indices.index(sparse._token_id('error'))]
+
+
+def test_hybrid_retrieval_finds_exact_codes(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, collection_name='docs', retrieval_mode='hybrid')
+    pipeline.client = AsyncQdrantClient(location=':memory:')
+    texts = {
+        'alpha': 'General troubleshooting guide for the printer.',
+        'beta': 'Error XJ-9000 means the fuser overheated.',
+        'gamma': 'Printer maintenance and cleaning schedule.',
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        # Every text embeds almost identically, so only the sparse side can single out the code.
+        if request.url.path == '/api/embed':
+            return httpx.Response(200, json={'embeddings': [[1.0, 0.1, 0.5] for _ in payload['input']]})
+        return httpx.Response(200, json={'embedding': [1.0, 0.1, 0.5]})
+
+    mock_ollama(monkeypatch, handler)
+
+    async def run():
+        chunks = [
+            rag_core.DocumentChunk(chunk_id=str(uuid.uuid5(uuid.NAMESPACE_URL, name)), text=text, metadata={'source': name})
+            for name, text in texts.items()
+        ]
+        await pipeline.upsert_chunks(chunks)
+        return await pipeline.retrieve('what does xj-9000 mean', top_k=1)
+
+    [result] = asyncio.run(run())
+    assert result.metadata['source'] == 'beta'
+
+
+def test_hybrid_mode_falls_back_to_dense_on_collection_without_sparse_vector(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, collection_name='docs', retrieval_mode='hybrid')
+    pipeline.client = AsyncQdrantClient(location=':memory:')
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        if request.url.path == '/api/embed':
+            return httpx.Response(200, json={'embeddings': [[1.0, 0.1, 0.5] for _ in payload['input']]})
+        return httpx.Response(200, json={'embedding': [1.0, 0.1, 0.5]})
+
+    mock_ollama(monkeypatch, handler)
+
+    async def run():
+        await pipeline.client.create_collection(
+            'docs', vectors_config=rag_core.VectorParams(size=3, distance=rag_core.Distance.COSINE)
+        )
+        chunk_id = str(uuid.uuid5(uuid.NAMESPACE_URL, 'legacy'))
+        await pipeline.upsert_chunks(
+            [rag_core.DocumentChunk(chunk_id=chunk_id, text='Error XJ-9000', metadata={'source': 'legacy'})]
+        )
+        return await pipeline.retrieve('xj-9000', top_k=1)
+
+    [result] = asyncio.run(run())
+    assert result.metadata['source'] == 'legacy'
+    assert not pipeline._uses_sparse('docs')
+
+
+def test_existing_chunks_flags_points_without_sparse_vector(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, collection_name='docs', retrieval_mode='hybrid')
+    pipeline.client = AsyncQdrantClient(location=':memory:')
+    pipeline._vector_size = 3
+    dense_id = str(uuid.uuid5(uuid.NAMESPACE_URL, 'dense'))
+    hybrid_id = str(uuid.uuid5(uuid.NAMESPACE_URL, 'hybrid'))
+    tokenless_id = str(uuid.uuid5(uuid.NAMESPACE_URL, 'tokenless'))
+
+    async def run():
+        await pipeline.ensure_collection()
+        # A point written while the app ran in dense mode carries only the dense vector.
+        await pipeline.client.upsert(
+            'docs', points=[rag_core.PointStruct(id=dense_id, vector={'': [1.0, 0.0, 0.0]}, payload={'source': 'guide'})]
+        )
+        await pipeline.client.upsert(
+            'docs',
+            points=[
+                rag_core.PointStruct(
+                    id=hybrid_id,
+                    vector=pipeline._point_vector('docs', 'setup guide', [1.0, 0.0, 0.0]),
+                    payload={'source': 'guide', 'tags': ['docs']},
+                ),
+                # No sparse tokens at all, but the point is still fully indexed.
+                rag_core.PointStruct(
+                    id=tokenless_id,
+                    vector=pipeline._point_vector('docs', '--- ... !!!', [0.0, 1.0, 0.0]),
+                    payload={'source': 'guide'},
+                ),
+            ],
+        )
+        return await pipeline.existing_chunks('guide', None)
+
+    assert asyncio.run(run()) == {dense_id: None, hybrid_id: ['docs'], tokenless_id: []}
+
+
+def test_mmr_skips_near_duplicates():
+    query = [1.0, 0.0]
+    candidates = [[1.0, 0.0], [0.99, 0.01], [0.6, 0.8]]
+    assert mmr.maximal_marginal_relevance(query, candidates, 2, lambda_mult=1.0) == [0, 1]
+    assert mmr.maximal_marginal_relevance(query, candidates, 2, lambda_mult=0.3) == [0, 2]
+    assert mmr.maximal_marginal_relevance(query, [], 2, lambda_mult=0.5) == []
+
+
+def test_retrieve_with_mmr_overfetches_and_diversifies(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, collection_name='docs', retrieval_mode='dense', mmr_fetch_multiplier=3)
+    pipeline.client = AsyncQdrantClient(location=':memory:')
+    vectors = {
+        'refund policy': [1.0, 0.0, 0.0],
+        'refund policy, continued': [0.99, 0.01, 0.0],
+        'shipping times': [0.6, 0.8, 0.0],
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        if request.url.path == '/api/embed':
+            return httpx.Response(200, json={'embeddings': [vectors[text] for text in payload['input']]})
+        return httpx.Response(200, json={'embedding': vectors.get(payload['prompt'], [1.0, 0.0, 0.0])})
+
+    mock_ollama(monkeypatch, handler)
+
+    async def run():
+        chunks = [
+            rag_core.DocumentChunk(chunk_id=str(uuid.uuid5(uuid.NAMESPACE_URL, text)), text=text, metadata={'source': text})
+            for text in vectors
+        ]
+        await pipeline.upsert_chunks(chunks)
+        plain = await pipeline.retrieve('refund policy', top_k=2)
+        diverse = await pipeline.retrieve('refund policy', top_k=2, mmr_lambda=0.3)
+        return plain, diverse
+
+    plain, diverse = asyncio.run(run())
+    assert [chunk.text for chunk in plain] == ['refund policy', 'refund policy, continued']
+    assert [chunk.text for chunk in diverse] == ['refund policy', 'shipping times']
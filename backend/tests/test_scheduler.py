@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from app import metrics
+from app.scheduler import BULK, INTERACTIVE, OllamaBusyError, OllamaScheduler, wait_for_capacity
+
+
+def test_scheduler_prefers_chat_and_rotates_tenants():
+    scheduler = OllamaScheduler(1, queue_limit=10, tenant_queue_limit=10, interactive_weight=2)
+    order = []
+
+    async def call(tenant, priority, label):
+        with metrics.request_scope(tenant):
+            async with scheduler.slot(priority):
+                order.append(label)
+                await asyncio.sleep(0)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def blocker():
+            async with scheduler.slot(BULK):
+                await release.wait()
+
+        holder = asyncio.create_task(blocker())
+        await asyncio.sleep(0)
+        calls = [('bulk', BULK, f'bulk-{index}') for index in range(4)]
+        calls += [('a', INTERACTIVE, 'a-1'), ('a', INTERACTIVE, 'a-2'), ('a', INTERACTIVE, 'a-3'), ('b', INTERACTIVE, 'b-1')]
+        tasks = [asyncio.create_task(call(*item)) for item in calls]
+        await asyncio.sleep(0)
+        assert scheduler.stats()['waiting'] == {INTERACTIVE: 4, BULK: 4}
+        release.set()
+        await asyncio.gather(holder, *tasks)
+
+    asyncio.run(scenario())
+    # Tenants alternate, and one bulk call gets through after every two interactive grants.
+    assert order == ['a-1', 'b-1', 'bulk-0', 'a-2', 'a-3', 'bulk-1', 'bulk-2', 'bulk-3']
+
+
+def test_scheduler_rejects_past_queue_limits_and_survives_cancellation():
+    scheduler = OllamaScheduler(1, queue_limit=2, tenant_queue_limit=1)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot(INTERACTIVE):
+                await release.wait()
+
+        async def wait(tenant):
+            with metrics.request_scope(tenant):
+                async with scheduler.slot(INTERACTIVE):
+                    pass
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        first = asyncio.create_task(wait('a'))
+        await asyncio.sleep(0)
+        with metrics.request_scope('a'), pytest.raises(OllamaBusyError) as per_tenant:
+            scheduler.admit(INTERACTIVE)
+        second = asyncio.create_task(wait('b'))
+        await asyncio.sleep(0)
+        with pytest.raises(OllamaBusyError) as global_limit:
+            scheduler.admit(INTERACTIVE, 'c')
+        with wait_for_capacity():
+            scheduler.admit(INTERACTIVE, 'c')
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        release.set()
+        await asyncio.gather(holder, second)
+        return per_tenant.value, global_limit.value
+
+    per_tenant, global_limit = asyncio.run(scenario())
+    assert per_tenant.retry_after >= 1 and global_limit.priority == INTERACTIVE
+    stats = scheduler.stats()
+    assert stats['active'] == 0 and stats['waiting'] == {INTERACTIVE: 0, BULK: 0}
+    assert stats['rejected'][INTERACTIVE] == 2
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main as main_module
+from app.context import estimate_tokens
+from app.main import app as fastapi_app
+from app.main import get_pipeline as get_pipeline_dependency
+from app.main import get_session_manager as get_session_manager_dependency
+from app.scheduler import OllamaScheduler
+from app.sessions import ChatSessionManager, SessionStore
+from app.settings import Settings
+
+
+class SummaryPipeline:
+    def __init__(self) -> None:
+        self.summarized = []
+        self.prompts = []
+        self.scheduler = OllamaScheduler(0, 0, 0)
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def ensure_collection(self) -> None:
+        pass
+
+    async def summarize_history(self, summary, messages):
+        self.summarized.append([item['content'] for item in messages])
+        return (summary + ' ' if summary else '') + f'{len(messages)} earlier messages'
+
+    async def retrieve(self, query, top_k, tenant_id=None, tags=None, mmr_lambda=None):
+        return []
+
+    async def generate_answer(self, query, retrieved, conversation=None):
+        self.prompts.append(conversation)
+        return ('' if query == 'silent' else f'answer to {query}'), []
+
+    def build_prompt(self, query, retrieved, conversation=None):
+        return [{'role': 'user', 'content': query}], []
+
+    async def stream_chat(self, messages):
+        yield {'message': {'content': ''}, 'done': True}
+
+
+def make_manager(tmp_path: Path, pipeline, **overrides) -> ChatSessionManager:
+    overrides.setdefault('session_history_tokens', 20)
+    settings = Settings(**overrides)
+    return ChatSessionManager(SessionStore(tmp_path / 'sessions'), settings, lambda: pipeline)
+
+
+def test_history_stays_within_budget_and_is_summarized(tmp_path: Path):
+    pipeline = SummaryPipeline()
+    manager = make_manager(tmp_path, pipeline)
+
+    async def run():
+        record = await manager.create(None)
+        for turn in range(10):
+            await manager.append_turn(record['session_id'], f'question number {turn}', f'answer number {turn}')
+        await asyncio.gather(*manager._tasks)
+        return await manager.get(record['session_id'])
+
+    record = asyncio.run(run())
+    assert sum(estimate_tokens(item['content']) for item in record['messages']) <= 20
+    assert record['messages'][-1]['content'] == 'answer number 9'
+    assert record['pending'] == []
+    assert record['compacted_messages'] == 20 - len(record['messages'])
+    assert 'earlier messages' in record['summary']
+    history = manager.history(record)
+    assert history[0]['role'] == 'system'
+    assert sum(len(batch) for batch in pipeline.summarized) == record['compacted_messages']
+
+
+def test_truncate_mode_drops_old_turns(tmp_path: Path):
+    pipeline = SummaryPipeline()
+    manager = make_manager(tmp_path, pipeline, session_compaction='truncate')
+
+    async def run():
+        record = await manager.create(None)
+        for turn in range(10):
+            await manager.append_turn(record['session_id'], f'question number {turn}', f'answer number {turn}')
+        return await manager.get(record['session_id'])
+
+    record = asyncio.run(run())
+    assert record['summary'] == ''
+    assert record['pending'] == []
+    assert pipeline.summarized == []
+    assert manager.history(record)[-1]['content'] == 'answer number 9'
+
+
+def test_concurrent_workers_do_not_lose_turns(tmp_path: Path):
+    pipeline = SummaryPipeline()
+    # Two managers over one directory stand in for two uvicorn workers.
+    workers = [make_manager(tmp_path, pipeline, session_history_tokens=10_000) for _ in range(2)]
+
+    async def run():
+        record = await workers[0].create(None)
+        await asyncio.gather(
+            *(
+                workers[turn % 2].append_turn(record['session_id'], f'question {turn}', f'answer {turn}')
+                for turn in range(20)
+            )
+        )
+        return await workers[1].get(record['session_id'])
+
+    record = asyncio.run(run())
+    assert len(record['messages']) == 40
+
+
+def test_idle_sessions_are_pruned(tmp_path: Path):
+    manager = make_manager(tmp_path, SummaryPipeline())
+
+    async def run():
+        idle = await manager.create(None)
+        active = await manager.create(None)
+        path = manager.store._path(idle['session_id'])
+        os.utime(path, (path.stat().st_atime, time.time() - 3 * 3600))
+        removed = await manager.store.prune(2)
+        return removed, await manager.get(idle['session_id']), await manager.get(active['session_id'])
+
+    removed, idle, active = asyncio.run(run())
+    assert removed == 1
+    assert idle is None
+    assert active is not None
+
+
+@pytest.fixture()
+def sessions_client(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(main_module.settings, 'ollama_warmup', False)
+    pipeline = SummaryPipeline()
+    manager = make_manager(tmp_path, pipeline, session_compaction='truncate')
+    original = main_module._pipeline
+    main_module._pipeline = pipeline
+    fastapi_app.dependency_overrides[get_pipeline_dependency] = lambda: pipeline
+    fastapi_app.dependency_overrides[get_session_manager_dependency] = lambda: manager
+    with TestClient(fastapi_app) as client:
+        yield client, pipeline
+    fastapi_app.dependency_overrides.clear()
+    main_module._pipeline = original
+
+
+def test_chat_uses_server_side_session(sessions_client):
+    http, pipeline = sessions_client
+    session_id = http.post('/sessions', json={}).json()['session_id']
+    for query in ['first', 'second']:
+        response = http.post('/chat', json={'query': query, 'session_id': session_id})
+        assert response.status_code == 200
+        assert response.json()['session_id'] == session_id
+    assert pipeline.prompts[0] == []
+    assert pipeline.prompts[1] == [
+        {'role': 'user', 'content': 'first'},
+        {'role': 'assistant', 'content': 'answer to first'},
+    ]
+    session = http.get(f'/sessions/{session_id}').json()
+    assert [item['content'] for item in session['messages']][-1] == 'answer to second'
+    assert http.post('/chat', json={'query': 'x', 'session_id': 'missing'}).status_code == 404
+    assert http.delete(f'/sessions/{session_id}').status_code == 204
+    assert http.get(f'/sessions/{session_id}').status_code == 404
+
+
+def test_empty_answers_are_saved_as_the_same_fallback(sessions_client):
+    http, _ = sessions_client
+    session_id = http.post('/sessions', json={}).json()['session_id']
+
+    def last_answer():
+        return http.get(f'/sessions/{session_id}').json()['messages'][-1]['content']
+
+    assert http.post('/chat', json={'query': 'silent', 'session_id': session_id}).status_code == 200
+    assert last_answer() == main_module._NO_ANSWER
+    assert http.post('/chat', json={'query': 'loud', 'session_id': session_id}).status_code == 200
+    with http.stream('POST', '/chat', json={'query': 'silent', 'session_id': session_id, 'stream': True}) as response:
+        assert 'event: done' in response.read().decode()
+    assert last_answer() == main_module._NO_ANSWER
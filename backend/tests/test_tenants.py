@@ -1,5 +1,6 @@
 import asyncio
 import contextlib
+import threading
 from pathlib import Path
 from typing import List, Optional
 
@@ -10,6 +11,7 @@ from app.main import app as fastapi_app
 from app.main import get_pipeline as get_pipeline_dependency
 from app.main import get_tenant_store as get_tenant_store_dependency
 from app import main as main_module
+from app.chunking import TextChunk
 from app.rag_core import RetrievedChunk
 from app.tenant_store import TenantStore
 
@@ -21,13 +23,33 @@ class StubPipeline:
         self.ensure_called = False
         self.segment_counts = {}
 
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
     async def ensure_collection(self) -> None:
         self.ensure_called = True
 
     def split_text(self, text: str) -> List[str]:
         return [text]
 
-    async def upsert_chunks(self, chunks):
+    def chunk_stream(self, segments):
+        text = ''.join(segments).strip()
+        if text:
+            yield TextChunk(text=text, start=0, end=len(text))
+
+    async def existing_chunks(self, source, tenant_id):
+        return {}
+
+    async def delete_chunks(self, chunk_ids, tenant_id=None):
+        return len(chunk_ids)
+
+    async def set_chunk_tags(self, chunk_ids, tags, tenant_id=None):
+        pass
+
+    async def upsert_chunks(self, chunks, on_embedded=None):
         self.upsert_payload = chunks
         return len(chunks)
 
@@ -37,6 +59,7 @@ class StubPipeline:
         top_k: int,
         tenant_id: Optional[str] = None,
         tags: Optional[List[str]] = None,
+        mmr_lambda: Optional[float] = None,
     ) -> List[RetrievedChunk]:
         self.retrieve_args = (query, top_k, tenant_id, tags)
         return [
@@ -64,7 +87,8 @@ def tenant_store(tmp_path: Path) -> TenantStore:
 
 
 @pytest.fixture()
-def client(tenant_store: TenantStore):
+def client(tenant_store: TenantStore, monkeypatch):
+    monkeypatch.setattr(main_module.settings, 'ollama_warmup', False)
     stub = StubPipeline()
     original_pipeline = getattr(main_module, '_pipeline', None)
     original_store = getattr(main_module, '_tenant_store', None)
@@ -162,3 +186,111 @@ def test_chat_requires_registered_tenant(client):
     response = http.post('/chat', json=payload)
     assert response.status_code == 400
     assert response.json()['detail'] == 'Tenant is not registered'
+
+
+def test_debug_search_requires_registered_tenant(client):
+    http, stub, _ = client
+    response = http.get('/debug/search', params={'query': 'What is JamAI?', 'tenant_id': 'missing'})
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'Tenant is not registered'
+    assert stub.retrieve_args is None
+
+
+def test_list_tenants_is_paginated(client):
+    http, _, _ = client
+    for tenant_id in ('charlie', 'alpha', 'bravo'):
+        http.post('/tenants', json={'tenant_id': tenant_id, 'name': tenant_id.title(), 'status': 'active', 'tags': []})
+
+    response = http.get('/tenants', params={'offset': 1, 'limit': 1})
+    assert response.status_code == 200
+    body = response.json()
+    assert [tenant['tenant_id'] for tenant in body['tenants']] == ['bravo']
+    assert (body['total'], body['offset'], body['limit']) == (3, 1, 1)
+
+
+def _record(tenant_id: str, name: str):
+    now = '2024-01-01T00:00:00Z'
+    return {'tenant_id': tenant_id, 'name': name, 'status': 'active', 'tags': [], 'created_at': now, 'updated_at': now}
+
+
+def test_sqlite_store_imports_json_and_sees_other_writers(tmp_path: Path):
+    async def scenario() -> None:
+        legacy = TenantStore(tmp_path / 'tenants.json')
+        await legacy.create(_record('acme', 'Acme'))
+
+        first = TenantStore(tmp_path / 'tenants.sqlite3', refresh_seconds=0)
+        second = TenantStore(tmp_path / 'tenants.sqlite3', refresh_seconds=0)
+        await first.initialise()
+        await second.initialise()
+        assert (await first.get('acme'))['name'] == 'Acme'
+
+        await second.create(_record('globex', 'Globex'))
+        assert [record['tenant_id'] for record in await first.list()] == ['acme']
+        assert (await first.get('globex'))['name'] == 'Globex'
+        await second.create(_record('initech', 'Initech'))
+        await first._refresh()
+        assert [record['tenant_id'] for record in await first.list()] == ['acme', 'globex', 'initech']
+
+        with pytest.raises(ValueError):
+            await first.create(_record('globex', 'Again'))
+        assert (await first.update('acme', {'status': 'paused'})).status == 'paused'
+        assert await first.delete('acme')
+        records, total = await first.page(0, 10)
+        assert [record['tenant_id'] for record in records] == ['globex', 'initech'] and total == 2
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
+
+
+def test_refresh_keeps_local_writes_made_while_it_reads(tmp_path: Path):
+    store = TenantStore(tmp_path / 'tenants.sqlite3', refresh_seconds=0)
+    load_all = store._backend.load_all
+    snapshot_taken = threading.Event()
+    release = threading.Event()
+
+    def slow_load_all():
+        records = load_all()
+        snapshot_taken.set()
+        release.wait(5)
+        return records
+
+    async def scenario() -> List[str]:
+        await store.initialise()
+        store._backend.load_all = slow_load_all
+        refresh = asyncio.create_task(store._refresh(force=True))
+        await asyncio.to_thread(snapshot_taken.wait, 5)
+        await store.create(_record('acme', 'Acme'))
+        release.set()
+        await refresh
+        tenant_ids = [record['tenant_id'] for record in await store.list()]
+        await store.close()
+        return tenant_ids
+
+    assert asyncio.run(scenario()) == ['acme']
+
+
+def test_unknown_tenant_misses_are_cached_until_the_next_reload(tmp_path: Path):
+    store = TenantStore(tmp_path / 'tenants.json', refresh_seconds=0)
+    other = TenantStore(tmp_path / 'tenants.json', refresh_seconds=0)
+    fetch = store._backend.fetch
+    fetched: List[str] = []
+
+    def counting_fetch(tenant_id):
+        fetched.append(tenant_id)
+        return fetch(tenant_id)
+
+    async def scenario():
+        await store.initialise()
+        store._backend.fetch = counting_fetch
+        for _ in range(5):
+            assert await store.get('bogus') is None
+        await other.create(_record('bogus', 'Now Real'))
+        await store._refresh()
+        found = await store.get('bogus')
+        await store.close()
+        await other.close()
+        return found
+
+    assert asyncio.run(scenario())['name'] == 'Now Real'
+    assert fetched == ['bogus']
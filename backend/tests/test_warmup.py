@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import httpx
+
+from app import ollama_client
+from app.rag_core import RAGPipeline
+from app.settings import Settings
+from app.warmup import ModelWarmer
+
+
+def make_warmer(monkeypatch, handler, **overrides) -> ModelWarmer:
+    transport = httpx.MockTransport(handler)
+    original_client = httpx.AsyncClient
+
+    def factory(*args, **kwargs):
+        kwargs['transport'] = transport
+        return original_client(*args, **kwargs)
+
+    monkeypatch.setattr(ollama_client.httpx, 'AsyncClient', factory)
+    settings = Settings(
+        embed_model='mxbai-embed-large',
+        llm_model='llama3.1:8b',
+        qdrant_url=':memory:',
+        embed_cache_enabled=False,
+        **overrides,
+    )
+    return ModelWarmer(settings, RAGPipeline(settings))
+
+
+def test_warm_loads_both_models_with_keep_alive(monkeypatch):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append((request.url.path, json.loads(request.content)))
+        if request.url.path == '/api/embed':
+            return httpx.Response(200, json={'embeddings': [[0.1, 0.2]]})
+        return httpx.Response(200, json={})
+
+    warmer = make_warmer(monkeypatch, handler, ollama_keep_alive='1h')
+    asyncio.run(warmer.warm())
+    assert [path for path, _ in requests] == ['/api/embed', '/api/chat']
+    assert requests[0][1]['model'] == 'mxbai-embed-large'
+    assert requests[1][1] == {'model': 'llama3.1:8b', 'messages': [], 'keep_alive': '1h'}
+    assert all(payload['keep_alive'] == '1h' for _, payload in requests)
+
+
+def test_warm_falls_back_to_legacy_embeddings_endpoint(monkeypatch):
+    paths = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        paths.append(request.url.path)
+        if request.url.path == '/api/embed':
+            return httpx.Response(404, text='404 page not found')
+        if request.url.path == '/api/embeddings':
+            return httpx.Response(200, json={'embedding': [0.1, 0.2]})
+        return httpx.Response(200, json={})
+
+    warmer = make_warmer(monkeypatch, handler)
+    asyncio.run(warmer.warm())
+    asyncio.run(warmer.warm())
+    assert paths == ['/api/embed', '/api/embeddings', '/api/chat', '/api/embeddings', '/api/chat']
+
+
+def test_readiness_requires_both_models_resident(monkeypatch):
+    loaded = [{'name': 'mxbai-embed-large:latest'}]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == '/api/ps'
+        return httpx.Response(200, json={'models': loaded})
+
+    warmer = make_warmer(monkeypatch, handler)
+    status = asyncio.run(warmer.readiness())
+    assert status['ready'] is False
+    assert status['models'] == {'embed': True, 'llm': False}
+
+    loaded.append({'name': 'llama3.1:8b'})
+    assert asyncio.run(warmer.readiness())['ready'] is True
+
+
+def test_readiness_reports_unreachable_ollama(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError('connection refused', request=request)
+
+    status = asyncio.run(make_warmer(monkeypatch, handler).readiness())
+    assert status['ready'] is False
+    assert 'connection refused' in status['error']
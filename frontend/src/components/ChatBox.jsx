@@ -1,5 +1,5 @@
 import React, { useCallback, useMemo, useState } from 'react'
-import { chatWithRag } from '../lib/api'
+import { createSession, deleteSession, streamChat } from '../lib/api'
 
 const DEFAULT_TOP_K = 4
 const inputClasses = 'w-full rounded-lg border border-slate-200 bg-white px-3 py-2.5 text-sm text-slate-700 placeholder-slate-400 transition focus:border-indigo-500 focus:outline-none focus:ring-2 focus:ring-indigo-200'
@@ -11,6 +11,7 @@ export default function ChatBox() {
   const [tenantId, setTenantId] = useState('')
   const [tags, setTags] = useState('')
   const [conversation, setConversation] = useState([])
+  const [session, setSession] = useState(null)
   const [answer, setAnswer] = useState('')
   const [sources, setSources] = useState([])
   const [busy, setBusy] = useState(false)
@@ -28,9 +29,8 @@ export default function ChatBox() {
       top_k: topK,
       tenant_id: tenantId.trim() || undefined,
       tags: tagList.length ? tagList : undefined,
-      conversation: conversation.map(({ role, content }) => ({ role, content })),
     }
-  }, [conversation, query, tags, tenantId, topK])
+  }, [query, tags, tenantId, topK])
 
   const submit = useCallback(
     async (event) => {
@@ -42,15 +42,26 @@ export default function ChatBox() {
       setError(null)
       setBusy(true)
       try {
-        const result = await chatWithRag(payload)
-        const nextConversation = [
-          ...conversation,
+        setAnswer('')
+        setSources([])
+        // History lives on the server; a session is tied to the tenant it was opened for.
+        let activeSession = session
+        if (!activeSession || activeSession.tenant_id !== (payload.tenant_id ?? null)) {
+          activeSession = await createSession({ tenant_id: payload.tenant_id })
+          setSession(activeSession)
+          setConversation([])
+        }
+        const streamed = await streamChat({ ...payload, session_id: activeSession.session_id }, {
+          onSources: (items) => setSources(items ?? []),
+          onToken: (partial) => setAnswer(partial),
+        })
+        const finalAnswer = streamed.trim() || 'I do not have enough information to answer that yet.'
+        setConversation((previous) => [
+          ...previous,
           { role: 'user', content: payload.query },
-          { role: 'assistant', content: result.answer },
-        ]
-        setConversation(nextConversation)
-        setAnswer(result.answer)
-        setSources(result.sources ?? [])
+          { role: 'assistant', content: finalAnswer },
+        ])
+        setAnswer(finalAnswer)
       } catch (err) {
         setError(err.message)
         setAnswer('')
@@ -59,10 +70,12 @@ export default function ChatBox() {
         setBusy(false)
       }
     },
-    [conversation, payload],
+    [payload, session],
   )
 
   const resetConversation = () => {
+    if (session) deleteSession(session.session_id).catch(() => {})
+    setSession(null)
     setConversation([])
     setAnswer('')
     setSources([])
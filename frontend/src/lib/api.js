@@ -27,6 +27,62 @@ export async function chatWithRag(payload) {
   return handleResponse(response)
 }
 
+export async function createSession(payload) {
+  const response = await fetch(`${API_BASE}/sessions`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(payload),
+  })
+  return handleResponse(response)
+}
+
+export async function deleteSession(sessionId) {
+  await fetch(`${API_BASE}/sessions/${sessionId}`, { method: 'DELETE' })
+}
+
+export async function streamChat(payload, { onSources, onToken, onDone } = {}) {
+  const response = await fetch(`${API_BASE}/chat`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream',
+    },
+    body: JSON.stringify({ ...payload, stream: true }),
+  })
+  if (!response.ok) {
+    const body = await response.text()
+    throw new Error(body || `Request failed (${response.status})`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let answer = ''
+  for (;;) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let boundary = buffer.indexOf('\n\n')
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      boundary = buffer.indexOf('\n\n')
+      const event = block.match(/^event: (.*)$/m)?.[1]
+      const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] ?? 'null')
+      if (event === 'sources') onSources?.(data)
+      if (event === 'token') {
+        answer += data.content
+        onToken?.(answer)
+      }
+      if (event === 'done') onDone?.(data)
+      if (event === 'error') throw new Error(data?.detail ?? 'Streaming failed')
+    }
+  }
+  return answer
+}
+
 export async function debugSearch(params) {
   const qs = new URLSearchParams(params)
   const response = await fetch(`${API_BASE}/debug/search?${qs.toString()}`)